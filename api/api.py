@@ -266,8 +266,11 @@ class WS(Variables):
         return data
 
     def trading_history(
-        self: Markets, histCount: int, start_time: datetime
-    ) -> Union[list, str]:
+        self: Markets,
+        histCount: int,
+        start_time: datetime,
+        end_time: Union[datetime, None] = None,
+    ) -> Union[dict, str]:
         """
         Gets trades, funding and delivery from the exchange for the period starting
         from start_time.
@@ -280,21 +283,28 @@ class WS(Variables):
             The number of rows of data to retrieve.
         start_time: datetime
             Initial time to download data.
+        end_time: datetime | None
+            End of the period. If None, the data is downloaded up to the
+            current time.
 
         Returns
         -------
-        list
-            On success, list is returned, otherwise error type.
+        dict
+            On success, {"data": list, "length": int} is returned,
+            otherwise error type.
         """
         message = "Request for trading history since " + str(start_time)
+        if end_time is not None:
+            message += " till " + str(end_time)
         WS._put_message(self, message=message)
         res = Agents[self.name].value.trading_history(
-            self, histCount=histCount, start_time=start_time
-        )
-        message = (
-            "From the trading history received: " + str(res["length"]) + " records"
+            self, histCount=histCount, start_time=start_time, end_time=end_time
         )
-        WS._put_message(self, message=message)
+        if isinstance(res, dict):
+            message = (
+                "From the trading history received: " + str(res["length"]) + " records"
+            )
+            WS._put_message(self, message=message)
 
         return res
 
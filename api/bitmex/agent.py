@@ -5,8 +5,8 @@ from typing import Union
 
 import services as service
 from api.http import Send
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.messages import ErrorMessage, Message
 
 from .path import Listing
 from .ws import Bitmex
@@ -257,7 +257,7 @@ class Agent(Bitmex):
             SYMBOL=self.Instrument[symbol].ticker,
             TIME=str(start_time)[:19],
         )
-        res = Send.request(self, path=path, verb="GET")
+        res = Send.request(self, path=path, verb="GET", priority="bulk")
         instrument = self.Instrument[symbol]
         precision = instrument.price_precision
         if isinstance(res, list):
@@ -323,10 +323,12 @@ class Agent(Bitmex):
         else:
             return res  # error
 
-    def trading_history(self, histCount: int, start_time: datetime) -> Union[dict, str]:
+    def trading_history(
+        self, histCount: int, start_time: datetime, end_time: datetime = None
+    ) -> Union[dict, str]:
         """
         Gets trades, funding and delivery from the exchange for the period starting
-        from start_time.
+        from start_time and, if given, ending at end_time.
 
         Returns
         -------
@@ -336,10 +338,13 @@ class Agent(Bitmex):
         path = Listing.TRADING_HISTORY.format(
             HISTCOUNT=histCount, TIME=str(start_time)[:19]
         )
+        if end_time is not None:
+            path += Listing.TRADING_HISTORY_END.format(TIME=str(end_time)[:19])
         res = Send.request(
             self,
             path=path,
             verb="GET",
+            priority="bulk",
         )
         if isinstance(res, list):
             spot_not_included = list()
@@ -394,7 +399,7 @@ class Agent(Bitmex):
                     )
             return {"data": spot_not_included, "length": len(res)}
         else:
-            res  # error type
+            return res  # error type
 
     def open_orders(self) -> str:
         path = Listing.OPEN_ORDERS
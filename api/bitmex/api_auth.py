@@ -5,16 +5,35 @@ from urllib.parse import urlparse
 
 
 class API_auth:
+    # Keyed HMAC objects and header templates per API key. The key schedule
+    # of HMAC is computed once, every signature copies the prepared object.
+    templates = dict()
+
+    def template(api_key: str, api_secret: str) -> tuple:
+        """
+        Returns the headers that do not change between requests and the
+        HMAC object keyed with the secret.
+        """
+        template = API_auth.templates.get((api_key, api_secret))
+        if template is None:
+            template = (
+                {"api-key": api_key},
+                hmac.new(bytes(api_secret, "utf8"), digestmod=hashlib.sha256),
+            )
+            API_auth.templates[(api_key, api_secret)] = template
+
+        return template
+
     def generate_headers(
         api_key: str, api_secret: str, method: str, url: str, path: str, data=None
     ) -> dict:
         """
         Called when https requesting - generates api key headers.
         """
-        headers = dict()
+        template, keyed = API_auth.template(api_key=api_key, api_secret=api_secret)
+        headers = template.copy()
         expires = int(round(time.time()) + 5)
         url = url.replace(" ", "%20")
-        headers["api-key"] = api_key
         headers["api-expires"] = str(expires)
         headers["api-signature"] = API_auth.generate_signature(
             secret=api_secret,
@@ -22,12 +41,13 @@ class API_auth:
             url=url,
             nonce=expires,
             data=data or "",
+            keyed=keyed,
         )
 
         return headers
 
     def generate_signature(
-        secret: str, verb: str, url: str, nonce: int, data: str
+        secret: str, verb: str, url: str, nonce: int, data: str, keyed=None
     ) -> str:
         """
         Generates an API signature. Detals: https://www.bitmex.com/app/apiKeysUsage
@@ -39,8 +59,9 @@ class API_auth:
         if isinstance(data, (bytes, bytearray)):
             data = data.decode("utf8")
         message = verb + path + str(nonce) + data
-        signature = hmac.new(
-            bytes(secret, "utf8"), bytes(message, "utf8"), digestmod=hashlib.sha256
-        ).hexdigest()
+        if keyed is None:
+            keyed = hmac.new(bytes(secret, "utf8"), digestmod=hashlib.sha256)
+        signature = keyed.copy()
+        signature.update(bytes(message, "utf8"))
 
-        return signature
+        return signature.hexdigest()
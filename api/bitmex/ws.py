@@ -6,14 +6,15 @@ from collections import OrderedDict
 from datetime import datetime, timezone
 from time import sleep
 
-import requests
 import websocket
 
 import services as service
 from api.errors import Error
 from api.init import Setup
+from api.transport import Transport
 from api.variables import Variables
-from common.data import MetaAccount, MetaInstrument, MetaResult
+from api.wscore import AsyncWebSocket, WsCore
+from common.data import Changes, MetaAccount, MetaInstrument, MetaResult, Table
 from common.variables import Variables as var
 from services import display_exception
 
@@ -31,16 +32,30 @@ class Bitmex(Variables):
     class Result(metaclass=MetaResult):
         pass
 
+    # Retention policies of the tables in self.data, see common.data.Table.
+    # The rows of "execution" and "trade" are only added, so their number
+    # and age are limited. Orders are removed when filled or cancelled. The
+    # other tables are keyed by symbol or currency and do not grow.
+    RETENTION = {
+        "execution": {"capacity": 1000, "ttl": 86400},
+        "trade": {"capacity": 1000, "ttl": 3600},
+        "order": {"terminal": lambda row: row.get("leavesQty", 1) <= 0},
+    }
+
     def __init__(self):
         self.object = Bitmex
         self.name = "Bitmex"
         self.data = dict()
         self.Api_auth = API_auth
         Setup.variables(self)
-        self.session = requests.Session()
-        self.session.headers.update({"user-agent": "Tmatic"})
-        self.session.headers.update({"content-type": "application/json"})
-        self.session.headers.update({"accept": "application/json"})
+        self.session = Transport.session(
+            self.name,
+            headers={
+                "user-agent": "Tmatic",
+                "content-type": "application/json",
+                "accept": "application/json",
+            },
+        )
         self.currency_divisor = {
             "XBt": 100000000,
             "USDt": 1000000,
@@ -83,18 +98,33 @@ class Bitmex(Variables):
         if not self.logNumFatal:
             self.__reset()
             time_out = 5
-            websocket.setdefaulttimeout(time_out)
-            self.ws = websocket.WebSocketApp(
-                self.__get_url(),
-                on_open=self.__on_open,
-                on_close=self.__on_close,
-                header=self.__get_auth(),
-                on_message=self.__on_message,
-                on_error=self.__on_error,
-            )
-            newth = threading.Thread(target=lambda: self.ws.run_forever())
-            newth.daemon = True
-            newth.start()
+            if WsCore.ENABLED:
+                self.ws = WsCore.connect(
+                    self.__get_url(),
+                    on_open=self.__on_open,
+                    on_close=self.__on_close,
+                    header=self.__get_auth(),
+                    on_message=self.__on_message,
+                    on_error=self.__on_error,
+                    name=self.name,
+                    ping_interval=5,
+                    ping_timeout=5,
+                    ping_payload="ping",
+                    connect_timeout=time_out,
+                )
+            else:
+                websocket.setdefaulttimeout(time_out)
+                self.ws = websocket.WebSocketApp(
+                    self.__get_url(),
+                    on_open=self.__on_open,
+                    on_close=self.__on_close,
+                    header=self.__get_auth(),
+                    on_message=self.__on_message,
+                    on_error=self.__on_error,
+                )
+                newth = threading.Thread(target=lambda: self.ws.run_forever())
+                newth.daemon = True
+                newth.start()
             # Waits for connection established
             while (
                 (not self.ws.sock or not self.ws.sock.connected)
@@ -271,7 +301,10 @@ class Bitmex(Variables):
                 # table_name = "orderBook" if table == "orderBook10" else table
                 table_name = table
                 if table_name not in self.data:
-                    self.data[table_name] = OrderedDict()
+                    if table_name in Bitmex.RETENTION:
+                        self.data[table_name] = Table(**Bitmex.RETENTION[table_name])
+                    else:
+                        self.data[table_name] = OrderedDict()
                 if action == "partial":  # table snapshot
                     self.keys[table] = message["keys"]
                     if table == "quote":
@@ -375,13 +408,13 @@ class Bitmex(Variables):
                             self.__update_account(settlCurrency=key, values=val)
                         elif table == "order":
                             self.data[table_name][key].update(val)
-                            if self.data[table_name][key]["leavesQty"] <= 0:
-                                # Removes cancelled or filled orders
-                                self.data[table_name].pop(key)
+                            # Removes cancelled or filled orders
+                            self.data[table_name].compact(key)
                 elif action == "delete":
                     for val in message["data"]:
                         key = self._generate_key(self.keys[table], val)
-                        self.data[table_name].pop(key)
+                        # The row may have already been removed by retention.
+                        self.data[table_name].pop(key, None)
             elif "unsubscribe" in message:
                 symb = message["unsubscribe"].split(":")[1]
                 if symb in self.unsubscribe:
@@ -406,6 +439,17 @@ class Bitmex(Variables):
         self.logger.info("Websocket closed.")
         # service.unexpected_error(self)
 
+    def table_usage(self) -> dict:
+        """
+        Returns the number of rows and the approximate memory size of each
+        websocket table, see Table.usage().
+        """
+        usage = dict()
+        for table_name, rows in list(self.data.items()):
+            usage[table_name] = Table.usage(rows)
+
+        return usage
+
     def __reset(self) -> None:
         """
         Resets internal data.
@@ -444,6 +488,7 @@ class Bitmex(Variables):
                 for bid in values["bids"]:
                     bid[1] /= instrument.myMultiplier
                 instrument.bids = values["bids"]
+        Changes.mark("orderbook", symbol)
         if symbol in self.klines:
             service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
 
@@ -476,6 +521,7 @@ class Bitmex(Variables):
                 )
             if "liquidationPrice" in values:
                 instrument.marginCallPrice = values["liquidationPrice"]
+        Changes.mark("instrument", symbol)
 
     def __update_instrument(self, symbol: tuple, values: dict):
         symbol = (self.ticker[values["symbol"]], self.name)
@@ -488,6 +534,7 @@ class Bitmex(Variables):
             instrument.state = values["state"]
         if "markPrice" in values:
             instrument.markPrice = values["markPrice"]
+        Changes.mark("instrument", symbol)
 
     def __update_account(self, settlCurrency: tuple, values: dict):
         account = self.Account[settlCurrency]
@@ -515,6 +562,7 @@ class Bitmex(Variables):
             account.availableMargin = (
                 values["availableMargin"] / self.currency_divisor[settlCurrency[0]]
             )
+        Changes.mark("account", settlCurrency)
 
     def exit(self):
         """
@@ -534,6 +582,9 @@ class Bitmex(Variables):
         pass
 
     def ping_pong(self):
+        if isinstance(self.ws, AsyncWebSocket):
+            # The pings are sent by the heartbeat of the connection.
+            return self.ws.alive()
         if self.pinging == "pong":
             self.pinging = "ping"
             try:
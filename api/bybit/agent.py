@@ -4,8 +4,8 @@ from typing import Union
 
 import services as service
 from api.bybit.erruni import Unify
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.messages import ErrorMessage, Message
 
 from .ws import Bybit
 
@@ -217,10 +217,14 @@ class Agent(Bybit):
             )
             return service.unexpected_error(self)
 
-    def trading_history(self, histCount: int, start_time: datetime) -> Union[dict, str]:
+    def trading_history(
+        self, histCount: int, start_time: datetime, end_time: datetime = None
+    ) -> Union[dict, str]:
         """
         Gets trades, funding and delivery from the exchange for the period starting
-        from start_time.
+        from start_time and, if given, ending at end_time. Bybit returns no
+        more than 7 days per request, so the period is requested in 7-day
+        steps.
 
         Returns
         -------
@@ -236,6 +240,10 @@ class Agent(Bybit):
             start_time = utc - timedelta(days=729)
             self.logger.info("Time changed to " + str(start_time))
         startTime = service.time_converter(start_time)
+        if end_time is None:
+            endTime = service.time_converter(datetime.now(tz=timezone.utc))
+        else:
+            endTime = service.time_converter(end_time)
         limit = min(100, histCount)
 
         def get_in_thread(category, startTime, limit, success, num):
@@ -252,6 +260,7 @@ class Agent(Bybit):
                     data = self.session.get_executions(
                         category=category,
                         startTime=startTime,
+                        endTime=min(startTime + 604800000, endTime),
                         limit=limit,
                         cursor=cursor,
                     )
@@ -324,7 +333,7 @@ class Agent(Bybit):
                     )
                     return service.unexpected_error(self)
 
-        while startTime < service.time_converter(datetime.now(tz=timezone.utc)):
+        while startTime < endTime:
             threads, success = [], []
             for category in self.categories:
                 success.append("FATAL")
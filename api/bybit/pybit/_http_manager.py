@@ -76,6 +76,9 @@ class _V5HTTPManager:
     referral_id: bool = field(default=None)
     record_request_time: bool = field(default=False)
     return_response_headers: bool = field(default=False)
+    # Called with (method, path) before every attempt to send a request,
+    # may block to keep within the rate limits.
+    rate_limiter: object = field(default=None)
 
     def __post_init__(self):
         subdomain = SUBDOMAIN_TESTNET if self.testnet else SUBDOMAIN_MAINNET
@@ -260,6 +263,8 @@ class _V5HTTPManager:
                 )
 
             # Attempt the request.
+            if self.rate_limiter is not None:
+                self.rate_limiter(method, path)
             try:
                 s = self.client.send(r, timeout=self.timeout)
 
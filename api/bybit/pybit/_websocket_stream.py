@@ -35,6 +35,7 @@ class _WebSocketManager:
         restart_on_error=True,
         trace_logging=False,
         private_auth_expire=1,
+        transport=None,
     ):
         self.testnet = testnet
         self.domain = domain
@@ -52,6 +53,10 @@ class _WebSocketManager:
         # Delta time for private auth expiration in seconds
         self.private_auth_expire = private_auth_expire
 
+        # Optional factory of the connection with the WebSocketApp
+        # interface, e.g. WsCore.connect, used instead of a thread.
+        self.transport = transport
+
         # Setup the callback directory following the format:
         #   {
         #       "topic_name": function
@@ -136,31 +141,51 @@ class _WebSocketManager:
 
         while (infinitely_reconnect or retries > 0) and not self.is_connected():
             logger.info(f"WebSocket {self.ws_name} attempting connection...")
-            self.ws = websocket.WebSocketApp(
-                url=url,
-                on_message=lambda ws, msg: self._on_message(msg),
-                on_close=lambda ws, *args: self._on_close(),
-                on_open=lambda ws, *args: self._on_open(),
-                on_error=lambda ws, err: self._on_error(err),
-                # on_pong=lambda ws, *args: self._on_pong(),
-            )
-
-            # Setup the thread running WebSocketApp.
-            self.wst = threading.Thread(
-                target=lambda: self.ws.run_forever(
+            if self.transport is not None:
+                # The transport sends the custom pings itself, with the
+                # ping settings of this manager.
+                self.ws = self.transport(
+                    url,
+                    on_message=lambda ws, msg: self._on_message(msg),
+                    on_close=lambda ws, *args: self._on_close(),
+                    on_open=lambda ws, *args: self._on_open(),
+                    on_error=lambda ws, err: self._on_error(err),
                     ping_interval=self.ping_interval,
                     ping_timeout=self.ping_timeout,
+                    ping_payload=self.custom_ping_message,
+                    connect_timeout=self.ping_timeout,
+                )
+                retries -= 1
+                # The handshake is limited by connect_timeout, the rest is
+                # for the on_error and on_close handlers of a failed attempt.
+                if not self.ws.wait_connected(timeout=self.ping_timeout * 2):
+                    self.ws.close()
+            else:
+                self.ws = websocket.WebSocketApp(
+                    url=url,
+                    on_message=lambda ws, msg: self._on_message(msg),
+                    on_close=lambda ws, *args: self._on_close(),
+                    on_open=lambda ws, *args: self._on_open(),
+                    on_error=lambda ws, err: self._on_error(err),
+                    # on_pong=lambda ws, *args: self._on_pong(),
+                )
+
+                # Setup the thread running WebSocketApp.
+                self.wst = threading.Thread(
+                    target=lambda: self.ws.run_forever(
+                        ping_interval=self.ping_interval,
+                        ping_timeout=self.ping_timeout,
+                    )
                 )
-            )
 
-            # Configure as daemon; start.
-            self.wst.daemon = True
-            self.wst.start()
+                # Configure as daemon; start.
+                self.wst.daemon = True
+                self.wst.start()
 
-            retries -= 1
-            while self.wst.is_alive():
-                if self.ws.sock and self.is_connected():
-                    break
+                retries -= 1
+                while self.wst.is_alive():
+                    if self.ws.sock and self.is_connected():
+                        break
 
             # If connection was not successful, raise error.
             if not infinitely_reconnect and retries <= 0:
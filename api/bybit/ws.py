@@ -1,16 +1,22 @@
+import functools
+import itertools
 import json
 import threading
 import time
 from collections import OrderedDict
 from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Callable, Union
 
 import services as service
 from api.bybit.erruni import Unify
 from api.init import Setup
+from api.ratelimit import RateLimiter
 from api.variables import Variables
-from common.data import MetaAccount, MetaInstrument, MetaResult
+from api.wscore import AsyncWebSocket, WsCore
+from common.data import Changes, MetaAccount, MetaInstrument, MetaResult, OrderBook
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.messages import ErrorMessage, Message
 
 from .error import ErrorStatus
 from .pybit._websocket_stream import _V5WebSocketManager
@@ -74,19 +80,49 @@ class Bybit(Variables):
         var.market_object[self.name] = self
         self.unsubscriptions = set()
         self.get_error = ErrorStatus
+        self.sequence = itertools.count(1)
 
     def setup_session(self):
         self.session: HTTP = HTTP(
             api_key=self.api_key,
             api_secret=self.api_secret,
             testnet=self.testnet,
+            rate_limiter=self.rate_limit,
         )
 
+    def rate_limit(self, method: str, path: str) -> None:
+        """
+        Waits for the RateLimiter budget of the pybit request. Order
+        requests are critical and raise RateLimitExceeded instead of
+        waiting, klines and executions are bulk downloads.
+        """
+        if "/v5/market/" in path:
+            endpoint = "public"
+        elif "/v5/order/" in path and method == "POST":
+            endpoint = "order"
+        else:
+            endpoint = "private"
+        if endpoint == "order":
+            priority = "critical"
+        elif "/v5/market/kline" in path or "/v5/execution/list" in path:
+            priority = "bulk"
+        else:
+            priority = "normal"
+        RateLimiter.admit(self.name, endpoint, self.user_id, priority)
+
     def start_ws(self):
         """
         Not used in Bybit.
         """
 
+    def ws_transport(self) -> Union[Callable, None]:
+        """
+        The connections of pybit run on the WsCore loop if it is enabled,
+        otherwise each of them in its own websocket-client thread.
+        """
+        if WsCore.ENABLED:
+            return functools.partial(WsCore.connect, name=self.name)
+
     def setup_streams(self):
         for symbol in self.symbol_list:
             instrument = self.Instrument[symbol]
@@ -137,6 +173,7 @@ class Bybit(Variables):
                     channel_type="private",
                     api_key=self.api_key,
                     api_secret=self.api_secret,
+                    transport=self.ws_transport(),
                 )
             except Exception as exception:
                 Unify.error_handler(
@@ -193,15 +230,12 @@ class Bybit(Variables):
                 path="Private execution_stream",
             )
 
-    def __update_orderbook(self, values: dict, category: str) -> None:
-        symbol = (self.ticker[(values["s"], category)], self.name)
+    def __update_orderbook(self, values: OrderBook, category: str) -> None:
+        symbol = (self.ticker[(values.ticker, category)], self.name)
         instrument = self.Instrument[symbol]
-        asks = list(map(lambda x: [float(x[0]), float(x[1])], values["a"]))
-        bids = list(map(lambda x: [float(x[0]), float(x[1])], values["b"]))
-        asks.sort(key=lambda x: x[0])
-        bids.sort(key=lambda x: x[0], reverse=True)
-        instrument.asks = asks[:10]
-        instrument.bids = bids[:10]
+        instrument.asks = values.asks
+        instrument.bids = values.bids
+        Changes.mark("orderbook", symbol)
         if symbol in self.klines:
             service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
 
@@ -234,6 +268,7 @@ class Bybit(Variables):
             instrument.markPrice = values["markPrice"]
 
         instrument.confirm_subscription.add("ticker")
+        Changes.mark("instrument", (symb, self.name))
 
     def __update_account(self, values: dict) -> None:
         for value in values["data"]:
@@ -261,6 +296,7 @@ class Bybit(Variables):
                     account.walletBalance = float(coin["walletBalance"])
                 if "unrealisedPnl" in coin and coin["unrealisedPnl"]:
                     account.unrealisedPnl = float(coin["unrealisedPnl"])
+                Changes.mark("account", currency)
 
     def __update_position(self, values: dict) -> None:
         for value in values["data"]:
@@ -281,6 +317,7 @@ class Bybit(Variables):
             instrument.unrealisedPnl = service.set_number(
                 instrument=instrument, number=value["unrealisedPnl"]
             )
+            Changes.mark("instrument", symbol)
 
     def __handle_order(self, values):
         """
@@ -304,14 +341,8 @@ class Bybit(Variables):
                 orderStatus = "Canceled"
             elif value["orderStatus"] == "New":
                 if value["orderLinkId"]:
-                    for orders in var.orders.values():
-                        for clOrdID in orders:
-                            if clOrdID == value["orderLinkId"]:
-                                orderStatus = "Replaced"
-                                break
-                        else:
-                            continue
-                        break
+                    if var.orders.find_clOrdID(value["orderLinkId"]) is not None:
+                        orderStatus = "Replaced"
                     else:
                         orderStatus = "New"
                 else:
@@ -430,6 +461,18 @@ class Bybit(Variables):
             self.callback(message)
 
     def ping_pong(self):
+        if WsCore.ENABLED:
+            # The custom pings are sent by the heartbeat of the connections.
+            connections = [self.ws[category] for category in self.categories]
+            connections.append(self.ws_private)
+            for connection in connections:
+                if isinstance(connection, WebSocket):
+                    if not isinstance(connection.ws, AsyncWebSocket):
+                        return False
+                    elif not connection.ws.alive():
+                        return False
+
+            return True
         for category in self.categories:
             if self.ws[category].__class__.__name__ == "WebSocket":
                 if self.ws[category].pinging != "pong":
@@ -475,7 +518,9 @@ class Bybit(Variables):
             self.ws_wait[category] = "wait"
             try:
                 self.ws[category] = WebSocket(
-                    testnet=self.testnet, channel_type=category
+                    testnet=self.testnet,
+                    channel_type=category,
+                    transport=self.ws_transport(),
                 )
                 self.ws_wait[category] = ""
             except Exception as exception:
@@ -797,6 +842,41 @@ class Bybit(Variables):
         else:
             self._process_normal_message(message)
 
+    def _process_delta_orderbook(self, message, topic):
+        """
+        Replaces the original Pybit method. The local order book is an
+        OrderBook instance, which applies snapshots and deltas using binary
+        search and maintains the best levels without sorting.
+        """
+        data = message["data"]
+        if "snapshot" in message["type"] or topic not in self.data:
+            self.data[topic] = OrderBook(ticker=data["s"])
+            self.data[topic].snapshot(asks=data["a"], bids=data["b"])
+        else:
+            self.data[topic].update(asks=data["a"], bids=data["b"])
+
+    def _process_normal_message(self, message):
+        """
+        Replaces the original Pybit method, which makes a deep copy of every
+        orderbook and ticker message. Here the received message itself is
+        passed to the callback with the local state attached instead of the
+        delta: the OrderBook instance or a read-only view of the ticker
+        dictionary. The ``sequence`` key holds a monotonically increasing
+        number of the update, common to all Bybit streams.
+        """
+        topic = message["topic"]
+        if "orderbook" in topic:
+            self._process_delta_orderbook(message, topic)
+            message["type"] = "snapshot"
+            message["data"] = self.data[topic]
+        elif "tickers" in topic:
+            self._process_delta_ticker(message, topic)
+            message["type"] = "snapshot"
+            message["data"] = MappingProxyType(self.data[topic])
+        message["sequence"] = next(var.market_object["Bybit"].sequence)
+        callback_function = self._get_callback(topic)
+        callback_function(message)
+
     def _put_message(self, message: str, warning=None) -> None:
         """
         Places an information message into the queue and the logger.
@@ -818,3 +898,5 @@ class Bybit(Variables):
 
 
 _V5WebSocketManager._handle_incoming_message = Bybit._handle_incoming_message
+_V5WebSocketManager._process_delta_orderbook = Bybit._process_delta_orderbook
+_V5WebSocketManager._process_normal_message = Bybit._process_normal_message
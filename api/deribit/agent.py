@@ -8,8 +8,9 @@ from typing import Union
 import services as service
 from api.errors import Error
 from api.http import Send
+from api.ratelimit import RateLimiter, RateLimitExceeded
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.messages import ErrorMessage, Message
 
 from .error import DeribitWsRequestError
 from .path import Listing, Matching_engine
@@ -242,6 +243,7 @@ class Agent(Deribit):
                         "burst": 10,
                         "rate": 2,
                     }
+                    Agent.configure_limits(self, limits=account.limits)
                 return ""
 
             else:
@@ -303,7 +305,11 @@ class Agent(Deribit):
         return ""
 
     def trading_history(
-        self, histCount: int, start_time: datetime = None, funding: bool = False
+        self,
+        histCount: int,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        funding: bool = False,
     ) -> Union[dict, str]:
         """
         Downloading trading and funding history from the endpoints:
@@ -336,6 +342,8 @@ class Agent(Deribit):
             The function returns data by chunks in the amount of histCount.
         start_time: datetime
             Date when a new chunk of data will be downloaded.
+        end_time: datetime
+            End of the period, the current time if omitted.
         funding: bool
             Cancels the "private/get_user_trades_by_currency_and_time"
             endpoint request if only funding and delivery are requested once
@@ -370,14 +378,21 @@ class Agent(Deribit):
         """
         trade_history = []
         startTime = service.time_converter(start_time)
+        if end_time is None:
+            finishTime = service.time_converter(datetime.now(tz=timezone.utc))
+        else:
+            finishTime = service.time_converter(end_time)
         limit = 500
         step = 8640000000  # +100 days
+        last_5_days = 432000000
 
         def get_in_thread(path, currency, start, end, limit, data_type, success, num):
             nonlocal trade_history
             cursor = limit
             continuation = None
-            id = f"{path}_{currency}"
+            # Several periods can be requested at the same time, so the
+            # response key includes the start of the period.
+            id = f"{path}_{currency}_{start}"
             while cursor >= limit:
                 params = {
                     "currency": currency,
@@ -396,7 +411,12 @@ class Agent(Deribit):
                     + str(service.time_converter(start / 1000))
                 )
                 data = Agent.ws_request(
-                    self, path=path, id=id, params=params, currency=currency
+                    self,
+                    path=path,
+                    id=id,
+                    params=params,
+                    currency=currency,
+                    priority="bulk",
                 )
                 if data:
                     res = data[data_type]
@@ -571,12 +591,16 @@ class Agent(Deribit):
             if cursor > -1:
                 success[num] = ""
 
-        while startTime < service.time_converter(datetime.now(tz=timezone.utc)):
+        while startTime < finishTime:
             endTime = startTime + step
             if endTime < 1577826000000:  # Dec 31 2019 21:00:00 GMT+0000
                 endTime = 1577826000000
+            endTime = min(endTime, max(finishTime, startTime + 1))
             get_last_trades = False
-            if endTime >= service.time_converter(datetime.now(tz=timezone.utc)):
+            if (
+                endTime
+                >= service.time_converter(datetime.now(tz=timezone.utc)) - last_5_days
+            ):
                 if not funding:
                     get_last_trades = True
             threads, success = [], []
@@ -678,7 +702,7 @@ class Agent(Deribit):
             "end_timestamp": end_timestamp,
             "resolution": str(resolution),
         }
-        res = Agent.ws_request(self, path=path, id=id, params=params)
+        res = Agent.ws_request(self, path=path, id=id, params=params, priority="bulk")
         if isinstance(res, dict):
             klines = []
             for step in range(len(res["ticks"])):
@@ -783,13 +807,34 @@ class Agent(Deribit):
 
         return Agent.ws_request(self, path=path, id=id, params=params)
 
+    def configure_limits(self, limits: dict) -> None:
+        """
+        Applies the account limits reported by Deribit to the RateLimiter
+        buckets of this account.
+        """
+        lim = limits["matching_engine"]
+        order = lim["spot"] if "spot" in lim else lim["trading"]["total"]
+        for endpoint, values in (
+            ("order", order),
+            ("private", limits["non_matching_engine"]),
+            ("history", limits["private/get_transaction_log"]),
+        ):
+            RateLimiter.configure(
+                self.name,
+                endpoint=endpoint,
+                account=self.user_id,
+                burst=values["burst"],
+                rate=values["rate"],
+            )
+
     def ws_request(
-        self, path: str, id: str, params: dict, currency="BTC"
+        self, path: str, id: str, params: dict, currency="BTC", priority: str = None
     ) -> Union[str, list, dict]:
         """
         Requests data over websocket connection. Request limits are taken
         into account according to
-        https://www.deribit.com/kb/deribit-rate-limits
+        https://www.deribit.com/kb/deribit-rate-limits by the RateLimiter
+        buckets configured in get_user().
 
         Parameters
         ----------
@@ -802,6 +847,10 @@ class Agent(Deribit):
         currency: str
             By default, limits apply globally for all currencies, but can be
             enabled for specific customers upon request.
+        priority: str
+            RateLimiter priority: "critical", "normal" or "bulk". By
+            default, matching engine requests are critical, the rest are
+            normal.
 
         Errors
         ------
@@ -816,49 +865,31 @@ class Agent(Deribit):
         -------
             Requested information. If failed - error type.
         """
-        account = self.Account[(currency, self.name)]
-        limit = account.limits
         if path in Matching_engine.PATHS:
-            lim = limit["matching_engine"]
-            limits = lim["trading"]["total"]
-            if "spot" in lim:
-                limits = lim["spot"]
-            maximum_quotes = lim["maximum_quotes"]
-            cancel_all = lim["cancel_all"]
-            scheme = self.scheme["matching_engine"]
+            endpoint = "order"
+        elif path == "private/get_transaction_log":
+            endpoint = "history"
+        elif path.startswith("public/"):
+            endpoint = "public"
         else:
-            if path == "private/get_transaction_log":
-                limits = limit[path]
-                scheme = self.scheme[path]
-            else:
-                limits = limit["non_matching_engine"]
-                scheme = self.scheme["non_matching_engine"]
-        count = 0
-        scheme["lock"].acquire(True)
-        for num in range(len(scheme["time"]) - 1, -1, -1):
-            tm = time.time()
-            if tm - scheme["time"][num] < 1:
-                count += 1
-            if tm - scheme["time"][num] > 5:  # Considering 5
-                # seconds withot a single request to return the burst scheme.
-                scheme["time"].pop(num)
-        if scheme["scheme"] == "burst" and len(scheme["time"]) >= limits["burst"]:
-            scheme["scheme"] = "rate"
-        elif not len(scheme["time"]):
-            scheme["scheme"] = "burst"
-        if scheme["scheme"] == "rate":
-            number = min(limits["rate"], count)
-            slp = 1 - (time.time() - scheme["time"][-number])
-            if slp < 0:
-                slp = 0
-            time.sleep(slp)  # Wait if the number of requests per second is exceeded.
-        scheme["lock"].release()
+            endpoint = "private"
+        if priority is None:
+            priority = "critical" if endpoint == "order" else "normal"
         while True:
-            self.response[id] = {
-                "request_time": time.time() + self.ws_request_delay,
+            response = {
+                "event": threading.Event(),
                 "result": None,
+                "sent": time.time(),
+                "latency": None,
             }
-            scheme["time"].append(time.time())
+            try:
+                RateLimiter.admit(self.name, endpoint, self.user_id, priority)
+            except RateLimitExceeded as exception:
+                return Error.handler(
+                    self, exception=exception, verb="request via ws", path=path
+                )
+            response["sent"] = time.time()
+            self.response[id] = response
             msg = {"method": path, "params": params, "jsonrpc": "2.0", "id": id}
             try:
                 self.ws.send(json.dumps(msg))
@@ -875,28 +906,31 @@ class Agent(Deribit):
                         "warning": "error",
                     }
                 )
-            while time.time() < self.response[id]["request_time"]:
-                res = self.response[id]["result"]
-                if res is not None:
-                    if isinstance(res, dict) and "error" in res:
-                        error = Error.handler(
-                            self,
-                            exception=DeribitWsRequestError(response=res),
-                            response=res,
-                            verb="request via ws",
-                            path=path,
-                        )
-                        if error == "RETRY":
-                            time.sleep(0.5)
-                            break
-                        else:
-                            del self.response[id]
-                            return error
+            # The websocket thread sets the event in complete_response(), so
+            # the result is taken as soon as it arrives.
+            if response["event"].wait(timeout=self.ws_request_delay):
+                if self.response.get(id) is response:
+                    del self.response[id]
+                Agent.record_latency(self, path=path, latency=response["latency"])
+                res = response["result"]
+                if isinstance(res, dict) and "error" in res:
+                    error = Error.handler(
+                        self,
+                        exception=DeribitWsRequestError(response=res),
+                        response=res,
+                        verb="request via ws",
+                        path=path,
+                    )
+                    if error == "RETRY":
+                        time.sleep(0.5)
+                        continue
                     else:
-                        del self.response[id]
-                        return res
-                time.sleep(0.05)
+                        return error
+                else:
+                    return res
             else:
+                if self.response.get(id) is response:
+                    del self.response[id]
                 message = (
                     "No response to websocket "
                     + path
@@ -915,10 +949,36 @@ class Agent(Deribit):
                         "warning": "error",
                     }
                 )
-                self.response[id]
 
                 return service.unexpected_error(self)
 
+    def record_latency(self, path: str, latency: float) -> None:
+        """
+        Accumulates the time between sending a websocket request and
+        receiving its response for each endpoint in self.ws_latency:
+        "last", "min", "max" and "total" in seconds and "count" of
+        requests, so the average is total / count. The requests are made
+        from several threads, so the statistics are updated under
+        self.ws_latency_lock. They are shown by the headless status, see
+        request_latency().
+        """
+        with self.ws_latency_lock:
+            stat = self.ws_latency.get(path)
+            if stat is None:
+                self.ws_latency[path] = {
+                    "last": latency,
+                    "min": latency,
+                    "max": latency,
+                    "total": latency,
+                    "count": 1,
+                }
+            else:
+                stat["last"] = latency
+                stat["min"] = min(stat["min"], latency)
+                stat["max"] = max(stat["max"], latency)
+                stat["total"] += latency
+                stat["count"] += 1
+
     def activate_funding_thread(self):
         """
         Makes the funding_thread active.
@@ -957,17 +1017,16 @@ class Agent(Deribit):
                         )
                         his_data = history["data"]
                         if isinstance(his_data, list):
+                            service.prefetch_executions(
+                                rows=his_data, account=self.user_id, market=self.name
+                            )
                             for row in his_data:
-                                data = service.select_database(  # read_database
-                                    "select EXECID from %s where EXECID='%s' and account=%s and market='%s'"
-                                    % (
-                                        var.database_table,
-                                        row["execID"],
-                                        self.user_id,
-                                        self.name,
-                                    ),
-                                )
-                                if not data:
+                                if not service.execution_exists(
+                                    execID=row["execID"],
+                                    account=self.user_id,
+                                    market=self.name,
+                                    ttime=row["transactTime"],
+                                ):
                                     self.transaction(row=row)
                         else:
                             message = "Failed request for funding and delivery information that arrived at 8:00 AM"
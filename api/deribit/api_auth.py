@@ -8,12 +8,29 @@ from requests.auth import AuthBase
 
 
 class API_auth(AuthBase):
+    # Keyed HMAC objects and the beginning of the Authorization header per
+    # API key. The key schedule of HMAC is computed once, every signature
+    # copies the prepared object.
+    templates = dict()
+
+    def template(api_key: str, api_secret: str) -> tuple:
+        template = API_auth.templates.get((api_key, api_secret))
+        if template is None:
+            template = (
+                "deri-hmac-sha256 id=" + api_key + ",ts=",
+                hmac.new(api_secret.encode(), digestmod=hashlib.sha256),
+            )
+            API_auth.templates[(api_key, api_secret)] = template
+
+        return template
+
     def generate_headers(
         api_key: str, api_secret: str, method: str, url: str, path: str, data=None
     ) -> dict:
         """
         Called when https requesting - generates api key headers.
         """
+        prefix, keyed = API_auth.template(api_key=api_key, api_secret=api_secret)
         tstamp = str(int(time.time()) * 1000)
         nonce = "".join(
             random.choice(string.ascii_lowercase + string.digits) for _ in range(8)
@@ -25,17 +42,9 @@ class API_auth(AuthBase):
             uri=path,
             nonce=nonce,
             msg=data or "",
+            keyed=keyed,
         )
-        authorization = (
-            "deri-hmac-sha256 id="
-            + api_key
-            + ",ts="
-            + tstamp
-            + ",sig="
-            + signature
-            + ",nonce="
-            + nonce
-        )
+        authorization = prefix + tstamp + ",sig=" + signature + ",nonce=" + nonce
         headers = {
             "Authorization": authorization,
             "nonce": nonce,
@@ -47,7 +56,13 @@ class API_auth(AuthBase):
         return headers
 
     def generate_signature(
-        tstamp: str, secret: str, verb: str, uri: str, nonce: str, msg: str
+        tstamp: str,
+        secret: str,
+        verb: str,
+        uri: str,
+        nonce: str,
+        msg: str,
+        keyed=None,
     ) -> str:
         """
         # Generates an API signature. Detals:
@@ -57,8 +72,9 @@ class API_auth(AuthBase):
         if uri == "_ws_signature":
             request_data = ""
         stringToSign: str = tstamp + "\n" + nonce + "\n" + request_data
-        byte_key = secret.encode()
-        message = stringToSign.encode()
-        signature = hmac.new(byte_key, message, hashlib.sha256).hexdigest()
+        if keyed is None:
+            keyed = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        signature = keyed.copy()
+        signature.update(stringToSign.encode())
 
-        return signature
+        return signature.hexdigest()
@@ -5,17 +5,18 @@ from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Callable
 
-import requests
 import websocket
 
 import services as service
 from api.deribit.error import ErrorStatus
 from api.errors import Error
 from api.init import Setup
+from api.transport import Transport
 from api.variables import Variables
-from common.data import MetaAccount, MetaInstrument, MetaResult
+from api.wscore import AsyncWebSocket, WsCore
+from common.data import Changes, MetaAccount, MetaInstrument, MetaResult
+from common.messages import Message
 from common.variables import Variables as var
-from display.messages import Message
 from services import display_exception
 
 from .api_auth import API_auth
@@ -37,7 +38,7 @@ class Deribit(Variables):
         self.name = "Deribit"
         self.api_version = "/api/v2/"
         Setup.variables(self)
-        self.session = requests.Session()
+        self.session = Transport.session(self.name)
         self.define_category = {
             "future_linear": "future_linear",
             "future_reversed": "future_reversed",
@@ -73,25 +74,10 @@ class Deribit(Variables):
         self.heartbeat_interval = 10
         self.callback_directory = dict()
         self.response = dict()
+        self.ws_latency = dict()
+        self.ws_latency_lock = threading.Lock()
         self.settleCoin_list = ["BTC", "ETH", "USDC", "USDT", "EURR"]
         self.ws_request_delay = 5
-        self.scheme = {
-            "matching_engine": {
-                "lock": threading.Lock(),
-                "scheme": "burst",
-                "time": [],
-            },
-            "non_matching_engine": {
-                "lock": threading.Lock(),
-                "scheme": "burst",
-                "time": [],
-            },
-            "private/get_transaction_log": {
-                "lock": threading.Lock(),
-                "scheme": "burst",
-                "time": [],
-            },
-        }
         self.ticker = dict()
         self.funding_thread_active = True
         self.instrument_index = OrderedDict()
@@ -108,17 +94,33 @@ class Deribit(Variables):
 
     def start_ws(self):
         time_out, slp = 5, 0.1
-        websocket.setdefaulttimeout(time_out)
-        self.ws = websocket.WebSocketApp(
-            self.ws_url + self.api_version,
-            on_message=self.__on_message,
-            on_error=self.__on_error,
-            on_close=self.__on_close,
-            on_open=self.__on_open,
-        )
-        newth = threading.Thread(target=lambda: self.ws.run_forever())
-        newth.daemon = True
-        newth.start()
+        if WsCore.ENABLED:
+            # The server sends test requests every heartbeat_interval
+            # seconds once the heartbeat is established.
+            self.ws = WsCore.connect(
+                self.ws_url + self.api_version,
+                on_message=self.__on_message,
+                on_error=self.__on_error,
+                on_close=self.__on_close,
+                on_open=self.__on_open,
+                intercept=self.__intercept,
+                name=self.name,
+                ping_interval=self.heartbeat_interval,
+                ping_timeout=self.heartbeat_interval,
+                connect_timeout=time_out,
+            )
+        else:
+            websocket.setdefaulttimeout(time_out)
+            self.ws = websocket.WebSocketApp(
+                self.ws_url + self.api_version,
+                on_message=self.__on_message,
+                on_error=self.__on_error,
+                on_close=self.__on_close,
+                on_open=self.__on_open,
+            )
+            newth = threading.Thread(target=lambda: self.ws.run_forever())
+            newth.daemon = True
+            newth.start()
 
         # Waits for connection established.
 
@@ -287,8 +289,7 @@ class Deribit(Variables):
                     if message["result"] == "ok":
                         self.logger.info("Heartbeat established.")
                 else:
-                    if id in self.response:
-                        self.response[id]["result"] = message["result"]
+                    self.complete_response(id=id, result=message["result"])
             elif "params" in message:
                 if message["method"] == "subscription":
                     self.callback_directory[message["params"]["channel"]](
@@ -300,9 +301,7 @@ class Deribit(Variables):
             elif "error" in message:
                 res = {"error": message["error"]}
                 if "id" in message:
-                    if message["id"] in self.response:
-                        self.response[message["id"]]["result"] = res
-                    else:
+                    if not self.complete_response(id=message["id"], result=res):
                         Error.handler(
                             self,
                             exception=DeribitWsRequestError(response=res),
@@ -323,6 +322,69 @@ class Deribit(Variables):
             display_exception(exception)
             service.unexpected_error(self)
 
+    def __intercept(self, ws, message: str) -> bool:
+        """
+        Called on the WsCore loop before the message is queued. Passes the
+        response to the waiting ws_request() call at once, since the handler
+        of a previous message may be waiting for it, e.g. add_symbol()
+        called from a transaction.
+        """
+        if not self.response or '"id"' not in message:
+            return False
+        message = json.loads(message)
+        id = message.get("id")
+        if id not in self.response:
+            return False
+        if "result" in message:
+            return self.complete_response(id=id, result=message["result"])
+        elif "error" in message:
+            return self.complete_response(id=id, result={"error": message["error"]})
+
+        return False
+
+    def complete_response(self, id: str, result) -> bool:
+        """
+        Passes the result to the ws_request() call waiting for the id and
+        wakes it up. Called from the websocket thread. Only the first
+        result counts, since both the order update and the response to the
+        request may arrive.
+
+        Returns
+        -------
+        bool
+            True if a request with this id is waiting for a response.
+        """
+        response = self.response.get(id)
+        if response is None:
+            return False
+        if not response["event"].is_set():
+            response["latency"] = time.time() - response["sent"]
+            response["result"] = result
+            response["event"].set()
+
+        return True
+
+    def request_latency(self) -> dict:
+        """
+        Returns the times between sending a websocket request and receiving
+        its response per endpoint, see Agent.record_latency(): the number of
+        requests and the last, average, minimum and maximum time in
+        milliseconds.
+        """
+        with self.ws_latency_lock:
+            items = [(path, dict(stat)) for path, stat in self.ws_latency.items()]
+        result = dict()
+        for path, stat in items:
+            result[path] = {
+                "count": stat["count"],
+                "last": round(stat["last"] * 1000, 3),
+                "average": round(stat["total"] / stat["count"] * 1000, 3),
+                "min": round(stat["min"] * 1000, 3),
+                "max": round(stat["max"] * 1000, 3),
+            }
+
+        return result
+
     def __on_error(self, ws, error):
         """
         We are here if websocket has fatal errors.
@@ -434,6 +496,7 @@ class Deribit(Variables):
         instrument = self.Instrument[symbol]
         instrument.asks = values["asks"]
         instrument.bids = values["bids"]
+        Changes.mark("orderbook", symbol)
         if symbol in self.klines:
             service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
 
@@ -461,6 +524,7 @@ class Deribit(Variables):
         instrument.state = values["state"]
         if values["state"] == "open":
             instrument.state = "Open"
+        Changes.mark("instrument", symbol)
 
     def __update_portfolio(self, values: dict) -> None:
         currency = (values["currency"], self.name)
@@ -473,6 +537,7 @@ class Deribit(Variables):
         account.unrealisedPnl = (
             values["futures_session_upl"] + values["options_session_upl"]
         )
+        Changes.mark("account", currency)
 
     def __handle_order(self, values: dict) -> None:
         print("_________________________handle order", values)
@@ -504,8 +569,7 @@ class Deribit(Variables):
                 if order_state == "New" and value["replaced"]:
                     order_state = "Replaced"
                     response_id = "private/edit_" + value["order_id"]
-                if response_id in self.response:
-                    self.response[response_id]["result"] = value
+                self.complete_response(id=response_id, result=value)
                 if order_state:
                     """
                     '
@@ -597,8 +661,14 @@ class Deribit(Variables):
                     instrument=instrument, number=value["total_profit_loss"]
                 )
                 # instrument.marginCallPrice is not provided
+                Changes.mark("instrument", symbol)
 
     def ping_pong(self):
+        if isinstance(self.ws, AsyncWebSocket):
+            if not self.ws.alive():
+                self.logger.error("Deribit websocket heartbeat error. Reboot")
+                return False
+            return True
         if datetime.now(tz=timezone.utc) - self.pinging > timedelta(
             seconds=self.heartbeat_interval + 2
         ):
@@ -68,7 +68,7 @@ class Error(Variables):
         elif error_name == "UnauthorizedExceptionError":
             status = "CANCEL"
             error_message = prefix
-        elif error_name == "TopicMismatchError":
+        elif error_name in ["TopicMismatchError", "RateLimitExceeded"]:
             status = "IGNORE"
             error_message = prefix + " " + str(exception)
         elif error_name in [
@@ -6,6 +6,7 @@ from typing import Union
 import requests
 
 from api.errors import Error
+from api.ratelimit import RateLimiter
 from api.variables import Variables
 from common.variables import Variables as var
 
@@ -17,14 +18,23 @@ class Send(Variables):
     connector. Each of the exchanges has its own authorization scheme, which
     can be found in the api_auth.py files and located in folders corresponding
     to the names of the exchanges.
+
+    The sessions are created by api.transport.Transport with keep-alive
+    connection pools and per-path timing. A failed request is retried after
+    RETRY_DELAY seconds, doubled on every next attempt up to
+    RETRY_DELAY_MAX.
     """
 
+    RETRY_DELAY = 0.25
+    RETRY_DELAY_MAX = 2
+
     def request(
         self,
         path: str = None,
         verb: str = None,
         postData: dict = None,
         timeout=7,
+        priority: str = None,
     ) -> Union[dict, str]:
         """
         Sends a request to the exchange.
@@ -41,6 +51,9 @@ class Send(Variables):
             Payload body of a HTTP request.
         timeout:
             Request timeout.
+        priority: str
+            RateLimiter priority: "critical", "normal" or "bulk". By
+            default, order requests are critical, the rest are normal.
 
         Returns
         -------
@@ -49,11 +62,19 @@ class Send(Variables):
             type.
         """
         url = self.http_url + path
+        if verb != "GET" and path.startswith("/order"):
+            endpoint = "order"
+        else:
+            endpoint = "private"
+        if priority is None:
+            priority = "critical" if endpoint == "order" else "normal"
         cur_retries = 1
         while True:
             response = None
             try:
-                req = requests.Request(verb, url, json=postData, params=None)
+                RateLimiter.admit(self.name, endpoint, self.user_id, priority)
+                # The body is encoded once, the same bytes are signed and
+                # sent.
                 if isinstance(postData, dict):
                     data = json.dumps(postData)
                 else:
@@ -66,7 +87,9 @@ class Send(Variables):
                     path=path,
                     data=data,
                 )
-                req.headers = headers
+                if data is not None:
+                    headers["Content-Type"] = "application/json"
+                req = requests.Request(verb, url, data=data, headers=headers)
                 prepped = self.session.prepare_request(req)
                 response = self.session.send(prepped, timeout=timeout)
                 # Make non-200s throw
@@ -99,4 +122,6 @@ class Send(Variables):
                     }
                 )
                 break
-            time.sleep(2)
+            time.sleep(
+                min(Send.RETRY_DELAY * 2 ** (cur_retries - 2), Send.RETRY_DELAY_MAX)
+            )
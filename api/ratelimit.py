@@ -0,0 +1,245 @@
+import threading
+import time
+from typing import Union
+
+
+class TokenBucket:
+    """
+    A token bucket: up to ``burst`` requests at once, then ``rate``
+    requests per second.
+
+    The last ``reserve`` tokens can only be taken by "critical" requests,
+    so that order calls are not held back by bulk downloads running at the
+    same time. Waiting "bulk" requests let "normal" and "critical" ones go
+    first.
+    """
+
+    PRIORITIES = {"critical": 0, "normal": 1, "bulk": 2}
+
+    def __init__(self, burst: float, rate: float, reserve: float = 0) -> None:
+        self.condition = threading.Condition()
+        self.burst = burst
+        self.rate = rate
+        # The reserve as requested, reduced for a small burst only.
+        self.reserve_limit = reserve
+        self.reserve = min(reserve, burst - 1)
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = [0, 0, 0]
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_time = 0.0
+        self.rejected = 0
+
+    def configure(self, burst: float, rate: float) -> None:
+        with self.condition:
+            self._refill()
+            self.burst = burst
+            self.rate = rate
+            self.reserve = min(self.reserve_limit, burst - 1)
+            self.tokens = min(self.tokens, burst)
+            self.condition.notify_all()
+
+    def try_acquire(self, priority: str = "critical") -> bool:
+        """
+        Takes a token if one is available now and no request of the same or
+        a higher priority is waiting, never waits.
+        """
+        level = TokenBucket.PRIORITIES[priority]
+        with self.condition:
+            self._refill()
+            if self._available(level) and not any(self.waiting[: level + 1]):
+                self.tokens -= 1
+                self.requests += 1
+                return True
+            self.rejected += 1
+
+            return False
+
+    def acquire(self, priority: str = "normal") -> float:
+        """
+        Waits until a token is available and takes it.
+
+        Returns
+        -------
+        float
+            The time waited in seconds.
+        """
+        level = TokenBucket.PRIORITIES[priority]
+        start = time.monotonic()
+        with self.condition:
+            self.waiting[level] += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._available(level) and not any(self.waiting[:level]):
+                        self.tokens -= 1
+                        break
+                    shortage = 1 - self.tokens
+                    if level:
+                        shortage += self.reserve
+                    self.condition.wait(max(shortage / self.rate, 0.001))
+            finally:
+                self.waiting[level] -= 1
+            self.condition.notify_all()
+            waited = time.monotonic() - start
+            self.requests += 1
+            if waited > 0.001:
+                self.throttled += 1
+                self.throttled_time += waited
+
+        return waited
+
+    def metrics(self) -> dict:
+        with self.condition:
+            self._refill()
+            return {
+                "burst": self.burst,
+                "rate": self.rate,
+                "tokens": round(self.tokens, 3),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "throttled_time": round(self.throttled_time, 3),
+                "rejected": self.rejected,
+            }
+
+    def _available(self, level: int) -> bool:
+        if level:
+            return self.tokens - self.reserve >= 1
+
+        return self.tokens >= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimitExceeded(Exception):
+    """
+    An order request is not sent because the order budget is exhausted.
+    """
+
+
+class RateLimiter:
+    """
+    Request budgets shared by all REST and websocket requests of the
+    exchanges, one TokenBucket per market, endpoint class and account.
+
+    Endpoint classes:
+
+    "order"     placing, amending and cancelling orders.
+    "private"   other account requests.
+    "public"    market data, limited per IP, so the account is ignored.
+    "history"   endpoints with their own, lower limit, e.g. the Deribit
+                transaction log.
+
+    The default limits are in LIMITS as (burst, rate per second, reserve
+    for critical requests). Deribit reports the limits of the account,
+    they are applied by configure().
+
+    Requests of the "bulk" priority, such as klines and trading history,
+    wait behind the others. Order calls have the "critical" priority and
+    never wait: admit() sends them at once if there is a token, the last
+    ones being reserved for them, and otherwise raises RateLimitExceeded,
+    which Error.handler() reports as IGNORE, so the order is not sent and
+    the caller gets the error type at once instead of a stale order later.
+    "rejected" in the metrics counts these orders.
+    """
+
+    LIMITS = {
+        "Bitmex": {
+            "order": (10, 10, 0),
+            "private": (60, 2, 10),
+            "public": (60, 2, 10),
+        },
+        "Bybit": {
+            "order": (10, 10, 0),
+            "private": (20, 10, 5),
+            "public": (600, 120, 100),
+        },
+        "Deribit": {
+            "order": (20, 5, 0),
+            "private": (20, 20, 5),
+            "public": (20, 20, 5),
+            "history": (10, 2, 0),
+        },
+    }
+    DEFAULT = (10, 5, 0)
+    buckets = dict()
+    lock = threading.Lock()
+
+    @staticmethod
+    def bucket(market: str, endpoint: str, account=None) -> TokenBucket:
+        if endpoint == "public":
+            account = None
+        key = (market, endpoint, account)
+        with RateLimiter.lock:
+            bucket = RateLimiter.buckets.get(key)
+            if bucket is None:
+                burst, rate, reserve = RateLimiter.LIMITS.get(market, {}).get(
+                    endpoint, RateLimiter.DEFAULT
+                )
+                bucket = TokenBucket(burst=burst, rate=rate, reserve=reserve)
+                RateLimiter.buckets[key] = bucket
+
+        return bucket
+
+    @staticmethod
+    def acquire(
+        market: str, endpoint: str, account=None, priority: str = "normal"
+    ) -> float:
+        """
+        Waits for the budget of the endpoint class. Critical requests do not
+        wait if a token is available. Returns the time waited in seconds.
+        """
+        return RateLimiter.bucket(market, endpoint, account).acquire(priority)
+
+    @staticmethod
+    def admit(
+        market: str, endpoint: str, account=None, priority: str = "normal"
+    ) -> None:
+        """
+        Takes a token of the "order" endpoint class or raises
+        RateLimitExceeded if there is none, waits for the budget of the
+        other endpoint classes.
+        """
+        if endpoint != "order":
+            RateLimiter.acquire(market, endpoint, account, priority)
+        elif not RateLimiter.try_acquire(market, endpoint, account, priority):
+            raise RateLimitExceeded(
+                "Order rate limit exceeded, the request is not sent."
+            )
+
+    @staticmethod
+    def try_acquire(
+        market: str, endpoint: str, account=None, priority: str = "critical"
+    ) -> bool:
+        return RateLimiter.bucket(market, endpoint, account).try_acquire(priority)
+
+    @staticmethod
+    def configure(
+        market: str, endpoint: str, account, burst: float, rate: float
+    ) -> None:
+        """
+        Applies the limits reported by the exchange.
+        """
+        RateLimiter.bucket(market, endpoint, account).configure(burst, rate)
+
+    @staticmethod
+    def metrics(market: Union[str, None] = None) -> dict:
+        """
+        Returns the statistics of the buckets, the key is
+        "market.endpoint.account", or "endpoint.account" if the market is
+        given.
+        """
+        with RateLimiter.lock:
+            buckets = list(RateLimiter.buckets.items())
+        result = dict()
+        for (name, endpoint, account), bucket in buckets:
+            if market is None:
+                result[f"{name}.{endpoint}.{account}"] = bucket.metrics()
+            elif name == market:
+                result[f"{endpoint}.{account}"] = bucket.metrics()
+
+        return result
@@ -0,0 +1,363 @@
+"""
+HTTP transport of the Bitmex and Deribit REST requests.
+
+Each market has one requests.Session with a connection pool of a fixed
+size, so that parallel requests (klines, trading history windows, orders)
+reuse kept-alive connections instead of opening new ones. The time of
+every request is recorded per path and broken down into DNS lookup, TCP
+connect, TLS handshake and the server part, which is the rest up to the
+response headers. DNS, connect and TLS are only spent when a new
+connection is opened, so their share also shows how well the pool is
+reused.
+
+LocalExchange is a stand-in server for load tests of the layer without
+the exchange:
+
+    python -m api.transport [--requests 1000] [--threads 8] [--latency 0]
+"""
+
+import argparse
+import json
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """
+    Stores the DNS and connect time of a new connection in ``timings``.
+
+    The host name is resolved here, once, and the connection is opened to
+    the resolved addresses in turn, so the measured lookup is the one that
+    is used. The TLS server name is still taken from ``host``.
+    """
+
+    timings = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            # The connection raises the resolution error in its own way.
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        error = OSError("No address found for " + host)
+        for address in dict.fromkeys(address[4][0] for address in addresses):
+            self._dns_host = address
+            try:
+                sock = super()._new_conn()
+                break
+            except Exception as exception:
+                error = exception
+            finally:
+                self._dns_host = host
+        else:
+            raise error
+        self.timings = {
+            "dns": resolved - start,
+            "connect": time.perf_counter() - resolved,
+            "tls": 0.0,
+        }
+
+        return sock
+
+
+class TimedHTTPSConnection(TimedHTTPConnection, HTTPSConnection):
+    """
+    In addition, the TLS handshake time is the rest of connect().
+    """
+
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        if self.timings is not None:
+            self.timings["tls"] = max(
+                time.perf_counter()
+                - start
+                - self.timings["dns"]
+                - self.timings["connect"],
+                0.0,
+            )
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that records the timing of each request in Transport.
+    """
+
+    def __init__(self, name: str, pool_size: int) -> None:
+        self.name = name
+        super().__init__(
+            pool_connections=2, pool_maxsize=pool_size, max_retries=0, pool_block=False
+        )
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs) -> requests.Response:
+        """
+        The time is measured up to the end of the body, which is read here
+        unless the response is streamed, otherwise Session.send() would
+        read it after the adapter has returned.
+        """
+        path = urlparse(request.url).path
+        start = time.perf_counter()
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            # The body is not read yet, so the connection is still attached.
+            connection = getattr(response.raw, "_connection", None)
+            timings = getattr(connection, "timings", None)
+            if timings is not None:
+                connection.timings = None
+            if not stream:
+                response.content
+        except Exception:
+            Transport.record(self.name, path=path, total=None, timings=None)
+            raise
+        Transport.record(
+            self.name, path=path, total=time.perf_counter() - start, timings=timings
+        )
+
+        return response
+
+
+class Transport:
+    """
+    Creates the sessions of the markets and keeps the request statistics.
+    """
+
+    POOL_SIZE = 10
+    stats = dict()
+    lock = threading.Lock()
+
+    @staticmethod
+    def session(name: str, headers: dict = None) -> requests.Session:
+        """
+        Returns a keep-alive session with a pool of POOL_SIZE connections.
+        """
+        session = requests.Session()
+        adapter = TimedAdapter(name=name, pool_size=Transport.POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"connection": "keep-alive"})
+        if headers:
+            session.headers.update(headers)
+
+        return session
+
+    @staticmethod
+    def record(
+        name: str,
+        path: str,
+        total: Union[float, None],
+        timings: Union[dict, None],
+    ) -> None:
+        """
+        Adds a request to the statistics. ``total`` is None if the request
+        failed, ``timings`` is None if a pooled connection was reused.
+        """
+        with Transport.lock:
+            stat = Transport.stats.get((name, path))
+            if stat is None:
+                stat = {
+                    "count": 0,
+                    "errors": 0,
+                    "new_connections": 0,
+                    "dns": 0.0,
+                    "connect": 0.0,
+                    "tls": 0.0,
+                    "server": 0.0,
+                    "total": 0.0,
+                    "max": 0.0,
+                }
+                Transport.stats[(name, path)] = stat
+            if total is None:
+                stat["errors"] += 1
+                return
+            stat["count"] += 1
+            stat["total"] += total
+            stat["max"] = max(stat["max"], total)
+            server = total
+            if timings is not None:
+                stat["new_connections"] += 1
+                for phase in ("dns", "connect", "tls"):
+                    stat[phase] += timings[phase]
+                    server -= timings[phase]
+            stat["server"] += max(server, 0.0)
+
+    @staticmethod
+    def metrics(name: Union[str, None] = None) -> dict:
+        """
+        Returns the average times in milliseconds per path, of the market
+        or of all markets, and the share of requests sent over reused
+        connections.
+        """
+        result = dict()
+        with Transport.lock:
+            items = list(Transport.stats.items())
+        for (market, path), stat in items:
+            if name is not None and market != name:
+                continue
+            count = stat["count"]
+            values = {"count": count, "errors": stat["errors"]}
+            if count:
+                values["reused"] = round(1 - stat["new_connections"] / count, 3)
+                for phase in ("dns", "connect", "tls", "server", "total"):
+                    values[phase] = round(stat[phase] / count * 1000, 3)
+                values["max"] = round(stat["max"] * 1000, 3)
+            result[path if name is not None else market + path] = values
+
+        return result
+
+
+class LocalExchange:
+    """
+    A local HTTP server that answers instead of the exchange, to load-test
+    Send.request and the transport.
+
+    Parameters
+    ----------
+    routes: dict
+        Path without the query -> a JSON-serializable response or a
+        function (verb, path, body) returning it. Unknown paths get 404.
+    latency: float
+        Server time added to every response, in seconds.
+    """
+
+    def __init__(self, routes: dict, latency: float = 0.0) -> None:
+        self.routes = routes
+        self.latency = latency
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and the body are written separately, with Nagle's
+            # algorithm the body would wait for the delayed ACK.
+            disable_nagle_algorithm = True
+
+            def handle_verb(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                route = exchange.routes.get(urlparse(self.path).path)
+                if exchange.latency:
+                    time.sleep(exchange.latency)
+                if route is None:
+                    self.send_error(404)
+                    return
+                if callable(route):
+                    route = route(self.command, self.path, body)
+                data = json.dumps(route).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_verb
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def start(self) -> "LocalExchange":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    """
+    Sends requests to a LocalExchange through Send.request with a
+    Bitmex-like market object and prints the statistics.
+    """
+    from api.bitmex.api_auth import API_auth
+    from api.http import Send
+    from api.ratelimit import RateLimiter
+
+    parser = argparse.ArgumentParser(description="Load test of the transport.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    class Market:
+        name = "Local"
+        api_key = "key"
+        api_secret = "secret"
+        api_auth = API_auth
+        user_id = 0
+        logNumFatal = ""
+        maxRetryRest = 3
+        logger = logging.getLogger("Local")
+
+    exchange = LocalExchange(
+        routes={"/user": {"id": 0}, "/order": lambda verb, path, body: {"ok": verb}},
+        latency=args.latency,
+    ).start()
+    # The stand-in server has no limits.
+    RateLimiter.LIMITS[Market.name] = {
+        "order": (args.requests, args.requests, 0),
+        "private": (args.requests, args.requests, 0),
+    }
+    Market.http_url = exchange.url
+    Market.session = Transport.session(Market.name)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(
+            executor.map(
+                lambda num: Send.request(
+                    Market,
+                    path="/order" if num % 2 else "/user",
+                    verb="POST" if num % 2 else "GET",
+                    postData={"num": num} if num % 2 else None,
+                ),
+                range(args.requests),
+            )
+        )
+    elapsed = time.perf_counter() - start
+    exchange.stop()
+    print(
+        "%d requests in %.3f s, %.1f requests/s"
+        % (args.requests, elapsed, args.requests / elapsed)
+    )
+    print(json.dumps(Transport.metrics(Market.name), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,584 @@
+"""
+Websocket connections of all markets on one asyncio event loop.
+
+websocket-client runs a reader thread per connection, and Bybit opens one
+connection per category plus a private one, so the number of threads grows
+with the markets and categories. Here every connection is a set of tasks of
+a single event loop running in the "wscore" thread:
+
+    reader      reads the frames, answers pings and puts the messages with
+                their receive time into a bounded queue. When the queue is
+                full the reader stops reading, so a slow handler holds back
+                the socket of its own connection instead of growing memory.
+    dispatcher  takes the messages from the queue and passes them to
+                on_message.
+    heartbeat   sends a ping every ping_interval seconds and closes the
+                connection if nothing has been received for ping_interval +
+                ping_timeout seconds, which replaces the ping_pong() polling
+                of the markets.
+
+AsyncWebSocket has the part of websocket.WebSocketApp that the markets use:
+send(), close() and sock.connected, and calls on_open, on_message,
+on_error and on_close with the same arguments. The handlers can be
+coroutine functions, they are awaited on the loop and must not block.
+Plain handlers may block: they wait for locks, make requests, and pybit
+reconnects from on_error. So they are called in the pool of WsCore.WORKERS
+threads shared by all connections, the handlers of a connection one after
+another, and only the framing and queueing stay on the loop. A handler that
+blocks holds back its own connection and one thread of the pool, the number
+of threads does not grow with the connections.
+
+A handler of a connection may wait for a response that arrives over the
+same connection, as the Deribit requests do. Such a response would be
+queued behind the blocked handler, so ``intercept`` is called on the loop
+for every message before it is queued and can take the message out of
+the queue by returning True. It must not block.
+
+The exceptions have the names of the websocket-client ones, which
+Error.handler() and pybit already recognize.
+"""
+
+import asyncio
+import base64
+import hashlib
+import inspect
+import logging
+import os
+import ssl
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+from urllib.parse import urlparse
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+logger = logging.getLogger(__name__)
+
+
+class WebSocketConnectionClosedException(ConnectionError):
+    pass
+
+
+class WebSocketTimeoutException(TimeoutError):
+    pass
+
+
+class WebSocketBadStatusException(ConnectionError):
+    def __init__(self, message: str, status_code: int = 0) -> None:
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AsyncWebSocket:
+    """
+    One websocket connection on the WsCore loop, created by WsCore.connect().
+
+    Parameters
+    ----------
+    url: str
+        ws:// or wss:// URL.
+    on_message, on_open, on_error, on_close: Callable
+        Called as (ws, message), (ws), (ws, exception) and (ws, None, None).
+    header: list | dict
+        Additional handshake headers, "Name: value" strings or a dict.
+    name: str
+        Market name, used in the statistics.
+    ping_interval: float
+        Seconds between pings, 0 disables the heartbeat.
+    ping_timeout: float
+        Seconds of silence after ping_interval before the connection is
+        considered lost.
+    ping_payload: str
+        Text message sent as the ping, e.g. the "ping" of Bitmex. The
+        control ping frame is sent if None.
+    intercept: Callable
+        Called on the loop as (ws, message) before the message is queued,
+        the message is not passed to on_message if it returns True.
+    """
+
+    BATCH = 100
+
+    def __init__(
+        self,
+        url: str,
+        on_message: Callable,
+        on_open: Union[Callable, None] = None,
+        on_error: Union[Callable, None] = None,
+        on_close: Union[Callable, None] = None,
+        header: Union[list, dict, None] = None,
+        name: str = "",
+        ping_interval: float = 10,
+        ping_timeout: float = 10,
+        ping_payload: Union[str, None] = None,
+        connect_timeout: float = 5,
+        queue_size: int = 10000,
+        intercept: Union[Callable, None] = None,
+    ) -> None:
+        self.url = url
+        self.on_message = on_message
+        self.intercept = intercept
+        self.on_open = on_open
+        self.on_error = on_error
+        self.on_close = on_close
+        if isinstance(header, dict):
+            header = ["%s: %s" % item for item in header.items()]
+        self.header = header or []
+        self.name = name
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.ping_payload = ping_payload
+        self.connect_timeout = connect_timeout
+        self.queue_size = queue_size
+        self.connected = False
+        self.settled = threading.Event()
+        self.pending = None
+        self.future = None
+        self.reader = None
+        self.writer = None
+        self.queue = None
+        self.close_code = None
+        self.last_received = 0.0
+        self.last_ping = 0.0
+        self.handshake = 0.0
+        self.received = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.handler_max = 0.0
+        self.queue_max = 0
+        self.stalls = 0
+        self.intercepted = 0
+
+    @property
+    def sock(self) -> Union["AsyncWebSocket", None]:
+        """
+        Returns self while connected and None otherwise, so that the
+        ``ws.sock and ws.sock.connected`` checks of websocket-client work.
+        """
+        return self if self.connected else None
+
+    @property
+    def finished(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def send(self, data: Union[str, bytes], opcode: int = OP_TEXT) -> None:
+        """
+        Queues the message for sending, never blocks. Can be called from any
+        thread, including the handlers on the loop.
+        """
+        if not self.connected:
+            raise WebSocketConnectionClosedException("Connection is already closed.")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        WsCore.loop.call_soon_threadsafe(self._write, opcode, data)
+
+    def close(self, **kwargs) -> None:
+        if self.future is not None:
+            self.future.cancel()
+
+    def wait_connected(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Waits until the handshake is done, or until the connection has
+        failed and its on_error and on_close handlers have returned.
+        """
+        self.settled.wait(timeout)
+
+        return self.connected
+
+    def alive(self) -> bool:
+        """
+        True if connected and something has been received within
+        ping_interval + ping_timeout seconds.
+        """
+        if not self.connected:
+            return False
+        if not self.ping_interval or self.queue.full():
+            return True
+
+        return self._silence() <= self.ping_interval + self.ping_timeout
+
+    def metrics(self) -> dict:
+        received = self.received
+
+        return {
+            "connected": self.connected,
+            "received": received,
+            "silence": round(self._silence(), 3) if self.last_received else None,
+            "lag_avg": round(self.lag_total / received * 1000, 3) if received else 0,
+            "lag_max": round(self.lag_max * 1000, 3),
+            "handler_max": round(self.handler_max * 1000, 3),
+            "queue": self.queue.qsize() if self.queue is not None else 0,
+            "queue_max": self.queue_max,
+            "stalls": self.stalls,
+            "intercepted": self.intercepted,
+            "handshake": round(self.handshake * 1000, 3),
+        }
+
+    async def run(self) -> None:
+        """
+        Connects and runs the reader, dispatcher and heartbeat until the
+        connection is lost or closed, then calls on_error if there was an
+        error and on_close.
+        """
+        error = None
+        tasks = list()
+        try:
+            await asyncio.wait_for(self._handshake(), self.connect_timeout)
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self.last_received = self.last_ping = time.time()
+            self.connected = True
+            self.settled.set()
+            await self._event(self.on_open)
+            tasks = [
+                asyncio.ensure_future(self._read()),
+                asyncio.ensure_future(self._dispatch()),
+            ]
+            if self.ping_interval:
+                tasks.append(asyncio.ensure_future(self._heartbeat()))
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        except asyncio.CancelledError:
+            pass  # closed by close()
+        except asyncio.TimeoutError:
+            error = WebSocketTimeoutException("Connection to %s timed out." % self.url)
+        except asyncio.IncompleteReadError:
+            error = WebSocketConnectionClosedException(
+                "Connection to remote host was lost."
+            )
+        except Exception as exception:
+            error = exception
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.connected = False
+            await self._disconnect()
+        if error is not None:
+            await self._event(self.on_error, error)
+        await self._event(self.on_close, None, None)
+        self.settled.set()
+
+    async def _handshake(self) -> None:
+        url = urlparse(self.url)
+        secure = url.scheme == "wss"
+        port = url.port or (443 if secure else 80)
+        start = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(
+            url.hostname,
+            port,
+            ssl=ssl.create_default_context() if secure else None,
+            server_hostname=url.hostname if secure else None,
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        host = url.hostname if url.port is None else "%s:%d" % (url.hostname, port)
+        lines = [
+            "GET %s HTTP/1.1" % path,
+            "Host: " + host,
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Sec-WebSocket-Key: " + key,
+            "Sec-WebSocket-Version: 13",
+        ] + self.header
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        await self.writer.drain()
+        response = await self.reader.readuntil(b"\r\n\r\n")
+        status, *headers = response.decode("latin-1").split("\r\n")
+        status = status.split(" ", 2)
+        if len(status) < 2 or status[1] != "101":
+            code = int(status[1]) if len(status) > 1 and status[1].isdigit() else 0
+            raise WebSocketBadStatusException(
+                "Handshake status %s" % " ".join(status[1:]), status_code=code
+            )
+        fields = dict()
+        for line in headers:
+            field, _, value = line.partition(":")
+            fields[field.strip().lower()] = value.strip()
+        accept = hashlib.sha1((key + GUID).encode()).digest()
+        if fields.get("sec-websocket-accept") != base64.b64encode(accept).decode():
+            raise WebSocketBadStatusException("Invalid Sec-WebSocket-Accept.")
+        self.handshake = time.perf_counter() - start
+
+    async def _read(self) -> None:
+        reader = self.reader
+        opcode, fragments = OP_TEXT, list()
+        while True:
+            head = await reader.readexactly(2)
+            code = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await reader.readexactly(8))[0]
+            mask = await reader.readexactly(4) if head[1] & 0x80 else None
+            payload = await reader.readexactly(length) if length else b""
+            if mask:
+                payload = _mask(payload, mask)
+            self.last_received = time.time()
+            if code == OP_PING:
+                self._write(OP_PONG, payload)
+                continue
+            elif code == OP_PONG:
+                continue
+            elif code == OP_CLOSE:
+                if len(payload) >= 2:
+                    self.close_code = struct.unpack("!H", payload[:2])[0]
+                return
+            if code != OP_CONT:
+                opcode, fragments = code, list()
+            fragments.append(payload)
+            if not head[0] & 0x80:
+                continue
+            message = b"".join(fragments)
+            fragments = list()
+            if opcode == OP_TEXT:
+                message = message.decode("utf-8")
+            if self.intercept is not None:
+                try:
+                    if self.intercept(self, message):
+                        self.intercepted += 1
+                        continue
+                except Exception:
+                    logger.exception("websocket %s intercept error", self.name)
+            if self.queue.full():
+                self.stalls += 1
+            await self.queue.put((self.last_received, message))
+            self.queue_max = max(self.queue_max, self.queue.qsize())
+
+    async def _dispatch(self) -> None:
+        """
+        Takes up to BATCH messages at a time, so that plain handlers cost
+        one switch to the worker pool per batch rather than per message.
+        As in websocket-client, the errors of on_message are passed to
+        on_error and do not close the connection.
+        """
+        coroutine = inspect.iscoroutinefunction(self.on_message)
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < AsyncWebSocket.BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if coroutine:
+                for received, message in batch:
+                    start = self._started(received)
+                    try:
+                        await self.on_message(self, message)
+                    except Exception as exception:
+                        await self._event(self.on_error, exception)
+                    self._finished(start)
+            else:
+                errors = await self._run(self._handle, batch)
+                for error in errors:
+                    await self._event(self.on_error, error)
+
+    async def _run(self, function: Callable, *args):
+        """
+        Calls the function in the worker pool and returns its result. The
+        handler of a cancelled dispatcher may still be running in the pool,
+        so the next handler of the connection waits for it to return.
+        """
+        if self.pending is not None and not self.pending.done():
+            await asyncio.wait([asyncio.wrap_future(self.pending)])
+        self.pending = WsCore.worker.submit(function, *args)
+
+        return await asyncio.wrap_future(self.pending)
+
+    def _handle(self, batch: list) -> list:
+        """
+        Calls a plain on_message in the worker pool, returns the errors.
+        """
+        errors = list()
+        for received, message in batch:
+            start = self._started(received)
+            try:
+                self.on_message(self, message)
+            except Exception as exception:
+                errors.append(exception)
+            self._finished(start)
+
+        return errors
+
+    def _started(self, received: float) -> float:
+        start = time.time()
+        lag = start - received
+        self.received += 1
+        self.lag_total += lag
+        if lag > self.lag_max:
+            self.lag_max = lag
+
+        return start
+
+    def _finished(self, start: float) -> None:
+        spent = time.time() - start
+        if spent > self.handler_max:
+            self.handler_max = spent
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.ping_interval, 1))
+            now = time.time()
+            silence = self._silence()
+            # The reader waits while the queue is full, so the silence is
+            # not counted then.
+            if (
+                silence > self.ping_interval + self.ping_timeout
+                and not self.queue.full()
+            ):
+                raise WebSocketTimeoutException(
+                    "Nothing received for %.1f seconds." % silence
+                )
+            if now - self.last_ping >= self.ping_interval:
+                self.last_ping = now
+                if self.ping_payload is None:
+                    self._write(OP_PING, b"")
+                else:
+                    self._write(OP_TEXT, self.ping_payload.encode("utf-8"))
+
+    async def _event(self, handler: Union[Callable, None], *args) -> None:
+        if handler is None:
+            return
+        if inspect.iscoroutinefunction(handler):
+            try:
+                await handler(self, *args)
+            except Exception:
+                self._log_error()
+        else:
+            await self._run(self._call, handler, *args)
+
+    def _call(self, handler: Callable, *args) -> None:
+        """
+        Calls a plain on_open, on_error or on_close in the worker pool.
+        """
+        try:
+            handler(self, *args)
+        except Exception:
+            self._log_error()
+
+    def _log_error(self) -> None:
+        logger.exception("websocket %s %s handler error", self.name, self.url)
+
+    async def _disconnect(self) -> None:
+        writer = self.writer
+        if writer is None:
+            return
+        try:
+            if not writer.is_closing():
+                writer.write(_frame(OP_CLOSE, struct.pack("!H", 1000)))
+                writer.close()
+            await asyncio.wait_for(writer.wait_closed(), 1)
+        except Exception:
+            pass
+
+    def _write(self, opcode: int, payload: bytes) -> None:
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(_frame(opcode, payload))
+
+    def _silence(self) -> float:
+        return time.time() - self.last_received
+
+
+class WsCore:
+    """
+    The event loop shared by the websocket connections of all markets and
+    the pool of WORKERS threads for their plain handlers. ENABLED is set by
+    the WEBSOCKET_CORE setting, with ENABLED = False, the default, the
+    markets use websocket-client threads.
+    """
+
+    ENABLED = False
+    WORKERS = 4
+    loop = None
+    thread = None
+    worker = None
+    connections = list()
+    lock = threading.Lock()
+
+    @staticmethod
+    def start() -> asyncio.AbstractEventLoop:
+        with WsCore.lock:
+            if WsCore.loop is None:
+                loop = asyncio.new_event_loop()
+                WsCore.thread = threading.Thread(
+                    target=loop.run_forever, name="wscore", daemon=True
+                )
+                WsCore.thread.start()
+                WsCore.worker = ThreadPoolExecutor(
+                    max_workers=WsCore.WORKERS, thread_name_prefix="wscore_worker"
+                )
+                WsCore.loop = loop
+
+        return WsCore.loop
+
+    @staticmethod
+    def connect(url: str, on_message: Callable, **kwargs) -> AsyncWebSocket:
+        """
+        Starts connecting and returns the connection at once, like
+        WebSocketApp with run_forever() in a thread. The keyword arguments
+        are those of AsyncWebSocket.
+        """
+        loop = WsCore.start()
+        ws = AsyncWebSocket(url, on_message, **kwargs)
+        ws.future = asyncio.run_coroutine_threadsafe(ws.run(), loop)
+        with WsCore.lock:
+            WsCore.connections = [
+                connection
+                for connection in WsCore.connections
+                if not connection.finished
+            ]
+            WsCore.connections.append(ws)
+
+        return ws
+
+    @staticmethod
+    def metrics(name: Union[str, None] = None) -> dict:
+        """
+        Returns the statistics of the open connections of the market or of
+        all markets, the key is the URL path, prefixed by the market name if
+        the market is not given.
+        """
+        with WsCore.lock:
+            connections = list(WsCore.connections)
+        result = dict()
+        for connection in connections:
+            if connection.finished:
+                continue
+            path = urlparse(connection.url).path
+            if name is None:
+                result[connection.name + path] = connection.metrics()
+            elif connection.name == name:
+                result[path] = connection.metrics()
+
+        return result
+
+
+def _mask(data: bytes, key: bytes) -> bytes:
+    length = len(data)
+    repeated = (key * (length // 4 + 1))[:length]
+    masked = int.from_bytes(data, "little") ^ int.from_bytes(repeated, "little")
+
+    return masked.to_bytes(length, "little")
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """
+    A final client frame, masked as RFC 6455 requires.
+    """
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+    elif length < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+    key = os.urandom(4)
+
+    return head + key + _mask(payload, key)
@@ -0,0 +1,123 @@
+import heapq
+from array import array
+
+
+class PriceTree:
+    """
+    Segment tree of the maximums of a column. It finds the first line at or
+    after the given one where the column is above a price in O(log n)
+    instead of checking the lines one by one.
+
+    Parameters
+    ----------
+    values: array, memoryview or list
+        Column values, e.g. the ``hi`` column of the backtest data.
+    sign: int
+        1 searches for values above the price. -1 searches for values below
+        the price, the tree then keeps the negated values, e.g. for the
+        ``lo`` column.
+    """
+
+    def __init__(self, values, sign: int = 1) -> None:
+        self.length = len(values)
+        self.sign = sign
+        size = 1
+        while size < self.length:
+            size *= 2
+        self.size = size
+        tree = array("d", [float("-inf")]) * (2 * size)
+        if sign == 1:
+            tree[size : size + self.length] = array("d", values)
+        else:
+            tree[size : size + self.length] = array("d", (-x for x in values))
+        for num in range(size - 1, 0, -1):
+            left, right = tree[2 * num], tree[2 * num + 1]
+            tree[num] = left if left > right else right
+        self.tree = tree
+
+    def first(self, start: int, price: float) -> int:
+        """
+        Returns the first line from ``start`` where the value is strictly
+        above the price (below for sign -1), or the number of lines if
+        there is no such line.
+        """
+        if start >= self.length:
+            return self.length
+        price *= self.sign
+        tree = self.tree
+        num = start + self.size
+        while True:
+            if tree[num] > price:
+                while num < self.size:
+                    num *= 2
+                    if not tree[num] > price:
+                        num += 1
+                return num - self.size
+            # Goes up while the node is a right child, then to the right
+            # neighbour, which covers the lines following the checked ones.
+            while num & 1:
+                num >>= 1
+            if num == 0:
+                return self.length
+            num += 1
+
+
+class FillBook:
+    """
+    Resting orders of a bot sorted by the line on which each of them is
+    filled: a Sell order when ``hi`` is above its price, a Buy order when
+    ``lo`` is below its price. The lines are searched in PriceTree once
+    when the orders change, which is detected by the ``version`` of
+    var.orders, so lines without fills cost nothing regardless of the
+    number of orders.
+
+    Parameters
+    ----------
+    hi: dict
+        Symbol - hi column.
+    lo: dict
+        Symbol - lo column.
+    """
+
+    def __init__(self, hi: dict, lo: dict) -> None:
+        self.hi = {symbol: PriceTree(values) for symbol, values in hi.items()}
+        self.lo = {symbol: PriceTree(values, sign=-1) for symbol, values in lo.items()}
+        self.version = None
+        self.queue = list()
+
+    def schedule(self, orders: dict, start: int) -> None:
+        """
+        Finds the fill line of every order starting from the ``start`` line.
+        Orders filled on the same line keep the sequence of the dictionary.
+        """
+        self.queue = list()
+        for num, (clOrdID, order) in enumerate(orders.items()):
+            if order["side"] == "Sell":
+                tree = self.hi[order["symbol"]]
+            else:
+                tree = self.lo[order["symbol"]]
+            self.queue.append((tree.first(start, order["price"]), num, clOrdID))
+        heapq.heapify(self.queue)
+
+    def filled(self, orders: dict, line: int, version: int) -> list:
+        """
+        Returns clOrdIDs of the orders filled on the line.
+
+        Parameters
+        ----------
+        orders: dict
+            Open orders of the bot, var.orders[bot.name].
+        line: int
+            Current line, bot.iter.
+        version: int
+            var.orders.version, the orders are searched anew if it differs
+            from the one of the last search.
+        """
+        if version != self.version:
+            self.schedule(orders, start=line)
+            self.version = version
+        result = list()
+        while self.queue and self.queue[0][0] <= line:
+            result.append(heapq.heappop(self.queue)[2])
+
+        return result
@@ -1,13 +1,16 @@
 import os
+from array import array
 from collections import OrderedDict
 from typing import Callable, Union
 
 import services as service
 from api.api import WS
 from api.setup import Markets
-from common.data import BotData, Instrument
+from backtest.fills import FillBook
+from common.archive import KlineArchive
+from common.data import BotData, Instrument, KlineSeries
+from common.messages import ErrorMessage
 from common.variables import Variables as var
-from display.messages import ErrorMessage
 from functions import Function
 
 
@@ -15,6 +18,10 @@ class Backtest:
     filename = ""
     filename_trade = ""
     trades = 0
+    # Lists of lines for the trades.txt and results.txt files when run_arrays()
+    # is running, otherwise None and the lines are written immediately.
+    buffer_trades = None
+    buffer_results = None
 
 
 def get_instrument(ws: Markets, symbol: tuple):
@@ -25,14 +32,8 @@ def get_instrument(ws: Markets, symbol: tuple):
     once, since the received information is saved in the database in the
     `backtest` table to speed up the program.
     """
-    qwr = (
-        "select * from backtest where SYMBOL ='"
-        + symbol[0]
-        + "' and MARKET = '"
-        + ws.name
-        + "';"
-    )
-    data = service.select_database(qwr)
+    qwr = "select * from backtest where SYMBOL = ? and MARKET = ?;"
+    data = service.select_database(qwr, (symbol[0], ws.name))
     if not data:
         symbols = ws.Instrument.get_keys()
         if symbols is None or symbol not in symbols:
@@ -71,8 +72,102 @@ def load_backtest_data(bot: BotData):
                     fill(header, record, num, line)
                 b_data.append(record)
 
-    # Checking if the sizes of all backtesting data records are the same.
+    _check_data_size(bot=bot)
+
+
+def _read_columns(filename: str) -> dict:
+    """
+    Reads a backtest data file into arrays, one array for each column. The
+    ``fund`` column is named ``funding`` as in kline data, ``datetime`` is
+    calculated from the ``date`` and ``time`` columns. A value that is not
+    a number stops the program with the line and column in the message.
+    """
+    with open(filename, "r") as file:
+        headers = next(file).strip("\n").split(";")
+        lines = [
+            (num, line.strip("\n").split(";"))
+            for num, line in enumerate(file, start=2)
+            if line.strip()
+        ]
+    columns = dict()
+    for pos, header in enumerate(headers):
+        typecode, convert = ("q", int) if header in ["date", "time"] else ("d", float)
+        try:
+            column = array(typecode, map(convert, (line[pos] for _, line in lines)))
+        except (ValueError, IndexError):
+            _stop_on_value(
+                filename, lines=lines, pos=pos, header=header, convert=convert
+            )
+        if header == "fund":
+            header = "funding"
+        columns[header] = column
+    if "date" not in columns:
+        columns["date"] = array("q")
+    elif "time" in columns:
+        columns["datetime"] = array(
+            "d",
+            (
+                KlineSeries.timestamp_of(date=date, tm=tm)
+                for date, tm in zip(columns["date"], columns["time"])
+            ),
+        )
+
+    return columns
+
+
+def _stop_on_value(
+    filename: str, lines: list, pos: int, header: str, convert: Callable
+):
+    """
+    Finds the line with the value of the column that could not be converted
+    and stops the program, so that the value is not replaced silently.
+    """
+    for num, line in lines:
+        value = line[pos] if pos < len(line) else ""
+        try:
+            convert(value)
+        except ValueError:
+            message = ErrorMessage.BACKTEST_DATA_VALUE.format(
+                FILE=filename, LINE=num, COLUMN=header, VALUE=value
+            )
+            print(message)
+            exit(1)
+
+
+def load_backtest_arrays(bot: BotData):
+    """
+    Loads backtest data for run_arrays(). Each file is read into column
+    arrays once and stored as KlineSeries, so that a line is still available
+    as a dictionary, e.g. bot.backtest_data[symbol][bot.iter]["hi"], while
+    the columns are available without creating dictionaries.
+
+    If there is no csv file in backtest/data/, the kline archive recorded
+    by Tmatic in data/ is used, which is memory-mapped without parsing.
+    """
+    print(" ")
+    for symbol in var.backtest_symbols:
+        filename = (
+            os.getcwd() + f"/backtest/data/{symbol[1]}/{symbol[0]}/{bot.timefr}.csv"
+        )
+        if os.path.exists(filename):
+            print("Loading backtest data from", filename)
+            columns = _read_columns(filename)
+            bot.backtest_data[symbol] = KlineSeries.from_columns(columns)
+        else:
+            filename = Function.kline_data_filename(
+                Markets[symbol[1]], symbol=symbol, timefr=bot.timefr
+            )
+            print("Loading backtest data from", filename)
+            columns = KlineArchive.read_columns(filename)
+            bot.backtest_data[symbol] = KlineSeries.from_columns(columns, copy=False)
+
+    _check_data_size(bot=bot)
+
 
+def _check_data_size(bot: BotData):
+    """
+    Checking if the sizes of all backtesting data records are the same.
+    """
     if len(var.backtest_symbols) > 1:
         reference_size = len(bot.backtest_data[var.backtest_symbols[0]])
         reference_symbol = var.backtest_symbols[0]
@@ -90,6 +185,9 @@ def load_backtest_data(bot: BotData):
 
 def _save_trades(side: str, qty: float, price: float, time):
     data = str(time) + ";" + side + ";" + str(price) + ";" + str(qty)
+    if Backtest.buffer_trades is not None:
+        Backtest.buffer_trades.append(data)
+        return
     with open(Backtest.filename_trade, "a") as f:
         f.write(data + "\n")
 
@@ -186,23 +284,33 @@ def results(bot: BotData, price=None):
     return values
 
 
+def _results_line(bot: BotData, date: int, price: float) -> str:
+    values = results(bot=bot, price=price)
+    data = str(date)
+    for symbol, value in values.items():
+        data += (
+            ";"
+            + symbol[0]
+            + ";"
+            + str(value["result"])
+            + ";"
+            + str(value["max_position"])
+            + ";"
+            + str(bot.bot_positions[symbol]["position"])
+        )
+
+    return data
+
+
 def _save_results_by_day(bot: BotData):
     symbol = list(bot.bot_positions.keys())[0]
     data = bot.backtest_data[symbol]
     if data[bot.iter]["date"] != data[bot.iter + 1]["date"]:
-        values = results(bot=bot, price=data[bot.iter + 1]["open_bid"])
-        data = str(data[bot.iter]["date"])
-        for symbol, value in values.items():
-            data += (
-                ";"
-                + symbol[0]
-                + ";"
-                + str(value["result"])
-                + ";"
-                + str(value["max_position"])
-                + ";"
-                + str(bot.bot_positions[symbol]["position"])
-            )
+        data = _results_line(
+            bot=bot,
+            date=data[bot.iter]["date"],
+            price=data[bot.iter + 1]["open_bid"],
+        )
         with open(Backtest.filename, "a") as f:
             f.write(data + "\n")
 
@@ -216,6 +324,76 @@ def run(bot: BotData, strategy: Callable):
         strategy()
 
 
+def _fill_orders(bot: BotData, book: FillBook):
+    """
+    Same as _check_trades(), but the orders filled on the current line are
+    taken from the FillBook, which searches the hi and lo columns only when
+    the orders have changed.
+    """
+    orders: OrderedDict = var.orders[bot.name]
+    clOrdIDs = book.filled(orders=orders, line=bot.iter, version=var.orders.version)
+    for clOrdID in clOrdIDs:
+        order = orders[clOrdID]
+        data = bot.backtest_data[order["symbol"]]
+        ws = Markets[order["market"]]
+        instrument = ws.Instrument[order["symbol"]]
+        ttime = str(data.date[bot.iter]) + str(data.time[bot.iter])
+        _trade(
+            instrument=instrument,
+            bot=bot,
+            side=order["side"],
+            qty=order["leavesQty"],
+            price=order["price"],
+            ttime=ttime,
+            clOrdID=clOrdID,
+        )
+
+
+def _flush_buffers(save: bool):
+    if save:
+        with open(Backtest.filename_trade, "a") as f:
+            for data in Backtest.buffer_trades:
+                f.write(data + "\n")
+        with open(Backtest.filename, "a") as f:
+            for data in Backtest.buffer_results:
+                f.write(data + "\n")
+    Backtest.buffer_trades = None
+    Backtest.buffer_results = None
+
+
+def run_arrays(bot: BotData, strategy: Callable, save: bool = True):
+    """
+    The second backtest engine that works with the data loaded by
+    load_backtest_arrays(). The line on which each limit order is filled is
+    found in the hi and lo arrays by FillBook, and the trades and results by day are kept in memory and
+    written to the files when the run is finished. If save is False, the
+    files are not written, which is used by the parameter sweep.
+    """
+    symbols = list(bot.backtest_data.keys())
+    book = FillBook(
+        hi={symbol: bot.backtest_data[symbol].columns["hi"] for symbol in symbols},
+        lo={symbol: bot.backtest_data[symbol].columns["lo"] for symbol in symbols},
+    )
+    date = bot.backtest_data[symbols[0]].columns["date"]
+    open_bid = bot.backtest_data[symbols[0]].columns["open_bid"]
+    size = len(date) - 1
+    Backtest.buffer_trades = list()
+    Backtest.buffer_results = list()
+    try:
+        for bot.iter in range(1, size):
+            if var.orders[bot.name]:
+                _fill_orders(bot=bot, book=book)
+            if date[bot.iter] != date[bot.iter + 1] and bot.bot_positions:
+                Backtest.buffer_results.append(
+                    _results_line(
+                        bot=bot, date=date[bot.iter], price=open_bid[bot.iter + 1]
+                    )
+                )
+            strategy()
+    finally:
+        _flush_buffers(save=save)
+
+
 def create_results_file(bot: BotData):
     Backtest.filename = os.getcwd() + "/backtest/results.txt"
     f = open(Backtest.filename, "w")
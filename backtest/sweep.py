@@ -0,0 +1,231 @@
+import importlib
+import itertools
+import mmap
+import os
+import sys
+import tempfile
+import traceback
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import backtest.init  # noqa: F401
+import services as service
+from backtest import functions as backtest
+from botinit.variables import Variables as robo
+from common.data import Bots, KlineSeries
+from common.variables import Variables as var
+
+
+class Sweep:
+    """
+    State of a worker process: the bot name, the name of the strategy
+    function and the backtest data attached to the memory-mapped file.
+    """
+
+    bot_name = ""
+    strategy = ""
+    data = dict()
+    mapped = None
+
+
+def _import_strategy(bot_name: str):
+    """
+    Imports strategy.py of the bot anew, the same way as import_bot_module()
+    does, so that module-level code of the strategy runs for each variant.
+    """
+    module = "algo." + bot_name + "." + robo.strategy_file.split(".")[0]
+    if module in sys.modules:
+        del sys.modules[module]
+
+    return importlib.import_module(module)
+
+
+def _share_data(bot) -> tuple:
+    """
+    Writes the backtest data columns to a temporary file, which is then
+    memory-mapped read-only by each worker, so that all processes use the
+    same pages of the operating system cache instead of their own copies.
+
+    Returns
+    -------
+    tuple
+        Filename and layout: for each symbol the number of lines and a list
+        of (column name, typecode, offset) elements.
+    """
+    layout = list()
+    offset = 0
+    descriptor, filename = tempfile.mkstemp(prefix="tmatic_sweep_", suffix=".bin")
+    with os.fdopen(descriptor, "wb") as file:
+        for symbol, series in bot.backtest_data.items():
+            columns = list()
+            for name, code in KlineSeries.FIELDS.items():
+                values = series.columns[name]
+                # Each column starts at a multiple of 8 bytes to be aligned.
+                padding = -offset % 8
+                file.write(bytes(padding))
+                offset += padding
+                columns.append((name, code, offset))
+                file.write(values.tobytes())
+                offset += len(values) * values.itemsize
+            layout.append((symbol, len(series), columns))
+
+    return filename, layout
+
+
+def _init_worker(bot_name: str, strategy: str, filename: str, layout: list):
+    Sweep.bot_name = bot_name
+    Sweep.strategy = strategy
+    with open(filename, "rb") as file:
+        Sweep.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    buffer = memoryview(Sweep.mapped)
+    Sweep.data = dict()
+    for symbol, size, columns in layout:
+        values = dict()
+        for name, code, offset in columns:
+            itemsize = array(code).itemsize
+            values[name] = buffer[offset : offset + size * itemsize].cast(code)
+        Sweep.data[symbol] = KlineSeries.from_columns(values, copy=False)
+
+
+def _run_variant(parameters: dict) -> dict:
+    """
+    Runs the backtest for one set of parameters. The bot state is reset,
+    strategy.py is imported anew and the parameters replace the values of
+    the module-level names of the same name, then run_arrays() is called.
+    """
+    bot = Bots[Sweep.bot_name]
+    service.init_bot(
+        bot=bot,
+        name=bot.name,
+        state=bot.state,
+        timefr=bot.timefr,
+        created=bot.created,
+        updated=bot.updated,
+    )
+    bot.backtest_data = Sweep.data
+    var.orders[bot.name] = OrderedDict()
+    backtest.Backtest.trades = 0
+    module = _import_strategy(bot.name)
+    for name, value in parameters.items():
+        setattr(module, name, value)
+    backtest.run_arrays(bot=bot, strategy=getattr(module, Sweep.strategy), save=False)
+
+    return {
+        "parameters": parameters,
+        "values": backtest.results(bot=bot),
+        "trades": backtest.Backtest.trades,
+    }
+
+
+def _save_table(table: list, filename: str):
+    with open(filename, "w") as f:
+        f.write("rank;parameters;trades;result;symbol;result;commission;max\n")
+        for num, row in enumerate(table):
+            data = (
+                str(num + 1)
+                + ";"
+                + str(row["parameters"])
+                + ";"
+                + str(row["trades"])
+                + ";"
+                + str(row["result"])
+            )
+            if row["error"]:
+                data += ";" + row["error"].replace("\n", " ")
+            else:
+                for symbol, value in row["values"].items():
+                    data += (
+                        ";"
+                        + symbol[0]
+                        + ";"
+                        + str(value["result"])
+                        + ";"
+                        + str(value["commission"])
+                        + ";"
+                        + str(value["max_position"])
+                    )
+            f.write(data + "\n")
+
+
+def sweep(
+    bot_name: str, grid: dict, strategy: str = "run_bot", workers: int = None
+) -> list:
+    """
+    Runs the backtest of the bot for every combination of parameters in a
+    separate process. The backtest data is loaded once and shared read-only
+    between the processes.
+
+    Parameters
+    ----------
+    bot_name: str
+        Bot name, its strategy.py is located in algo/<bot_name>/.
+    grid: dict
+        Module-level names of strategy.py and lists of their values, for
+        example {"PERIOD": [10, 20, 50], "LEVEL": [0.5, 1.0]}. Only the
+        names used inside the strategy functions are affected, since the
+        values are replaced after the module is imported.
+    strategy: str
+        Name of the strategy function called on every line of data.
+    workers: int
+        Number of processes. If omitted, the number of processors.
+
+    Returns
+    -------
+    list
+        Variants sorted by the sum of results for all symbols in descending
+        order. Each element is a dictionary with the keys ``parameters``,
+        ``result``, ``trades``, ``values`` (the results() output) and
+        ``error``. The table is also saved to backtest/sweep.txt.
+
+    Examples
+    --------
+    if __name__ == "__main__":
+        from backtest.sweep import sweep
+
+        sweep(bot_name="Super", grid={"PERIOD": [10, 20], "LEVEL": [0.5, 1]})
+    """
+    if bot_name not in Bots.keys():
+        print("Bot", bot_name, "not found.")
+        return []
+    bot = Bots[bot_name]
+    _import_strategy(bot_name)
+    backtest.load_backtest_arrays(bot)
+    filename, layout = _share_data(bot)
+    variants = [
+        dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())
+    ]
+    print("Running", len(variants), "variants of", bot_name)
+    table = list()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(bot_name, strategy, filename, layout),
+        ) as executor:
+            futures = {
+                executor.submit(_run_variant, parameters): parameters
+                for parameters in variants
+            }
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                    row["result"] = sum(x["result"] for x in row["values"].values())
+                    row["error"] = ""
+                except Exception:
+                    row = {
+                        "parameters": futures[future],
+                        "values": dict(),
+                        "trades": 0,
+                        "result": float("-inf"),
+                        "error": traceback.format_exc(),
+                    }
+                table.append(row)
+    finally:
+        os.remove(filename)
+    table.sort(key=lambda x: x["result"], reverse=True)
+    _save_table(table=table, filename=os.getcwd() + "/backtest/sweep.txt")
+    for num, row in enumerate(table[:10]):
+        print(num + 1, row["parameters"], row["result"])
+
+    return table
@@ -1,3 +1,6 @@
+import importlib
+import os
+import sys
 import threading
 from collections import OrderedDict
 from datetime import datetime, timezone
@@ -7,9 +10,9 @@ import services as service
 from api.setup import Markets
 from botinit.variables import Variables as robo
 from common.data import Bots
+from common.executor import BotExecutor
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.bot_menu import import_bot_module
-from display.messages import ErrorMessage, Message
 
 
 def add_subscription(subscriptions: set) -> None:
@@ -45,18 +48,13 @@ def add_subscription(subscriptions: set) -> None:
         ws = Markets[symbol[1]]
         if res:
             qwr = (
-                "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, "
+                "select MARKET, SYMBOL, sum(VOL) as SUM_QTY, "
                 + "sum(SUMREAL) as SUM_SUMREAL from "
                 + var.database_table
-                + " where SYMBOL = '"
-                + symbol[0]
-                + "' and SIDE <> 'Fund' and market = '"
-                + symbol[1]
-                + "' and ACCOUNT = "
-                + str(ws.user_id)
-                + ";"
+                + "_summary where SYMBOL = ? and TRADES > 0 and MARKET = ?"
+                + " and ACCOUNT = ?;"
             )
-            data = service.select_database(qwr)
+            data = service.select_database(qwr, (symbol[0], symbol[1], ws.user_id))
             instrument = ws.Instrument[symbol]
             instrument.volume = round(data[0]["SUM_QTY"], instrument.precision)
             instrument.sumreal = data[0]["SUM_SUMREAL"]
@@ -92,33 +90,32 @@ def load_bots() -> None:
 
     union = ""
     sql = ""
+    params = list()
     symbols = dict()
     for market in var.market_list:
         ws = Markets[market]
         symbols[market] = ws.Instrument.get_keys()
         sql += union
         sql += (
-            "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, sum(SUMREAL) "
+            "select MARKET, SYMBOL, sum(VOL) as SUM_QTY, sum(SUMREAL) "
             + "as SUM_SUMREAL from "
             + var.database_table
-            + " where MARKET = '"
-            + market
-            + "' and account = '"
-            + str(ws.user_id)
-            + "' and side <> 'Fund' group by SYMBOL"
+            + "_summary where MARKET = ? and ACCOUNT = ? and TRADES > 0 "
+            + "group by SYMBOL"
         )
+        params += [market, ws.user_id]
         union = " union ALL "
     sql += ";"
     var.lock.acquire(True)
-    data = service.select_database(sql)
-    for value in data:
-        ws = Markets[value["MARKET"]]
-        symbol = (value["SYMBOL"], value["MARKET"])
+    data = service.select_database(sql, params, flush=True, rows="tuple")
+    for market_name, symb, sum_qty, sum_sumreal in data:
+        ws = Markets[market_name]
+        symbol = (symb, market_name)
         if symbol in symbols[market]:
             instrument = ws.Instrument[symbol]
             precision = instrument.precision
-            instrument.volume = round(float(value["SUM_QTY"]), precision)
-            instrument.sumreal = float(value["SUM_SUMREAL"])
+            instrument.volume = round(float(sum_qty), precision)
+            instrument.sumreal = float(sum_sumreal)
     var.lock.release()
 
     # Search for unclosed positions. If an unclosed position belongs to a bot
@@ -131,7 +128,7 @@ def load_bots() -> None:
     while update:
         update = False
         qwr = functions.SelectDatabase.QWR.format(DATABASE_TABLE=var.database_table)
-        data = service.select_database(qwr)
+        data = service.select_database(qwr, flush=True)
         subscriptions = set()
         update_symbol = dict()
         for value in data:
@@ -152,17 +149,17 @@ def load_bots() -> None:
                     if name not in Bots.keys():
                         if name != "":
                             qwr = (
-                                "select ID, EMI, SYMBOL from %s where side <> 'Fund' and EMI = '%s'"
-                                % (var.database_table, name)
+                                "select ID, EMI, SYMBOL from %s where side <> 'Fund' and EMI = ?"
+                                % var.database_table
                             )
-                            data = service.select_database(qwr)
+                            data = service.select_database(qwr, (name,))
                             for row in data:
-                                qwr = "update %s set EMI = '%s' where ID = %s;" % (
-                                    var.database_table,
-                                    "",
-                                    row["ID"],
+                                qwr = "update %s set EMI = ? where ID = ?;" % (
+                                    var.database_table
+                                )
+                                service.update_database(
+                                    query=qwr, params=("", row["ID"])
                                 )
-                                service.update_database(query=qwr)
                             update = True
 
     # Adding subscriptions to unclosed positions found in the database (if any).
@@ -217,19 +214,16 @@ def load_bots() -> None:
         # Open Positions
 
         qwr = (
-            "select * from (select SYMBOL, CATEGORY, MARKET, TICKER, "
-            + "ifnull(sum(SUMREAL), 0) SUMREAL, ifnull(sum(case when SIDE = "
-            + "'Fund' then 0 else QTY end), 0) POS, ifnull(sum(case when SIDE "
-            + "= 'Fund' then 0 else abs(QTY) end), 0) VOL, ifnull(sum(COMMISS)"
-            + ", 0) COMMISS, ifnull(max(TTIME), '1900-01-01 01:01:01.000000') "
-            + "LTIME from "
+            "select * from (select SYMBOL, max(CATEGORY) CATEGORY, MARKET, "
+            + "max(TICKER) TICKER, ifnull(sum(SUMREAL + FUND_SUMREAL), 0) SUMREAL, "
+            + "ifnull(sum(POS), 0) POS, ifnull(sum(VOL), 0) VOL, "
+            + "ifnull(sum(COMMISS + FUNDING), 0) COMMISS, "
+            + "ifnull(max(LTIME), '1900-01-01 01:01:01.000000') LTIME from "
             + var.database_table
-            + " where EMI = '"
-            + name
-            + "' group by SYMBOL) T where POS <> 0;"
+            + "_summary where EMI = ? group by SYMBOL, MARKET) T where POS <> 0;"
         )
         var.lock.acquire(True)
-        data = service.select_database(qwr)
+        data = service.select_database(qwr, (name,))
         bot = Bots[name]
         for value in data:
             symbol = (value["SYMBOL"], value["MARKET"])
@@ -268,17 +262,15 @@ def load_bots() -> None:
         # Results by currency for closed positions
 
         qwr = (
-            "select SYMBOL, MARKET, CURRENCY, ifnull(sum(SUMREAL), 0) "
-            + "SUMREAL, ifnull(sum(COMMISS), 0) COMMISS, ifnull(sum(case when SIDE = "
-            + "'Fund' then 0 else QTY end), 0) POS, ifnull(max(TTIME), "
-            + "'1900-01-01 01:01:01.000000') LTIME from "
+            "select SYMBOL, MARKET, max(CURRENCY) CURRENCY, "
+            + "ifnull(sum(SUMREAL + FUND_SUMREAL), 0) SUMREAL, "
+            + "ifnull(sum(COMMISS + FUNDING), 0) COMMISS, ifnull(sum(POS), 0) POS, "
+            + "ifnull(max(LTIME), '1900-01-01 01:01:01.000000') LTIME from "
             + var.database_table
-            + " where EMI = '"
-            + name
-            + "' group by MARKET, SYMBOL"
+            + "_summary where EMI = ? group by MARKET, SYMBOL"
         )
 
-        data = service.select_database(qwr)
+        data = service.select_database(qwr, (name,))
         bot.bot_pnl = {}
         for value in data:
             if value["MARKET"] in var.market_list:
@@ -330,6 +322,131 @@ def load_bots() -> None:
         import_bot_module(bot_name=bot_name)
 
 
+def import_bot_module(bot_name: str, update=False) -> None:
+    """
+    This function is called when bots are initially loaded, or reloaded due
+    to <F3>, or reloaded for some other reason, or when strategy.py is
+    updated.
+
+    Parameters
+    ----------
+    bot_name: str
+        Bot name.
+    update: bool
+        Evaluates to True when strategy.py is updated.
+    """
+    if Bots[bot_name].state != "Disconnected":
+        module = "algo." + bot_name + "." + robo.strategy_file.split(".")[0]
+        Bots[bot_name].error_message = {}
+        Bots[bot_name].multitrade = False
+        Bots[bot_name].overrun = BotExecutor.POLICY
+        try:
+            if module in sys.modules:
+                del sys.modules[module]
+            mod = importlib.import_module(module)
+            robo.modules[bot_name] = mod
+        except ModuleNotFoundError as exception:
+            message = ErrorMessage.BOT_FOLDER_NOT_FOUND.format(
+                MODULE=module, EXCEPTION=exception, BOT_NAME=bot_name
+            )
+            var.logger.warning(message)
+            var.queue_info.put(
+                {
+                    "market": "",
+                    "message": message,
+                    "time": datetime.now(tz=timezone.utc),
+                    "warning": "warning",
+                    "emi": bot_name,
+                }
+            )
+            Bots[bot_name].error_message = {
+                "error_type": exception.__class__.__name__,
+                "message": message,
+            }
+        except Exception as exception:
+            err = service.display_exception(exception, display=False)
+            message = ErrorMessage.BOT_LOADING_ERROR.format(
+                MODULE=module,
+                CLASS=exception.__class__.__name__,
+                EXCEPTION=err,
+                BOT_NAME=bot_name,
+            )
+            var.logger.warning(message)
+            var.queue_info.put(
+                {
+                    "market": "",
+                    "message": message,
+                    "time": datetime.now(tz=timezone.utc),
+                    "warning": True,
+                    "emi": bot_name,
+                }
+            )
+            Bots[bot_name].error_message = {
+                "error_type": exception.__class__.__name__,
+                "message": message,
+            }
+        else:
+            if update:
+                var.queue_info.put(
+                    {
+                        "market": "",
+                        "message": "The bot `" + bot_name + "` updated successfully.",
+                        "time": datetime.now(tz=timezone.utc),
+                        "warning": None,
+                        "emi": bot_name,
+                    }
+                )
+        try:
+            robo.run_bot[bot_name] = robo.modules[bot_name].run_bot
+        except Exception:
+            robo.run_bot[bot_name] = "No strategy"
+        try:
+            robo.setup_bot[bot_name] = robo.modules[bot_name].setup_bot
+        except Exception:
+            robo.setup_bot[bot_name] = "No setup"
+        try:
+            robo.update_bot[bot_name] = robo.modules[bot_name].update_bot
+        except Exception:
+            robo.update_bot[bot_name] = "No update"
+        try:
+            robo.activate_bot[bot_name] = robo.modules[bot_name].activate_bot
+        except Exception:
+            robo.activate_bot[bot_name] = "No activate"
+        try:
+            BotExecutor.set_policy(bot_name, Bots[bot_name].overrun)
+        except ValueError as exception:
+            BotExecutor.set_policy(bot_name, BotExecutor.POLICY)
+            _put_message(
+                market="",
+                message=bot_name + ": " + str(exception),
+                warning="warning",
+            )
+        if update:
+            functions.init_bot_klines(bot_name)
+        tm = datetime.now()
+        month = "0" * (2 - len(str(tm.month))) + str(tm.month)
+        day = "0" * (2 - len(str(tm.day))) + str(tm.day)
+        hr = "0" * (2 - len(str(tm.hour))) + str(tm.hour)
+        min = "0" * (2 - len(str(tm.minute))) + str(tm.minute)
+        tm = f"{tm.year}{month}{day}-{hr}{min}"
+        Bots[bot_name].strategy_log = (
+            robo.algo_dir + "/" + bot_name + "/strategy_" + tm + ".log"
+        )
+    else:
+        if bot_name in robo.run_bot:
+            del robo.run_bot[bot_name]
+        if bot_name in robo.setup_bot:
+            del robo.setup_bot[bot_name]
+        if bot_name in robo.update_bot:
+            del robo.update_bot[bot_name]
+        if bot_name in robo.activate_bot:
+            del robo.activate_bot[bot_name]
+
+
+def get_bot_path(bot_name: str) -> str:
+    return os.path.join(robo.algo_dir, bot_name)
+
+
 def _put_message(market: str, message: str, warning=None) -> None:
     """
     Places an information message into the queue and the logger.
@@ -1,3 +1,6 @@
+import os
+
+
 class Variables:
     # The "run_bot" dictionary stores the run_bot() functions that are called,
     # which are found in the strategy.py files for each bot.
@@ -5,4 +8,11 @@ class Variables:
     setup_bot = dict()
     update_bot = dict()
     activate_bot = dict()
+    # The bot folders with strategy.py files and the imported modules.
+    algo_dir = f"{os.getcwd()}/algo/"
+    strategy_file = "strategy.py"
+    modules = dict()
     CANDLESTICK_NUMBER = 150
+    # Maximum number of candlesticks kept in memory for each symbol and time
+    # frame. When it is reached, the oldest candlestick is overwritten.
+    CANDLESTICK_CAPACITY = 5000
@@ -0,0 +1,174 @@
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime, timezone
+from typing import Union
+
+from common.data import KlineSeries
+
+
+class KlineArchive:
+    """
+    Binary archive of kline data of a symbol and time frame.
+
+    The file consists of a header, which holds the signature and the number
+    of lines, followed by fixed-size records with the fields of
+    KlineSeries.FIELDS in the same order: ``date`` and ``time`` are 8-byte
+    integers, the rest are 8-byte floats, ``datetime`` is a timestamp. The
+    file is memory-mapped and grows by GROWTH records when necessary, so
+    that a new line is written without reopening the file.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the archive file. The file is created if it does not exist.
+    """
+
+    SIGNATURE = b"TMKLINE1"
+    HEADER = struct.Struct("<8sQ")
+    RECORD = struct.Struct("<qqdddddd")
+    DATETIME = struct.Struct("<d")
+    DATETIME_OFFSET = 56
+    GROWTH = 1024
+    archives = dict()
+    archives_lock = threading.Lock()
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.lock = threading.Lock()
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self.file = open(filename, "r+b")
+        else:
+            self.file = open(filename, "w+b")
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() < KlineArchive.HEADER.size:
+            self._create()
+        self.mapped = mmap.mmap(self.file.fileno(), 0)
+        signature, self.size = KlineArchive.HEADER.unpack_from(self.mapped, 0)
+        if signature != KlineArchive.SIGNATURE:
+            self.mapped.close()
+            self._create()
+            self.mapped = mmap.mmap(self.file.fileno(), 0)
+            self.size = 0
+
+    def _create(self) -> None:
+        self.file.seek(0)
+        self.file.truncate(
+            KlineArchive.HEADER.size + KlineArchive.GROWTH * KlineArchive.RECORD.size
+        )
+        self.file.write(KlineArchive.HEADER.pack(KlineArchive.SIGNATURE, 0))
+        self.file.flush()
+
+    @staticmethod
+    def get(filename: str) -> "KlineArchive":
+        """
+        Returns the archive for the filename, opening it only once.
+        """
+        with KlineArchive.archives_lock:
+            if filename not in KlineArchive.archives:
+                KlineArchive.archives[filename] = KlineArchive(filename)
+
+            return KlineArchive.archives[filename]
+
+    def _offset(self, index: int) -> int:
+        return KlineArchive.HEADER.size + index * KlineArchive.RECORD.size
+
+    def _timestamp(self, index: int) -> float:
+        return KlineArchive.DATETIME.unpack_from(
+            self.mapped, self._offset(index) + KlineArchive.DATETIME_OFFSET
+        )[0]
+
+    def append(self, row: dict) -> None:
+        """
+        Adds a line to the end of the archive.
+        """
+        values = [
+            KlineSeries.convert(name, row.get(name, 0)) for name in KlineSeries.FIELDS
+        ]
+        with self.lock:
+            offset = self._offset(self.size)
+            if offset + KlineArchive.RECORD.size > len(self.mapped):
+                self.mapped.resize(
+                    len(self.mapped) + KlineArchive.GROWTH * KlineArchive.RECORD.size
+                )
+            KlineArchive.RECORD.pack_into(self.mapped, offset, *values)
+            self.size += 1
+            KlineArchive.HEADER.pack_into(
+                self.mapped, 0, KlineArchive.SIGNATURE, self.size
+            )
+
+    def first_datetime(self) -> Union[datetime, None]:
+        """
+        Returns the datetime of the earliest line or None if the archive is
+        empty.
+        """
+        with self.lock:
+            if not self.size:
+                return None
+
+            return datetime.fromtimestamp(self._timestamp(0), tz=timezone.utc)
+
+    def last_datetime(self) -> Union[datetime, None]:
+        """
+        Returns the datetime of the latest line or None if the archive is
+        empty.
+        """
+        with self.lock:
+            if not self.size:
+                return None
+
+            return datetime.fromtimestamp(
+                self._timestamp(self.size - 1), tz=timezone.utc
+            )
+
+    def rows(self, start: datetime) -> list:
+        """
+        Returns the lines with datetime equal to or later than start. The
+        lines are in chronological order, so the first one is found by
+        binary search.
+        """
+        timestamp = start.timestamp()
+        with self.lock:
+            first, last = 0, self.size
+            while first < last:
+                middle = (first + last) // 2
+                if self._timestamp(middle) < timestamp:
+                    first = middle + 1
+                else:
+                    last = middle
+            data = self.mapped[self._offset(first) : self._offset(self.size)]
+        res = list()
+        for values in KlineArchive.RECORD.iter_unpack(data):
+            row = dict(zip(KlineSeries.FIELDS, values))
+            row["datetime"] = datetime.fromtimestamp(row["datetime"], tz=timezone.utc)
+            res.append(row)
+
+        return res
+
+    def flush(self) -> None:
+        with self.lock:
+            self.mapped.flush()
+
+    @staticmethod
+    def read_columns(filename: str) -> dict:
+        """
+        Maps the archive file read-only and returns its columns as
+        memoryviews, without copying or parsing data. Used by the
+        backtester, see KlineSeries.from_columns().
+        """
+        with open(filename, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, size = KlineArchive.HEADER.unpack_from(mapped, 0)
+        if signature != KlineArchive.SIGNATURE:
+            raise ValueError(filename + " is not a kline archive.")
+        buffer = memoryview(mapped)[
+            KlineArchive.HEADER.size : KlineArchive.HEADER.size
+            + size * KlineArchive.RECORD.size
+        ]
+        fields = len(KlineSeries.FIELDS)
+        columns = dict()
+        for num, (name, code) in enumerate(KlineSeries.FIELDS.items()):
+            columns[name] = buffer.cast(code)[num::fields]
+
+        return columns
@@ -1,6 +1,11 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
 from collections import OrderedDict
-from datetime import datetime
-from typing import Any, Iterable, Union
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Union
 
 from common.variables import Variables as var
 
@@ -223,11 +228,581 @@ class BotData:
     iter: int = 0
     strategy_log: str
     multitrade: str = ""
+    overrun: str = "skip"
 
     def __iter__(self):
         return Ret.iter(self)
 
 
+class Changes:
+    """
+    Notifies the display of the data changed by the websocket threads.
+    mark() assigns the next version number to the changed instrument,
+    order book or account. The display remembers the version it has shown
+    and redraws only the rows marked after it.
+    """
+
+    lock = threading.Lock()
+    version = 0
+    marked = {"instrument": dict(), "orderbook": dict(), "account": dict()}
+
+    @staticmethod
+    def mark(kind: str, key: tuple) -> None:
+        """
+        Parameters
+        ----------
+        kind: str
+            "instrument", "orderbook" or "account".
+        key: tuple
+            Instrument symbol or account currency, e.g. ("BTCUSDT", "Bybit")
+            or ("USDT", "Bybit").
+        """
+        with Changes.lock:
+            Changes.version += 1
+            Changes.marked[kind][key] = Changes.version
+
+    @staticmethod
+    def since(kind: str, version: int) -> set:
+        """
+        Returns the keys of the kind marked after the version.
+        """
+        with Changes.lock:
+            return {
+                key for key, value in Changes.marked[kind].items() if value > version
+            }
+
+
+class IntraBar:
+    """
+    The lowest high and the highest low of the current periods of all
+    timeframes of a symbol. An order book update within these bounds
+    changes none of the timeframes, so the common case is checked once per
+    symbol rather than for each timeframe, see kline_hi_lo_values().
+    reset() is called when a period of any timeframe of the symbol begins
+    or its data is loaded.
+    """
+
+    lock = threading.Lock()
+    bounds = dict()
+    epochs = dict()
+
+    @staticmethod
+    def reset(symbol: tuple) -> None:
+        with IntraBar.lock:
+            IntraBar.bounds.pop(symbol, None)
+            IntraBar.epochs[symbol] = IntraBar.epochs.get(symbol, 0) + 1
+
+    @staticmethod
+    def epoch(symbol: tuple) -> int:
+        return IntraBar.epochs.get(symbol, 0)
+
+    @staticmethod
+    def store(symbol: tuple, epoch: int, bounds: tuple) -> None:
+        """
+        Saves the bounds calculated by the caller, unless reset() has been
+        called since the epoch was obtained.
+        """
+        with IntraBar.lock:
+            if IntraBar.epochs.get(symbol, 0) == epoch:
+                IntraBar.bounds[symbol] = bounds
+
+
+class PriceLevels:
+    """
+    One side of the order book.
+
+    Price levels are kept in a sorted list of keys and a dictionary of
+    quantities, so that an incoming level is found by binary search instead
+    of a linear scan. For bids the keys are negative prices, therefore both
+    sides are iterated starting from the best price.
+
+    Parameters
+    ----------
+    descend: bool
+        ``True`` for bids, ``False`` for asks.
+    depth: int
+        Number of the best levels maintained in ``top``.
+    """
+
+    def __init__(self, descend: bool, depth: int) -> None:
+        self.sign = -1 if descend else 1
+        self.depth = depth
+        self.keys = list()
+        self.qty = dict()
+        self.top = list()
+
+    def clear(self) -> None:
+        self.keys = list()
+        self.qty = dict()
+        self.top = list()
+
+    def update(self, levels: Iterable) -> None:
+        """
+        Applies price levels [price, qty], where qty 0 deletes the level.
+        The ``top`` list is never modified in place, instead it is replaced
+        by a new list if any of the best levels have changed, so the list
+        obtained by another thread remains consistent.
+        """
+        keys = self.keys
+        top = None
+        for level in levels:
+            price = float(level[0])
+            qty = float(level[1])
+            key = price * self.sign
+            indx = bisect_left(keys, key)
+            if qty == 0:
+                if key not in self.qty:
+                    continue
+                del self.qty[key]
+                del keys[indx]
+                if indx < self.depth:
+                    if top is None:
+                        top = self.top.copy()
+                    del top[indx]
+                    if len(keys) >= self.depth:
+                        key = keys[self.depth - 1]
+                        top.append([key * self.sign, self.qty[key]])
+            else:
+                if key in self.qty:
+                    self.qty[key] = qty
+                    if indx < self.depth:
+                        if top is None:
+                            top = self.top.copy()
+                        top[indx] = [price, qty]
+                else:
+                    self.qty[key] = qty
+                    keys.insert(indx, key)
+                    if indx < self.depth:
+                        if top is None:
+                            top = self.top.copy()
+                        top.insert(indx, [price, qty])
+                        if len(top) > self.depth:
+                            top.pop()
+        if top is not None:
+            self.top = top
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class OrderBook:
+    """
+    Order book of an instrument updated by snapshots and deltas.
+
+    Parameters
+    ----------
+    ticker: str
+        Symbol of the instrument in the exchange classification.
+    depth: int
+        Number of the best levels available in ``asks`` and ``bids``.
+    """
+
+    def __init__(self, ticker: str, depth: int = 10) -> None:
+        self.ticker = ticker
+        self.ask_levels = PriceLevels(descend=False, depth=depth)
+        self.bid_levels = PriceLevels(descend=True, depth=depth)
+
+    @property
+    def asks(self) -> list:
+        """
+        The best asks sorted by price in ascending order.
+        """
+        return self.ask_levels.top
+
+    @property
+    def bids(self) -> list:
+        """
+        The best bids sorted by price in descending order.
+        """
+        return self.bid_levels.top
+
+    def snapshot(self, asks: Iterable, bids: Iterable) -> None:
+        self.ask_levels.clear()
+        self.bid_levels.clear()
+        self.update(asks=asks, bids=bids)
+
+    def update(self, asks: Iterable, bids: Iterable) -> None:
+        self.ask_levels.update(asks)
+        self.bid_levels.update(bids)
+
+
+class KlineColumn:
+    """
+    A column of the KlineSeries in chronological order. An integer index
+    returns a value, a slice returns array.array (a list for ``datetime``),
+    so that ``kl.hi[-50:]`` does not create a dictionary for each line.
+
+    If ``limit`` is given, it returns the number of the first lines that
+    the column shows, e.g. the lines before the current one in backtest
+    mode, and the indexes count from the last of them.
+    """
+
+    def __init__(
+        self, series: "KlineSeries", name: str, limit: Callable = None
+    ) -> None:
+        self.series = series
+        self.name = name
+        self.limit = limit
+
+    def __getitem__(self, item: Union[int, slice]) -> Any:
+        if self.limit is not None:
+            size = len(self)
+            if isinstance(item, slice):
+                first, last, step = item.indices(size)
+                # A negative step stops at -1 to include the first line.
+                item = slice(first, last if last >= 0 else None, step)
+            else:
+                if item < 0:
+                    item += size
+                if item < 0 or item >= size:
+                    raise IndexError("kline index out of range")
+
+        return self.series.get_value(self.name, item)
+
+    def __setitem__(self, item: int, value: Any) -> None:
+        self.series.set_value(self.name, item, value)
+
+    def __len__(self) -> int:
+        if self.limit is None:
+            return self.series.size
+
+        return max(min(self.series.size, self.limit()), 0)
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class KlineSeries:
+    """
+    Kline (candlestick) data of a symbol and time frame.
+
+    Each field is stored in its own typed array. The arrays grow until the
+    capacity is reached, after which the series works as a ring buffer: a
+    new line overwrites the oldest one, so both appending a line and
+    updating the latest line take O(1) and memory use is bounded.
+
+    Indexing the series returns a line as a dictionary with the keys of
+    FIELDS, ``datetime`` is stored as a timestamp and returned as datetime.
+    Columns are available as attributes, for example ``series.hi``.
+
+    Parameters
+    ----------
+    capacity: int
+        Maximum number of lines kept in memory.
+    """
+
+    FIELDS = OrderedDict(
+        [
+            ("date", "q"),
+            ("time", "q"),
+            ("open_bid", "d"),
+            ("open_ask", "d"),
+            ("hi", "d"),
+            ("lo", "d"),
+            ("funding", "d"),
+            ("datetime", "d"),
+        ]
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.start = 0
+        self.columns = OrderedDict(
+            (name, array(code)) for name, code in KlineSeries.FIELDS.items()
+        )
+        for name in KlineSeries.FIELDS:
+            setattr(self, name, KlineColumn(self, name))
+
+    @staticmethod
+    def convert(name: str, value: Any) -> Union[int, float]:
+        """
+        Converts a value to the type of the column. None is a missing
+        value and is stored as 0, e.g. the funding rate of a spot
+        instrument. Any other value that is not a number raises ValueError.
+        """
+        if isinstance(value, datetime):
+            return value.timestamp()
+        elif value is None:
+            return 0
+        try:
+            if name in ["date", "time"]:
+                return int(value)
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                "Kline " + name + " value " + repr(value) + " is not a number."
+            ) from None
+
+    def _position(self, index: int) -> int:
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("kline index out of range")
+
+        return (self.start + index) % len(self.columns["date"])
+
+    def append(self, row: dict) -> None:
+        """
+        Adds a new line. Missing fields are filled with zeros.
+        """
+        if self.size < self.capacity:
+            for name, column in self.columns.items():
+                column.append(KlineSeries.convert(name, row.get(name, 0)))
+            self.size += 1
+        else:
+            for name, column in self.columns.items():
+                column[self.start] = KlineSeries.convert(name, row.get(name, 0))
+            self.start = (self.start + 1) % self.capacity
+
+    def get_value(self, name: str, item: Union[int, slice]) -> Any:
+        column = self.columns[name]
+        if isinstance(item, slice):
+            first, last, step = item.indices(self.size)
+            if step == 1:
+                if first >= last:
+                    values = column[:0]
+                else:
+                    length = len(column)
+                    pos = (self.start + first) % length
+                    end = pos + last - first
+                    if end <= length:
+                        values = column[pos:end]
+                    else:
+                        values = column[pos:] + column[: end - length]
+                if not isinstance(values, array):
+                    # The column is a memoryview of mapped backtest data.
+                    values = array(KlineSeries.FIELDS[name], values.tobytes())
+            else:
+                values = array(
+                    KlineSeries.FIELDS[name],
+                    (column[self._position(x)] for x in range(first, last, step)),
+                )
+            if name == "datetime":
+                return [datetime.fromtimestamp(x, tz=timezone.utc) for x in values]
+
+            return values
+        value = column[self._position(item)]
+        if name == "datetime":
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+
+        return value
+
+    @staticmethod
+    def from_columns(columns: dict, copy: bool = True) -> "KlineSeries":
+        """
+        Creates a series filled to its capacity from the columns of the
+        same length given as iterables of values. Missing columns are
+        filled with zeros. If copy is False, the columns must be arrays or
+        memoryviews of the FIELDS types, they are used as is, e.g. a
+        read-only memoryview of a memory-mapped file.
+        """
+        size = len(columns["date"])
+        series = KlineSeries(capacity=size)
+        for name, code in KlineSeries.FIELDS.items():
+            if name in columns:
+                if copy:
+                    series.columns[name] = array(code, columns[name])
+                else:
+                    series.columns[name] = columns[name]
+            else:
+                series.columns[name] = array(code, [0]) * size
+        series.size = size
+
+        return series
+
+    def timestamp(self, index: int) -> float:
+        """
+        Returns the datetime of the line as a timestamp.
+        """
+        return self.columns["datetime"][self._position(index)]
+
+    @staticmethod
+    def from_rows(rows: list) -> "KlineSeries":
+        """
+        Creates a series from a list of lines given as dictionaries. The
+        lines of backtest data files have no ``datetime``, it is calculated
+        from ``date`` and ``time``, as IndicatorStream finds the lines by
+        time.
+        """
+        series = KlineSeries(capacity=max(len(rows), 1))
+        for row in rows:
+            if "datetime" not in row:
+                if "date" not in row or "time" not in row:
+                    raise ValueError("A kline line has no datetime, date or time.")
+                row = dict(
+                    row,
+                    datetime=KlineSeries.timestamp_of(
+                        date=int(row["date"]), tm=int(row["time"])
+                    ),
+                )
+            series.append(row)
+
+        return series
+
+    @staticmethod
+    def timestamp_of(date: int, tm: int) -> float:
+        """
+        Returns the timestamp of a line with the date in the yymmdd and the
+        time in the hhmm format.
+        """
+        return datetime(
+            2000 + date // 10000,
+            date // 100 % 100,
+            date % 100,
+            tm // 100,
+            tm % 100,
+            tzinfo=timezone.utc,
+        ).timestamp()
+
+    def set_value(self, name: str, item: int, value: Any) -> None:
+        self.columns[name][self._position(item)] = KlineSeries.convert(name, value)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[dict, list]:
+        if isinstance(item, slice):
+            return [self[x] for x in range(*item.indices(self.size))]
+        pos = self._position(item)
+        row = dict()
+        for name, column in self.columns.items():
+            row[name] = column[pos]
+        row["datetime"] = datetime.fromtimestamp(row["datetime"], tz=timezone.utc)
+
+        return row
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        for num in range(self.size):
+            yield self[num]
+
+
+class Table(OrderedDict):
+    """
+    Rows of a websocket table with a retention policy, so that the tables
+    receiving new rows all the time do not grow in a long running process.
+
+    Parameters
+    ----------
+    capacity: int
+        Maximum number of rows. When it is exceeded, the oldest row is
+        removed, as in a ring buffer.
+    ttl: float
+        Time to live of a row in seconds since it was last stored.
+    terminal: Callable
+        Returns True if the row is in a terminal state, e.g. a filled or
+        cancelled order. Such rows are not kept.
+
+    The order of the rows is the order in which they were last stored.
+    """
+
+    def __init__(
+        self,
+        capacity: int = None,
+        ttl: float = None,
+        terminal: Callable = None,
+    ) -> None:
+        super().__init__()
+        self.capacity = capacity
+        self.ttl = ttl
+        self.terminal = terminal
+        self.stored = dict()
+        self.evicted = 0
+
+    def __setitem__(self, key, row: dict) -> None:
+        if self.terminal and self.terminal(row):
+            if key in self:
+                del self[key]
+            self.evicted += 1
+            return
+        OrderedDict.__setitem__(self, key, row)
+        self.move_to_end(key)
+        self.stored[key] = time.monotonic()
+        self.expire()
+        if self.capacity is not None:
+            while len(self) > self.capacity:
+                self.popitem(last=False)
+                self.evicted += 1
+
+    def __delitem__(self, key) -> None:
+        OrderedDict.__delitem__(self, key)
+        del self.stored[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            row = OrderedDict.__getitem__(self, key)
+            del self[key]
+            return row
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self, last: bool = True) -> tuple:
+        if not self:
+            raise KeyError("dictionary is empty")
+        key = next(reversed(self)) if last else next(iter(self))
+
+        return key, self.pop(key)
+
+    def clear(self) -> None:
+        OrderedDict.clear(self)
+        self.stored.clear()
+
+    def compact(self, key) -> None:
+        """
+        Removes the row if it has come to a terminal state after being
+        updated in place.
+        """
+        if self.terminal and key in self and self.terminal(self[key]):
+            del self[key]
+            self.evicted += 1
+
+    def expire(self) -> None:
+        """
+        Removes the rows older than ttl.
+        """
+        if self.ttl is None:
+            return
+        limit = time.monotonic() - self.ttl
+        while self:
+            key = next(iter(self))
+            if self.stored[key] > limit:
+                break
+            del self[key]
+            self.evicted += 1
+
+    @staticmethod
+    def usage(rows: dict) -> dict:
+        """
+        Returns the number of rows and the approximate memory size in bytes
+        of a table, which may be a Table or a plain dictionary of rows. For
+        a Table, the number of evicted rows, the number of rows older than
+        ttl that are removed on the next store, and the policy are added.
+
+        The table is not changed, so it can be called from another thread
+        than the one that stores the rows.
+        """
+        items = list(rows.items())
+        size = sys.getsizeof(rows)
+        for key, row in items:
+            size += sys.getsizeof(key) + sys.getsizeof(row)
+            if isinstance(row, dict):
+                for value in row.values():
+                    size += sys.getsizeof(value)
+        result = {"rows": len(items), "bytes": size}
+        if isinstance(rows, Table):
+            expired = 0
+            if rows.ttl is not None:
+                limit = time.monotonic() - rows.ttl
+                expired = sum(1 for x in list(rows.stored.values()) if x <= limit)
+            result["expired"] = expired
+            result["evicted"] = rows.evicted
+            result["capacity"] = rows.capacity
+            result["ttl"] = rows.ttl
+
+        return result
+
+
 class MetaInstrument(type):
     market = dict()
 
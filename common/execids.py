@@ -0,0 +1,161 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Union
+
+
+class ExecutionIndex:
+    """
+    Execution IDs already recorded in var.database_table, kept in memory so
+    that history restore and live executions do not query the database for
+    every row.
+
+    The index is filled in two ways:
+
+    - ``cover()`` is called with all IDs of an account and market recorded
+      since a time. After that, any execution of this account and market
+      at or after this time is answered from memory alone: if its key is
+      not in the index, it is not in the database either.
+    - ``add()`` is called with the IDs found by one batched query for a
+      page of history rows, and ``mark_checked()`` with the IDs of the page
+      that were not found, so that rows outside the covered time are not
+      queried again one by one.
+
+    Keys are (execID, account), the same as DatabaseWriter uses for pending
+    rows. New executions are added when they are queued for writing.
+
+    Each key keeps the time of the execution, or the time it was added if
+    the execution time is not known. Once in EVICT_INTERVAL seconds the
+    keys older than RETAIN are forgotten, see evict(), so the index does
+    not grow with the trading history.
+    """
+
+    # Rows can be recorded with a slightly different time than the exchange
+    # reports on the next request, so the preload starts a bit earlier.
+    MARGIN = timedelta(days=1)
+    RETAIN = timedelta(days=7)
+    EVICT_INTERVAL = 60
+    keys = dict()
+    checked = dict()
+    covered = dict()
+    evicted = 0.0
+    lock = threading.Lock()
+
+    @staticmethod
+    def cover(account: int, market: str, since: datetime, execIDs: Iterable) -> None:
+        """
+        Adds the IDs recorded for the account and market since ``since`` and
+        marks this time range as fully known.
+        """
+        now = datetime.now(tz=timezone.utc)
+        with ExecutionIndex.lock:
+            for execID in execIDs:
+                ExecutionIndex.keys[(execID, account)] = now
+            current = ExecutionIndex.covered.get((account, market))
+            if current is None or since < current:
+                ExecutionIndex.covered[(account, market)] = since
+
+    @staticmethod
+    def add(execIDs: Iterable, account: int, times: Union[dict, None] = None) -> None:
+        """
+        Adds the IDs, ``times`` has the execution time of the execIDs where
+        it is known.
+        """
+        now = datetime.now(tz=timezone.utc)
+        with ExecutionIndex.lock:
+            for execID in execIDs:
+                key = (execID, account)
+                ExecutionIndex.keys[key] = _utc(times and times.get(execID), now)
+                ExecutionIndex.checked.pop(key, None)
+            ExecutionIndex._evict_expired(now)
+
+    @staticmethod
+    def discard(execID: str, account: int) -> None:
+        with ExecutionIndex.lock:
+            ExecutionIndex.keys.pop((execID, account), None)
+
+    @staticmethod
+    def mark_checked(
+        execIDs: Iterable, account: int, times: Union[dict, None] = None
+    ) -> None:
+        """
+        Remembers that the IDs were looked up and are not in the database.
+        """
+        now = datetime.now(tz=timezone.utc)
+        with ExecutionIndex.lock:
+            for execID in execIDs:
+                key = (execID, account)
+                ExecutionIndex.checked[key] = _utc(times and times.get(execID), now)
+            ExecutionIndex._evict_expired(now)
+
+    @staticmethod
+    def evict(before: datetime) -> None:
+        """
+        Forgets the IDs of the executions before ``before`` - MARGIN. The
+        covered times earlier than ``before`` are moved up to it, since the
+        executions between them are no longer all in the index.
+        """
+        with ExecutionIndex.lock:
+            ExecutionIndex._evict(before)
+
+    @staticmethod
+    def _evict_expired(now: datetime) -> None:
+        if time.monotonic() - ExecutionIndex.evicted < ExecutionIndex.EVICT_INTERVAL:
+            return
+        ExecutionIndex._evict(now - ExecutionIndex.RETAIN)
+
+    @staticmethod
+    def _evict(before: datetime) -> None:
+        ExecutionIndex.evicted = time.monotonic()
+        before = _utc(before, before)
+        limit = before - ExecutionIndex.MARGIN
+        for index in (ExecutionIndex.keys, ExecutionIndex.checked):
+            for key in [key for key, ttime in index.items() if ttime < limit]:
+                del index[key]
+        for key, since in ExecutionIndex.covered.items():
+            if _comparable(before, since) > since:
+                ExecutionIndex.covered[key] = _comparable(before, since)
+
+    @staticmethod
+    def lookup(
+        execID: str,
+        account: int,
+        market: str = "",
+        ttime: Union[datetime, None] = None,
+    ) -> Union[bool, None]:
+        """
+        Returns True if the execution is known, False if it is known to be
+        absent, and None if the database has to be queried.
+        """
+        key = (execID, account)
+        with ExecutionIndex.lock:
+            if key in ExecutionIndex.keys:
+                return True
+            if key in ExecutionIndex.checked:
+                return False
+            if market and isinstance(ttime, datetime):
+                since = ExecutionIndex.covered.get((account, market))
+                if since is not None and _comparable(ttime, since) >= since:
+                    return False
+
+        return None
+
+
+def _utc(ttime: Union[datetime, None], default: datetime) -> datetime:
+    """
+    Returns the time in UTC, naive times are taken as UTC, or the default
+    if the time is not known.
+    """
+    if not isinstance(ttime, datetime):
+        return default
+    if ttime.tzinfo is None:
+        return ttime.replace(tzinfo=timezone.utc)
+
+    return ttime
+
+
+def _comparable(ttime: datetime, since: datetime) -> datetime:
+    if (ttime.tzinfo is None) != (since.tzinfo is None):
+        return ttime.replace(tzinfo=since.tzinfo)
+
+    return ttime
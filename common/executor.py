@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from common.variables import Variables as var
+
+
+class BotExecutor:
+    """
+    Runs the strategy functions of bots in worker threads instead of a new
+    thread for every call.
+
+    Each bot has its own queue of calls, which are executed one after
+    another, so that run_bot() of the same bot never runs concurrently
+    with itself. A bot occupies at most one worker at a time and there are
+    as many workers as bots, so a bot that blocks in its strategy never
+    holds back the others.
+
+    If a call is submitted while the previous call of the bot is still
+    running, this is an overrun. What happens to the new call depends on
+    the policy of the bot, which is the ``overrun`` bot parameter set in
+    strategy.py:
+
+    "skip"
+        The call is dropped. The default for the calls on the closing of
+        a bar, since the bot will get the next bar anyway.
+    "queue"
+        The call is added to the queue of the bot and executed after the
+        running one. At most MAX_QUEUE calls are kept, further calls are
+        dropped.
+
+    The execution time of every call is added to the histogram of the bot,
+    see statistics().
+    """
+
+    MAX_QUEUE = 10
+    POLICY = "skip"
+    # Upper limits of the execution time histogram buckets, in seconds.
+    BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60, float("inf"))
+    lock = threading.Lock()
+    ready = queue.Queue()
+    bots = dict()
+    policies = dict()
+    threads = list()
+    processes = None
+
+    @staticmethod
+    def _bot(bot_name: str) -> dict:
+        if bot_name not in BotExecutor.bots:
+            BotExecutor.bots[bot_name] = {
+                "calls": deque(),
+                "active": False,
+                "started": 0,
+                "count": 0,
+                "total": 0,
+                "max": 0,
+                "overruns": 0,
+                "skipped": 0,
+                "histogram": [0] * len(BotExecutor.BUCKETS),
+            }
+
+        return BotExecutor.bots[bot_name]
+
+    @staticmethod
+    def set_policy(bot_name: str, policy: str) -> None:
+        """
+        Sets the overrun policy of the bot, "skip" or "queue". Called when
+        strategy.py of the bot is loaded.
+        """
+        if policy not in ("skip", "queue"):
+            raise ValueError("Unknown overrun policy: " + str(policy))
+        BotExecutor.policies[bot_name] = policy
+
+    @staticmethod
+    def submit(
+        bot_name: str, function: Callable, args: tuple = (), policy: str = None
+    ) -> bool:
+        """
+        Adds a call to the queue of the bot.
+
+        Parameters
+        ----------
+        bot_name: str
+            Bot name.
+        function: Callable
+            The function to call, such as service.call_bot_function.
+        args: tuple
+            Arguments of the function.
+        policy: str
+            Overrun policy of this call. If omitted, the policy of the bot.
+
+        Returns
+        -------
+        bool
+            False if the call was dropped because of an overrun.
+        """
+        if policy is None:
+            policy = BotExecutor.policies.get(bot_name, BotExecutor.POLICY)
+        with BotExecutor.lock:
+            bot = BotExecutor._bot(bot_name)
+            if bot["active"]:
+                bot["overruns"] += 1
+                if policy == "skip" or len(bot["calls"]) >= BotExecutor.MAX_QUEUE:
+                    bot["skipped"] += 1
+                    var.logger.warning(
+                        "Bot "
+                        + bot_name
+                        + " is still running after "
+                        + str(round(time.monotonic() - bot["started"], 3))
+                        + " sec, the call is skipped."
+                    )
+                    return False
+                bot["calls"].append((function, args))
+            else:
+                bot["calls"].append((function, args))
+                bot["active"] = True
+                bot["started"] = time.monotonic()
+                BotExecutor.ready.put(bot_name)
+        BotExecutor.start()
+
+        return True
+
+    @staticmethod
+    def start() -> None:
+        """
+        Adds workers up to the number of bots that have submitted calls.
+        """
+        with BotExecutor.lock:
+            while len(BotExecutor.threads) < len(BotExecutor.bots):
+                thread = threading.Thread(target=BotExecutor._run, daemon=True)
+                BotExecutor.threads.append(thread)
+                thread.start()
+
+    @staticmethod
+    def _run() -> None:
+        while True:
+            bot_name = BotExecutor.ready.get()
+            with BotExecutor.lock:
+                bot = BotExecutor._bot(bot_name)
+                if not bot["calls"]:
+                    bot["active"] = False
+                    continue
+                function, args = bot["calls"].popleft()
+                bot["started"] = time.monotonic()
+            try:
+                function(*args)
+            except Exception as exception:
+                var.logger.error(
+                    "Bot " + bot_name + " executor error: " + str(exception)
+                )
+            finally:
+                duration = time.monotonic() - bot["started"]
+                with BotExecutor.lock:
+                    BotExecutor._record(bot, duration)
+                    if bot["calls"]:
+                        # The bot goes to the end of the line, so that a bot
+                        # with many queued calls does not hold the worker.
+                        BotExecutor.ready.put(bot_name)
+                    else:
+                        bot["active"] = False
+
+    @staticmethod
+    def _record(bot: dict, duration: float) -> None:
+        bot["count"] += 1
+        bot["total"] += duration
+        if duration > bot["max"]:
+            bot["max"] = duration
+        for num, limit in enumerate(BotExecutor.BUCKETS):
+            if duration <= limit:
+                bot["histogram"][num] += 1
+                break
+
+    @staticmethod
+    def discard(bot_name: str) -> None:
+        """
+        Drops the queued calls of the bot, e.g. when the bot is deleted.
+        The running call, if any, is not interrupted.
+        """
+        with BotExecutor.lock:
+            if bot_name in BotExecutor.bots:
+                BotExecutor.bots[bot_name]["calls"].clear()
+
+    @staticmethod
+    def statistics(bot_name: str) -> dict:
+        """
+        Returns the execution statistics of the bot: the number of calls,
+        total, average and maximum time in seconds, the number of overruns
+        and skipped calls, and the histogram as a dictionary with the upper
+        limit of each bucket as the key.
+        """
+        with BotExecutor.lock:
+            bot = BotExecutor._bot(bot_name)
+            return {
+                "count": bot["count"],
+                "total": bot["total"],
+                "average": bot["total"] / bot["count"] if bot["count"] else 0,
+                "max": bot["max"],
+                "overruns": bot["overruns"],
+                "skipped": bot["skipped"],
+                "queued": len(bot["calls"]),
+                "histogram": dict(zip(BotExecutor.BUCKETS, bot["histogram"])),
+            }
+
+    @staticmethod
+    def compute(function: Callable, *args, **kwargs):
+        """
+        Runs the function in a separate process and returns its result.
+
+        The strategy itself works with orders and market data of this
+        process, so it always runs in a thread, but a CPU-heavy
+        calculation inside it can be moved to a process pool, where it
+        does not hold the GIL needed by the websocket threads. The
+        function and its arguments must be picklable, i.e. the function
+        must be defined at the module level.
+
+        Examples
+        --------
+        kline = Bybit["BTCUSDT"].add_kline()
+
+        def optimize(prices: array) -> float:
+            ...
+
+        def run_bot():
+            level = BotExecutor.compute(optimize, kline.open_bid[-500:])
+
+        A slice of a kline column is array.array, which is picklable.
+        """
+        with BotExecutor.lock:
+            if BotExecutor.processes is None:
+                BotExecutor.processes = ProcessPoolExecutor()
+            processes = BotExecutor.processes
+
+        return processes.submit(function, *args, **kwargs).result()
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Stops the process pool, if it was started.
+        """
+        with BotExecutor.lock:
+            processes, BotExecutor.processes = BotExecutor.processes, None
+        if processes is not None:
+            processes.shutdown(wait=False, cancel_futures=True)
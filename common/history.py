@@ -0,0 +1,258 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Union
+
+from dotenv import dotenv_values, set_key
+
+import services as service
+from api.api import WS
+from api.setup import Markets
+from common.variables import Variables as var
+from common.writer import DatabaseWriter
+from functions import Function
+
+
+class HistoryRestorer:
+    """
+    Restores the trading history of a market from the time it was last
+    restored up to now.
+
+    The period is split into time windows that are downloaded in parallel
+    by no more than WORKERS[market] threads, so that the exchange rate
+    limits are respected. Each window is paged through by PAGE rows as
+    before. The windows are processed in the order of time: the rows of a
+    window are sorted by transactTime and passed to Function.transaction()
+    only after all the previous windows are processed. At most
+    WORKERS[market] windows are downloaded ahead of the one being
+    processed, the next window is submitted when one has been processed,
+    so the rows waiting in memory do not grow with the period.
+
+    Progress is saved in the <database table>_checkpoint table after each
+    window, in the same DatabaseWriter queue as the executions of the
+    window, so the checkpoint is never committed ahead of the executions.
+    An interrupted restore resumes from the last processed window. The
+    checkpoint remembers the time that was in the .env.History file when
+    it was saved, so if the user changes the time in the file, the history
+    is restored from the new time.
+    """
+
+    PAGE = 500
+    WORKERS = {"Bitmex": 2, "Bybit": 2, "Deribit": 2}
+    WINDOWS_PER_WORKER = 4
+    MIN_WINDOW = timedelta(days=1)
+    DEFAULT_TIME = "2000-01-01 00:00:00"
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, ws: Markets) -> None:
+        self.ws = ws
+        self.table = var.database_table + "_checkpoint"
+        self.origin = HistoryRestorer.DEFAULT_TIME
+
+    def run(self) -> str:
+        """
+        Returns "success", "empty" or the error type.
+        """
+        ws = self.ws
+        end = datetime.now(tz=timezone.utc)
+        self.origin = self.requested_time()
+        start = self.checkpoint()
+        if start is None:
+            start = self.parse(self.origin)
+        if start > end:
+            var.logger.warning(
+                ws.name
+                + ": the trading history checkpoint is greater than the current "
+                + "time. Assigned time: "
+                + HistoryRestorer.DEFAULT_TIME
+            )
+            start = self.parse(HistoryRestorer.DEFAULT_TIME)
+        service.preload_executions(account=ws.user_id, market=ws.name, since=start)
+        windows = self.windows(start=start, end=end)
+        workers = HistoryRestorer.WORKERS.get(ws.name, 1)
+        received = 0
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="history_" + ws.name
+        ) as executor:
+            futures = deque(
+                executor.submit(self.fetch, window_start, window_end)
+                for window_start, window_end in windows[:workers]
+            )
+            for num in range(len(windows)):
+                rows = futures.popleft().result()
+                if not isinstance(rows, list):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return service.unexpected_error(ws)
+                received += len(rows)
+                rows.sort(key=lambda x: x["transactTime"])
+                for page in range(0, len(rows), HistoryRestorer.PAGE):
+                    self.process(rows[page : page + HistoryRestorer.PAGE])
+                if num < len(windows) - 1:
+                    self.save_checkpoint(windows[num][1])
+                elif rows:
+                    # The last window ends now, so only the time of the
+                    # last execution is certainly complete.
+                    self.save_checkpoint(rows[-1]["transactTime"])
+                if num + workers < len(windows):
+                    futures.append(executor.submit(self.fetch, *windows[num + workers]))
+        if received:
+            return "success"
+        message = ws.name + ": Empty trading history."
+        var.logger.warning(message)
+        var.queue_info.put(
+            {
+                "market": ws.name,
+                "message": message,
+                "time": datetime.now(tz=timezone.utc),
+                "warning": "warning",
+            }
+        )
+
+        return "empty"
+
+    def windows(self, start: datetime, end: datetime) -> list:
+        """
+        Splits the period into windows of at least MIN_WINDOW each.
+        """
+        number = HistoryRestorer.WORKERS.get(self.ws.name, 1)
+        number *= HistoryRestorer.WINDOWS_PER_WORKER
+        length = max((end - start) / number, HistoryRestorer.MIN_WINDOW)
+        windows = list()
+        while start < end:
+            windows.append((start, min(start + length, end)))
+            start += length
+        if not windows:
+            windows.append((start, end))
+
+        return windows
+
+    def fetch(self, start: datetime, end: datetime) -> Union[list, str]:
+        """
+        Downloads the window by PAGE rows, each next page starts from the
+        time of the last row of the previous one.
+        """
+        rows = list()
+        while True:
+            history = WS.trading_history(
+                self.ws, histCount=HistoryRestorer.PAGE, start_time=start, end_time=end
+            )
+            if not isinstance(history, dict) or not isinstance(history["data"], list):
+                return history if isinstance(history, str) else "FATAL"
+            rows += history["data"]
+            if history["length"] < HistoryRestorer.PAGE or not history["data"]:
+                return rows
+            start = history["data"][-1]["transactTime"]
+
+    def process(self, rows: list) -> None:
+        ws = self.ws
+        service.prefetch_executions(rows=rows, account=ws.user_id, market=ws.name)
+        for row in rows:
+            if not service.execution_exists(
+                execID=row["execID"],
+                account=ws.user_id,
+                market=ws.name,
+                ttime=row["transactTime"],
+            ):
+                Function.transaction(ws, row=row, info="History")
+
+    def checkpoint(self) -> Union[datetime, None]:
+        """
+        Returns the time saved by the last restore, or None if there is no
+        checkpoint or the time in the .env.History file has been changed
+        since the checkpoint was saved.
+        """
+        data = service.select_database(
+            "select TTIME, ORIGIN from %s where MARKET = ? and ACCOUNT = ?"
+            % self.table,
+            (self.ws.name, self.ws.user_id),
+            rows="tuple",
+        )
+        if data:
+            if data[0][1] != self.origin:
+                var.logger.info(
+                    self.ws.name
+                    + ": the time in the "
+                    + self.history_file()
+                    + " file has been changed, the trading history is "
+                    + "restored from "
+                    + self.origin
+                )
+                return
+            try:
+                return self.parse(data[0][0])
+            except (TypeError, ValueError):
+                var.logger.warning(
+                    self.ws.name + ": incorrect trading history checkpoint."
+                )
+
+    def save_checkpoint(self, tm: datetime) -> None:
+        if self.ws.logNumFatal:
+            return
+        query = (
+            "insert or replace into %s (MARKET, ACCOUNT, TTIME, ORIGIN) " % self.table
+            + "VALUES (?,?,?,?)"
+        )
+        DatabaseWriter.put(
+            query=query,
+            values=[
+                self.ws.name,
+                self.ws.user_id,
+                tm.strftime(HistoryRestorer.TIME_FORMAT),
+                self.origin,
+            ],
+        )
+
+    def history_file(self) -> str:
+        if var.env["TESTNET"] == "YES":
+            return ".env.History.testnet"
+        else:
+            return ".env.History"
+
+    def requested_time(self) -> str:
+        """
+        The time from which the user wants the history of the market to be
+        restored, taken from the .env.History file. The file is only
+        written to when the market is missing there, the progress itself
+        is kept in the checkpoint table.
+        """
+        his = self.history_file()
+        his_file = Path(his)
+        _time = HistoryRestorer.DEFAULT_TIME
+        if not his_file.exists():
+            var.logger.warning(
+                "The " + his + " not found. The " + his + " file has been created."
+            )
+            his_file.touch(mode=0o600)
+        dotenv_data = dotenv_values(his_file)
+        if self.ws.name not in dotenv_data:
+            var.logger.warning(
+                "No time found for "
+                + self.ws.name
+                + " from "
+                + his
+                + ". Assigned time: "
+                + _time
+            )
+            set_key(dotenv_path=his_file, key_to_set=self.ws.name, value_to_set=_time)
+            return _time
+        try:
+            self.parse(dotenv_data[self.ws.name])
+        except (TypeError, ValueError):
+            var.logger.warning(
+                "Time format for "
+                + self.ws.name
+                + " from the "
+                + his
+                + " is incorrect. Assigned time: "
+                + _time
+            )
+            return _time
+
+        return dotenv_data[self.ws.name]
+
+    @staticmethod
+    def parse(tm: str) -> datetime:
+        return datetime.strptime(tm[:19], HistoryRestorer.TIME_FORMAT).replace(
+            tzinfo=timezone.utc
+        )
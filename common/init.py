@@ -1,21 +1,20 @@
 import os
 import sqlite3
 from datetime import datetime, timezone
-from pathlib import Path
 from sqlite3 import Error
 
-from dotenv import dotenv_values, set_key
-
 import services as service
 from api.api import WS
 from api.init import Variables
 from api.setup import Markets
+from common.history import HistoryRestorer
 from common.variables import Variables as var
-from display.functions import info_display
-from display.variables import TreeTable
-from display.variables import Variables as disp
 from functions import Function
 
+if not var.headless:
+    from display.variables import TreeTable
+    from display.variables import Variables as disp
+
 var.working_directory = os.path.abspath(os.getcwd())
 
 
@@ -24,21 +23,26 @@ class Init(WS, Variables):
         self.connect_count += 1
         self.account_disp = "Acc." + str(self.user_id)
 
-    def load_trading_history(self: Markets) -> None:
+    def load_trading_history(self: Markets) -> str:
         """
         This function receives trading history data through tade_history()
         methods in files called agent.py. Each exchange has its own API
         features, so the methods differ significantly from each other.
 
-        Trade_history() reads data in 500-line chunks, starting from the date
-        specified in the history.ini file. If trade_history() returned less
-        than 500 rows, then this is a signal that the entire trading history
-        has been received and this function ends its work. The history.ini
-        file records the time of the last transaction.
+        The period since the last restore is split into time windows that
+        are downloaded in parallel and processed in the order of time, see
+        HistoryRestorer in common/history.py. Within a window,
+        trade_history() reads data in 500-line chunks. If trade_history()
+        returned less than 500 rows, then this is a signal that the window
+        has been received. The progress is saved in the
+        <database table>_checkpoint table after each window.
 
         If the row with execID already exists in the database, then it is
         skipped, otherwise it is processed in the transaction() in
-        functions.py and then written to the database.
+        functions.py and then written to the database. The execIDs recorded
+        since the start time are preloaded into the ExecutionIndex, and the
+        rest of each page is looked up with one query, so the rows are not
+        checked against the database one by one.
 
         The data obtained from different exchanges have unified values:
 
@@ -60,119 +64,7 @@ class Init(WS, Variables):
         "execType": str             Executed type: Trade, Funding
         "execFee": float            Executed trading fee
         """
-        tm = datetime.now(tz=timezone.utc)
-        if var.env["TESTNET"] == "YES":
-            his = ".env.History.testnet"
-        else:
-            his = ".env.History"
-        his_file = Path(his)
-        _time = "2000-01-01 00:0:00"
-        dotenv_data = dotenv_values(his_file)
-        tm = datetime.now(tz=timezone.utc)
-        if not dotenv_data:
-            var.logger.warning(
-                "The " + his + " not found. The " + his + " file has been created."
-            )
-            his_file.touch(mode=0o600)
-        if self.name not in dotenv_data:
-            var.logger.warning(
-                "No time found for "
-                + self.name
-                + " from "
-                + his
-                + ". Assigned time: "
-                + _time
-            )
-            set_key(
-                dotenv_path=his_file,
-                key_to_set=self.name,
-                value_to_set=_time,
-            )
-            dotenv_data = dotenv_values(his_file)
-        try:
-            last_history_time = datetime.strptime(
-                dotenv_data[self.name], "%Y-%m-%d %H:%M:%S"
-            )
-        except ValueError:
-            var.logger.warning(
-                "Time format for "
-                + self.name
-                + " from the "
-                + his
-                + " is incorrect. Assigned time: "
-                + _time
-            )
-            last_history_time = datetime.strptime(_time, "%Y-%m-%d %H:%M:%S")
-            set_key(
-                dotenv_path=his_file,
-                key_to_set=self.name,
-                value_to_set=_time,
-            )
-        last_history_time = last_history_time.replace(tzinfo=timezone.utc)
-        if last_history_time > tm:
-            var.logger.warning(
-                "The time in the "
-                + his
-                + " file is greater than the current time. Assigned time: "
-                + _time
-            )
-            set_key(
-                dotenv_path=his_file,
-                key_to_set=self.name,
-                value_to_set=_time,
-            )
-            last_history_time = datetime.strptime(_time, "%Y-%m-%d %H:%M:%S")
-            last_history_time = last_history_time.replace(tzinfo=timezone.utc)
-
-        count_val = 500
-        history = WS.trading_history(
-            self, histCount=count_val, start_time=last_history_time
-        )
-        his_data = history["data"]
-        if isinstance(his_data, list):
-            if his_data:
-                while his_data:
-                    for row in his_data:
-                        data = service.select_database(  # read_database
-                            "select EXECID from %s where EXECID='%s' and account=%s and market='%s'"
-                            % (
-                                var.database_table,
-                                row["execID"],
-                                self.user_id,
-                                self.name,
-                            ),
-                        )
-                        if not data:
-                            Function.transaction(self, row=row, info="History")
-                    last_history_time = his_data[-1]["transactTime"]
-                    if not self.logNumFatal:
-                        set_key(
-                            dotenv_path=his,
-                            key_to_set=self.name,
-                            value_to_set=str(last_history_time)[:19],
-                        )
-                    if history["length"] < count_val:
-                        return "success"
-                    history = WS.trading_history(
-                        self, histCount=count_val, start_time=last_history_time
-                    )
-                    his_data = history["data"]
-                    if not isinstance(his_data, list):
-                        return service.unexpected_error(self)
-        else:
-            return service.unexpected_error(self)
-        message = self.name + ": Empty trading history."
-        var.logger.warning(message)
-        var.queue_info.put(
-            {
-                "market": self.name,
-                "message": message,
-                "time": datetime.now(tz=timezone.utc),
-                "warning": "warning",
-            }
-        )
-
-        return "empty"
+        return HistoryRestorer(self).run()
 
     def account_balances(self: Markets) -> None:
         """
@@ -183,8 +75,10 @@ class Init(WS, Variables):
         """
         data = service.select_database(
             "select SYMBOL, TICKER, CATEGORY from "
-            + "%s where ACCOUNT=%s and MARKET='%s' group by SYMBOL, CATEGORY"
-            % (var.database_table, self.user_id, self.name),
+            + "%s where ACCOUNT = ? and MARKET = ? group by SYMBOL, CATEGORY"
+            % var.database_table,
+            (self.user_id, self.name),
+            flush=True,
         )
         if isinstance(data, list):
             symbols = list(map(lambda x: (x["SYMBOL"], self.name), data))
@@ -200,15 +94,13 @@ class Init(WS, Variables):
             sql = (
                 "select DISTINCT(CURRENCY) from "
                 + var.database_table
-                + " where MARKET = '"
-                + self.name
-                + "' AND ACCOUNT = "
-                + str(self.user_id)
+                + " where MARKET = ? AND ACCOUNT = ?"
             )
-            data = service.select_database(sql)
+            data = service.select_database(sql, (self.name, self.user_id))
             for cur in data:
                 currency = cur["CURRENCY"]
                 union = ""
+                params = list()
                 sql = (
                     "select sum(commiss) commiss, sum(sumreal) sumreal, "
                     + "sum(funding) funding from ("
@@ -221,33 +113,23 @@ class Init(WS, Variables):
                         + "IFNULL(sum(SUMREAL),0.0) sumreal, IFNULL((select "
                         + "sum(COMMISS) from "
                         + var.database_table
-                        + " where SIDE = 'Fund' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and MARKET = '"
-                        + self.name
-                        + "' and CURRENCY = '"
-                        + currency
-                        + "' and SYMBOL = '"
-                        + symbol[0]
-                        + "' and CATEGORY = '"
-                        + instrument.category
-                        + "'),0.0) funding from "
+                        + " where SIDE = 'Fund' and ACCOUNT = ? and MARKET = ?"
+                        + " and CURRENCY = ? and SYMBOL = ? and CATEGORY = ?"
+                        + "),0.0) funding from "
                         + var.database_table
-                        + " where SIDE <> 'Fund' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and MARKET = '"
-                        + self.name
-                        + "' and CURRENCY = '"
-                        + currency
-                        + "' and SYMBOL = '"
-                        + symbol[0]
-                        + "' and CATEGORY = '"
-                        + instrument.category
-                        + "'"
+                        + " where SIDE <> 'Fund' and ACCOUNT = ? and MARKET = ?"
+                        + " and CURRENCY = ? and SYMBOL = ? and CATEGORY = ?"
                     )
+                    params += [
+                        self.user_id,
+                        self.name,
+                        currency,
+                        symbol[0],
+                        instrument.category,
+                    ] * 2
                     union = "union "
                 sql += ") T"
-                data = service.select_database(sql)
+                data = service.select_database(sql, params)
                 settlCurrency = (currency, self.name)
                 self.Result[settlCurrency].commission = float(data[0]["commiss"])
                 self.Result[settlCurrency].funding = float(data[0]["funding"])
@@ -280,14 +162,18 @@ class Init(WS, Variables):
                 cl_id, emi = service.get_clOrdID(row=val)
                 if cl_id == 0:
                     cl_id = service.set_clOrdID()
-                    info_display(
-                        self.name,
-                        "Outside placement: price="
-                        + str(val["price"])
-                        + " side="
-                        + val["side"]
-                        + ". Assigned clOrdID="
-                        + cl_id,
+                    var.queue_info.put(
+                        {
+                            "market": self.name,
+                            "message": "Outside placement: price="
+                            + str(val["price"])
+                            + " side="
+                            + val["side"]
+                            + ". Assigned clOrdID="
+                            + cl_id,
+                            "time": datetime.now(tz=timezone.utc),
+                            "warning": None,
+                        }
                     )
                 if emi == "":
                     emi = service.set_emi(symbol=val["symbol"])
@@ -299,21 +185,22 @@ class Init(WS, Variables):
     def load_database(self: Markets) -> None:
         """
         Download the latest trades and funding data from the database (if any)
+        into the Trades and Funding tables. There are no tables in the
+        headless mode, only the account is checked.
         """
-        if self.user_id:
+        if not self.user_id:
+            self.logNumFatal = "SETUP"  # Reboot
+        elif not var.headless:
             sql = (
                 "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, QTY,"
                 + "PRICE, TTIME, COMMISS from "
                 + var.database_table
-                + " where SIDE = 'Fund' and ACCOUNT = "
-                + str(self.user_id)
-                + " and MARKET = '"
-                + self.name
-                + "' "
-                + "order by TTIME desc limit "
-                + str(disp.table_limit)
+                + " where SIDE = 'Fund' and ACCOUNT = ? and MARKET = ?"
+                + " order by TTIME desc limit ?"
+            )
+            data = service.select_database(
+                sql, (self.user_id, self.name, disp.table_limit)
             )
-            data = service.select_database(sql)
             rows = list()
             for val in data:
                 val["SYMBOL"] = (val["SYMBOL"], self.name)
@@ -334,15 +221,12 @@ class Init(WS, Variables):
                 "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, ABS(QTY) as QTY,"
                 + "TRADE_PRICE, TTIME, COMMISS, SUMREAL from "
                 + var.database_table
-                + " where SIDE <> 'Fund' and ACCOUNT = "
-                + str(self.user_id)
-                + " and MARKET = '"
-                + self.name
-                + "' "
-                + "order by TTIME desc limit "
-                + str(disp.table_limit)
+                + " where SIDE <> 'Fund' and ACCOUNT = ? and MARKET = ?"
+                + " order by TTIME desc limit ?"
+            )
+            data = service.select_database(
+                sql, (self.user_id, self.name, disp.table_limit)
             )
-            data = service.select_database(sql)
             rows = list()
             for val in data:
                 val["SYMBOL"] = (val["SYMBOL"], self.name)
@@ -359,8 +243,6 @@ class Init(WS, Variables):
                     market=values[indx_market],
                     configure=values[indx_side],
                 )
-        else:
-            self.logNumFatal = "SETUP"  # Reboot
 
 
 def setup_database_connecion() -> None:
@@ -369,6 +251,11 @@ def setup_database_connecion() -> None:
         var.connect_sqlite.row_factory = sqlite3.Row
         var.cursor_sqlite = var.connect_sqlite.cursor()
         var.error_sqlite = Error
+        # Write-ahead logging lets the DatabaseWriter thread commit while
+        # the database is being read, and with synchronous=NORMAL a commit
+        # does not wait for the disk sync of every transaction.
+        var.connect_sqlite.execute("PRAGMA journal_mode=WAL")
+        var.connect_sqlite.execute("PRAGMA synchronous=NORMAL")
 
         sql_create_robots = """
         CREATE TABLE IF NOT EXISTS robots (
@@ -477,6 +364,115 @@ def create_table_for_trades(table_name):
             )
             % (table_name, table_name)
         )
+        create_summary_for_trades(table_name)
+        var.cursor_sqlite.execute(
+            "CREATE TABLE IF NOT EXISTS %s_checkpoint (MARKET varchar(20) NOT NULL, "
+            % table_name
+            + "ACCOUNT int NOT NULL, TTIME datetime NOT NULL, "
+            + "ORIGIN varchar(20) DEFAULT NULL, PRIMARY KEY (MARKET, ACCOUNT))"
+        )
     except Exception as error:
         var.logger.error(error)
         raise
+
+
+def create_summary_for_trades(table_name):
+    """
+    Creates the <table_name>_summary table with one line per EMI, MARKET,
+    ACCOUNT and SYMBOL. The lines are kept up to date by triggers on
+    inserts, updates and deletes of the trades table, so that the bot
+    positions and results are read at startup without grouping the whole
+    trades table. NUM is the number of rows, TRADES the number of non-Fund
+    rows; POS, VOL, SUMREAL and COMMISS are sums over trades, FUND_SUMREAL
+    and FUNDING over Fund rows. LTIME only increases: after an update or
+    delete it is not recalculated.
+    """
+    summary = table_name + "_summary"
+    exists = var.cursor_sqlite.execute(
+        "select name from sqlite_master where type = 'table' and name = ?",
+        (summary,),
+    ).fetchall()
+    var.cursor_sqlite.execute(
+        """
+        CREATE TABLE IF NOT EXISTS %s (
+        EMI varchar(20) DEFAULT NULL,
+        MARKET varchar(20) DEFAULT NULL,
+        ACCOUNT int DEFAULT 0,
+        SYMBOL varchar(40) DEFAULT NULL,
+        TICKER varchar(40) DEFAULT NULL,
+        CATEGORY varchar(20) DEFAULT NULL,
+        CURRENCY varchar(10) DEFAULT NULL,
+        NUM int DEFAULT 0,
+        TRADES int DEFAULT 0,
+        POS decimal(20,8) DEFAULT 0,
+        VOL decimal(20,8) DEFAULT 0,
+        SUMREAL decimal(30,12) DEFAULT 0,
+        COMMISS decimal(30,16) DEFAULT 0,
+        FUND_SUMREAL decimal(30,12) DEFAULT 0,
+        FUNDING decimal(30,16) DEFAULT 0,
+        LTIME datetime DEFAULT NULL)"""
+        % summary
+    )
+    var.cursor_sqlite.execute(
+        "CREATE INDEX IF NOT EXISTS %s_KEY ON %s (EMI, MARKET, ACCOUNT, SYMBOL)"
+        % (summary, summary)
+    )
+
+    def key(row: str) -> str:
+        return (
+            "EMI IS {row}.EMI and MARKET IS {row}.MARKET and ACCOUNT IS "
+            + "{row}.ACCOUNT and SYMBOL IS {row}.SYMBOL"
+        ).format(row=row)
+
+    def add(row: str, sign: str) -> str:
+        """
+        Adds (sign "+") or subtracts (sign "-") the row to its summary line.
+        """
+        columns = [
+            ("TRADES", "0", "1"),
+            ("POS", "0", "ifnull({row}.QTY, 0)"),
+            ("VOL", "0", "abs(ifnull({row}.QTY, 0))"),
+            ("SUMREAL", "0", "ifnull({row}.SUMREAL, 0)"),
+            ("COMMISS", "0", "ifnull({row}.COMMISS, 0)"),
+            ("FUND_SUMREAL", "ifnull({row}.SUMREAL, 0)", "0"),
+            ("FUNDING", "ifnull({row}.COMMISS, 0)", "0"),
+        ]
+        values = ["NUM = NUM " + sign + " 1"]
+        for column, fund, trade in columns:
+            values.append(
+                "%s = %s %s case when {row}.SIDE = 'Fund' then %s else %s end"
+                % (column, column, sign, fund, trade)
+            )
+        if sign == "+":
+            values.append(
+                "TICKER = {row}.TICKER, CATEGORY = {row}.CATEGORY, "
+                + "CURRENCY = {row}.CURRENCY, LTIME = nullif(max(ifnull(LTIME, "
+                + "''), ifnull({row}.TTIME, '')), '')"
+            )
+
+        return (
+            "update {summary} set " + ", ".join(values) + " where " + key(row) + ";"
+        ).format(summary=summary, row=row)
+
+    insert = (
+        "insert into {summary} (EMI, MARKET, ACCOUNT, SYMBOL) select NEW.EMI, "
+        + "NEW.MARKET, NEW.ACCOUNT, NEW.SYMBOL where not exists (select 1 from "
+        + "{summary} where "
+        + key("NEW")
+        + ");"
+    ).format(summary=summary)
+    delete = ("delete from {summary} where " + key("OLD") + " and NUM <= 0;").format(
+        summary=summary
+    )
+    triggers = {
+        "INSERT": insert + add("NEW", "+"),
+        "DELETE": add("OLD", "-") + delete,
+        "UPDATE": add("OLD", "-") + delete + insert + add("NEW", "+"),
+    }
+    for event, body in triggers.items():
+        var.cursor_sqlite.execute(
+            "CREATE TRIGGER IF NOT EXISTS %s_%s AFTER %s ON %s BEGIN %s END"
+            % (summary, event, event, table_name, body)
+        )
+    if not exists:
+        service.rebuild_summary(table_name)
@@ -100,6 +100,11 @@ class ErrorMessage(str, Enum):
         + "and the {SYMBOL} has {NUMBER} records. The numbers should be "
         + "equal. Check the backtest data files. Exiting."
     )
+    BACKTEST_DATA_VALUE = (
+        "Backtest data error. The value `{VALUE}` in the {COLUMN} column on "
+        + "line {LINE} of {FILE} is not a number. Check the backtest data "
+        + "file. Exiting."
+    )
     BOT_KLINE_ERROR = (
         "Bot `{BOT_NAME}` is trying to get kline data for the {INSTRUMENT} "
         + "instrument with the status `{STATUS}`. Expiry date of the "
@@ -0,0 +1,319 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Union
+
+
+class Order(dict):
+    """
+    An open order in var.orders. Changing ``symbol``, ``side``, ``price``
+    or ``orderID`` updates the indexes of the OrderRegistry.
+    """
+
+    __slots__ = ("owner", "clOrdID", "index_keys")
+    INDEXED = ("symbol", "side", "price", "orderID")
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.owner = None
+        self.clOrdID = None
+        self.index_keys = None
+
+    def __setitem__(self, key, value) -> None:
+        owner = self.owner
+        if owner is None:
+            dict.__setitem__(self, key, value)
+        elif key not in Order.INDEXED:
+            dict.__setitem__(self, key, value)
+            owner.registry.version += 1
+        else:
+            with owner.registry.lock:
+                dict.__setitem__(self, key, value)
+                owner.reindex(self)
+
+    def _change(self, method: Callable, *args, **kwargs):
+        """
+        Calls the dict method that changes several keys or removes them and
+        updates the indexes.
+        """
+        owner = self.owner
+        if owner is None:
+            return method(self, *args, **kwargs)
+        with owner.registry.lock:
+            result = method(self, *args, **kwargs)
+            owner.reindex(self)
+
+        return result
+
+    def __delitem__(self, key) -> None:
+        self._change(dict.__delitem__, key)
+
+    def __ior__(self, other) -> "Order":
+        self._change(dict.update, other)
+
+        return self
+
+    def update(self, *args, **kwargs) -> None:
+        self._change(dict.update, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def pop(self, key, *default):
+        return self._change(dict.pop, key, *default)
+
+    def popitem(self) -> tuple:
+        return self._change(dict.popitem)
+
+    def clear(self) -> None:
+        self._change(dict.clear)
+
+    def __reduce__(self) -> tuple:
+        # A copy or an unpickled order does not belong to any bot.
+        return Order, (dict(self),)
+
+
+class BotOrders(OrderedDict):
+    """
+    Open orders of a bot, the key is clOrdID. In addition, the orders are
+    grouped by (symbol, side) in ``sides`` in the same sequence as in the
+    dictionary itself.
+
+    Parameters
+    ----------
+    registry: OrderRegistry
+        The registry this bot belongs to.
+    emi: str
+        Bot name.
+    """
+
+    def __init__(self, registry: "OrderRegistry", emi: str) -> None:
+        super().__init__()
+        self.registry = registry
+        self.emi = emi
+        self.sides = dict()
+
+    def __setitem__(self, clOrdID: str, order: dict) -> None:
+        if not isinstance(order, Order):
+            order = Order(order)
+        with self.registry.lock:
+            if clOrdID in self:
+                del self[clOrdID]
+            OrderedDict.__setitem__(self, clOrdID, order)
+            order.owner = self
+            order.clOrdID = clOrdID
+            self.registry.clOrdIDs[clOrdID] = self.emi
+            self.reindex(order)
+            self.registry.version += 1
+
+    def __delitem__(self, clOrdID: str) -> None:
+        with self.registry.lock:
+            order = OrderedDict.__getitem__(self, clOrdID)
+            OrderedDict.__delitem__(self, clOrdID)
+            side_key, price_key, orderID = order.index_keys
+            group = self.sides[side_key]
+            del group[clOrdID]
+            if not group:
+                del self.sides[side_key]
+            self.registry.unindex(order, price_key=price_key, orderID=orderID)
+            order.owner = None
+            order.index_keys = None
+            self.registry.version += 1
+
+    def pop(self, clOrdID: str, *default):
+        if clOrdID in self:
+            order = OrderedDict.__getitem__(self, clOrdID)
+            del self[clOrdID]
+            return order
+        if default:
+            return default[0]
+        raise KeyError(clOrdID)
+
+    def popitem(self, last: bool = True) -> tuple:
+        if not self:
+            raise KeyError("dictionary is empty")
+        clOrdID = next(reversed(self)) if last else next(iter(self))
+
+        return clOrdID, self.pop(clOrdID)
+
+    def clear(self) -> None:
+        with self.registry.lock:
+            for clOrdID in list(self):
+                del self[clOrdID]
+
+    def copy(self) -> OrderedDict:
+        return OrderedDict(self)
+
+    def __reduce__(self) -> tuple:
+        # A copy gets its own registry with copies of the orders, so that
+        # it is indexed and the orders of this bot stay in place.
+        return _restore_bot_orders, (self.emi, list(self.items()))
+
+    def move_to_end(self, clOrdID: str, last: bool = True) -> None:
+        with self.registry.lock:
+            OrderedDict.move_to_end(self, clOrdID, last)
+            order = OrderedDict.__getitem__(self, clOrdID)
+            side_key = order.index_keys[0]
+            group = self.sides[side_key]
+            del group[clOrdID]
+            if last:
+                group[clOrdID] = order
+            else:
+                self.sides[side_key] = {clOrdID: order}
+                self.sides[side_key].update(group)
+
+    def reindex(self, order: Order) -> None:
+        """
+        Moves the order in the indexes after its indexed fields change.
+        """
+        symbol, side = order.get("symbol"), order.get("side")
+        keys = (
+            (symbol, side),
+            (symbol, side, order.get("price")),
+            order.get("orderID"),
+        )
+        old = order.index_keys
+        if old is None or old[0] != keys[0]:
+            if old is not None:
+                group = self.sides[old[0]]
+                del group[order.clOrdID]
+                if not group:
+                    del self.sides[old[0]]
+            if keys[0] not in self.sides:
+                self.sides[keys[0]] = dict()
+            self.sides[keys[0]][order.clOrdID] = order
+        self.registry.reindex(order, old=old, new=keys)
+        order.index_keys = keys
+        self.registry.version += 1
+
+    def select(self, symbol: tuple, side: str = None) -> list:
+        """
+        Returns the orders for the symbol and side in the sequence of the
+        dictionary. Without the side both sides are returned.
+        """
+        with self.registry.lock:
+            if side:
+                return list(self.sides.get((symbol, side), dict()).values())
+
+            return [value for value in self.values() if value["symbol"] == symbol]
+
+
+class OrderRegistry(dict):
+    """
+    All open orders, var.orders: the key is the bot name (emi), the value
+    is BotOrders. Any OrderedDict assigned to a bot is converted into
+    BotOrders, and any order into Order, so that the indexes below are
+    updated whenever orders are added, removed or changed:
+
+    prices: dict
+        (symbol, side, price) - orders at the price level.
+    orderIDs: dict
+        orderID - order.
+    clOrdIDs: dict
+        clOrdID - bot name.
+
+    Thus, lookups by price level, orderID and clOrdID do not iterate over
+    the orders of all bots. ``version`` is incremented on every change, so
+    the display redraws the orders only if it has changed.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.RLock()
+        self.prices = dict()
+        self.orderIDs = dict()
+        self.clOrdIDs = dict()
+        self.version = 0
+
+    def __setitem__(self, emi: str, orders: dict) -> None:
+        with self.lock:
+            items = list(orders.items())
+            if emi in self:
+                del self[emi]
+            bot_orders = BotOrders(registry=self, emi=emi)
+            dict.__setitem__(self, emi, bot_orders)
+            for clOrdID, order in items:
+                bot_orders[clOrdID] = order
+
+    def __delitem__(self, emi: str) -> None:
+        with self.lock:
+            dict.__getitem__(self, emi).clear()
+            dict.__delitem__(self, emi)
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self) -> tuple:
+        return _restore_registry, (
+            {emi: list(orders.items()) for emi, orders in self.items()},
+        )
+
+    def reindex(self, order: Order, old: Union[tuple, None], new: tuple) -> None:
+        if old is not None:
+            if old[1] == new[1] and old[2] == new[2]:
+                return
+            self.unindex(order, price_key=old[1], orderID=old[2])
+        key = (order.owner.emi, order.clOrdID)
+        if new[1] not in self.prices:
+            self.prices[new[1]] = dict()
+        self.prices[new[1]][key] = order
+        self.orderIDs[new[2]] = order
+        self.clOrdIDs[order.clOrdID] = order.owner.emi
+
+    def unindex(self, order: Order, price_key: tuple, orderID: str) -> None:
+        level = self.prices.get(price_key)
+        if level is not None:
+            level.pop((order.owner.emi, order.clOrdID), None)
+            if not level:
+                del self.prices[price_key]
+        if self.orderIDs.get(orderID) is order:
+            del self.orderIDs[orderID]
+        if self.clOrdIDs.get(order.clOrdID) == order.owner.emi:
+            del self.clOrdIDs[order.clOrdID]
+
+    def level_qty(self, symbol: tuple, price: float) -> float:
+        """
+        Returns the sum of leavesQty of orders of both sides at the price.
+        """
+        qty = 0
+        with self.lock:
+            for side in ("Buy", "Sell"):
+                level = self.prices.get((symbol, side, price))
+                if level:
+                    for order in level.values():
+                        qty += order["leavesQty"]
+
+        return qty
+
+    def find_orderID(self, orderID: str) -> Union[Order, None]:
+        """
+        Returns the order with the orderID or None if not found.
+        """
+        with self.lock:
+            return self.orderIDs.get(orderID)
+
+    def find_clOrdID(self, clOrdID: str) -> Union[str, None]:
+        """
+        Returns the bot name of the order with the clOrdID or None if not
+        found.
+        """
+        with self.lock:
+            return self.clOrdIDs.get(clOrdID)
+
+
+def _restore_registry(bots: dict) -> OrderRegistry:
+    """
+    Builds a registry from the (clOrdID, order) lists of the bots, used by
+    copy, deepcopy and pickle.
+    """
+    registry = OrderRegistry()
+    for emi, items in bots.items():
+        registry[emi] = OrderedDict((clOrdID, Order(order)) for clOrdID, order in items)
+
+    return registry
+
+
+def _restore_bot_orders(emi: str, items: list) -> BotOrders:
+    return _restore_registry({emi: items})[emi]
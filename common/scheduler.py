@@ -0,0 +1,108 @@
+import heapq
+import threading
+import time
+
+
+class KlineScheduler:
+    """
+    Keeps the closing times of the current periods of klines in a heap, so
+    that the kline thread sleeps until the nearest one instead of checking
+    all symbols and timeframes every second.
+
+    The key of a kline is (market, symbol, timefr), the deadline is a
+    timestamp in seconds. A key has one valid deadline, schedule() replaces
+    it, the outdated heap entries are skipped when they come up.
+
+    OFFSET shifts the wake-up after the boundary by a fraction of a second,
+    e.g. to let the last trades of the period arrive. The difference
+    between the actual wake-up and the deadline is measured, see jitter().
+    """
+
+    OFFSET = 0.0
+    heap = list()
+    deadlines = dict()
+    condition = threading.Condition()
+    active = True
+    jitter_stats = {"count": 0, "last": 0, "max": 0, "total": 0}
+
+    @staticmethod
+    def schedule(key: tuple, deadline: float) -> None:
+        """
+        Sets the closing time of the current period of the kline.
+        """
+        with KlineScheduler.condition:
+            if KlineScheduler.deadlines.get(key) == deadline:
+                return
+            KlineScheduler.deadlines[key] = deadline
+            heapq.heappush(KlineScheduler.heap, (deadline, key))
+            if KlineScheduler.heap[0][0] == deadline:
+                KlineScheduler.condition.notify()
+
+    @staticmethod
+    def cancel(key: tuple) -> None:
+        with KlineScheduler.condition:
+            KlineScheduler.deadlines.pop(key, None)
+
+    @staticmethod
+    def stop() -> None:
+        """
+        Wakes up and releases the thread waiting in wait().
+        """
+        with KlineScheduler.condition:
+            KlineScheduler.active = False
+            KlineScheduler.condition.notify_all()
+
+    @staticmethod
+    def wait() -> list:
+        """
+        Waits for the nearest deadline and returns the keys of all klines
+        whose deadlines have come, in the order of the deadlines. The
+        returned keys are no longer scheduled until schedule() is called
+        for them again. An empty list is returned after stop().
+        """
+        with KlineScheduler.condition:
+            while KlineScheduler.active:
+                heap = KlineScheduler.heap
+                while heap and KlineScheduler.deadlines.get(heap[0][1]) != heap[0][0]:
+                    heapq.heappop(heap)
+                if not heap:
+                    KlineScheduler.condition.wait()
+                    continue
+                now = time.time()
+                timeout = heap[0][0] + KlineScheduler.OFFSET - now
+                if timeout > 0:
+                    KlineScheduler.condition.wait(timeout)
+                    continue
+                jitter = now - heap[0][0] - KlineScheduler.OFFSET
+                due = list()
+                while heap and heap[0][0] + KlineScheduler.OFFSET <= now:
+                    deadline, key = heapq.heappop(heap)
+                    if KlineScheduler.deadlines.get(key) == deadline:
+                        del KlineScheduler.deadlines[key]
+                        due.append(key)
+                if due:
+                    KlineScheduler._record(jitter)
+                    return due
+
+            return []
+
+    @staticmethod
+    def _record(jitter: float) -> None:
+        stats = KlineScheduler.jitter_stats
+        stats["count"] += 1
+        stats["last"] = jitter
+        stats["total"] += jitter
+        if jitter > stats["max"]:
+            stats["max"] = jitter
+
+    @staticmethod
+    def jitter() -> dict:
+        """
+        Returns the delay of the wake-ups after the deadlines in seconds:
+        the last, maximum and average values and the number of wake-ups.
+        """
+        with KlineScheduler.condition:
+            stats = KlineScheduler.jitter_stats.copy()
+        stats["average"] = stats["total"] / stats["count"] if stats["count"] else 0
+
+        return stats
@@ -0,0 +1,123 @@
+import os
+from collections import OrderedDict
+
+from dotenv import dotenv_values
+
+import services as service
+from api.setup import Default, MetaMarket
+from api.wscore import WsCore
+from common.variables import Variables as var
+
+
+class Settings:
+    """
+    Loads the .env.Settings and .env.Subscriptions files into var.env
+    without the settings page of the GUI, which is used in the headless
+    mode. The files are created and edited on the settings page, see
+    display/settings.py, here they are only read: missing values are taken
+    from the defaults, but the files are not changed.
+    """
+
+    COMMON = OrderedDict(
+        [
+            ("MARKET_LIST", ",".join(MetaMarket.names.keys())),
+            ("SQLITE_DATABASE", "tmatic.db"),
+            ("ORDER_BOOK_DEPTH", "orderBook 7"),
+            ("BOTTOM_FRAME", "Bots"),
+            ("REFRESH_RATE", "5"),
+            ("TESTNET", "YES"),
+            ("WEBSOCKET_CORE", "NO"),
+        ]
+    )
+    MARKET = [
+        "CONNECTED",
+        "HTTP_URL",
+        "WS_URL",
+        "API_KEY",
+        "API_SECRET",
+        "TESTNET_HTTP_URL",
+        "TESTNET_WS_URL",
+        "TESTNET_API_KEY",
+        "TESTNET_API_SECRET",
+    ]
+
+    @staticmethod
+    def load() -> bool:
+        """
+        Fills var.env, var.market_list and var.default_symbol and sets the
+        parameters, see apply().
+
+        Returns
+        -------
+        bool
+            False if the settings file does not exist.
+        """
+        if not os.path.isfile(var.settings):
+            return False
+        defaults = dict()
+        for name, value in Default.__members__.items():
+            defaults[name] = value.value
+        data = dotenv_values(var.settings)
+        for setting, value in Settings.COMMON.items():
+            var.env[setting] = data.get(setting, value)
+        market_list = var.env["MARKET_LIST"].split(",")
+        for market in MetaMarket.names.keys():
+            if market not in market_list:
+                market_list.append(market)
+        for market in market_list:
+            var.default_symbol[market] = (
+                defaults[f"{market}_DEFAULT_SYMBOL"],
+                market,
+            )
+            var.env[market] = dict()
+            for setting in Settings.MARKET:
+                key = f"{market}_{setting}"
+                if key in data:
+                    var.env[market][setting] = data[key].replace(f"_{market}", "")
+                elif setting == "CONNECTED":
+                    var.env[market][setting] = "YES"
+                else:
+                    var.env[market][setting] = defaults.get(key, "")
+            if var.env[market]["CONNECTED"] == "YES":
+                var.market_list.append(market)
+
+        # Symbol subscriptions
+
+        values = dict()
+        if os.path.isfile(var.subscriptions):
+            values = dotenv_values(var.subscriptions)
+        for market in market_list:
+            var.env[market]["SYMBOLS"] = list()
+            symbols = list()
+            sub = values.get(service.define_symbol_key(market=market)) or ""
+            for symb in sub.replace(",", " ").split():
+                if symb not in symbols:
+                    symbols.append(symb)
+            if not symbols:
+                symbols = [var.default_symbol[market][0]]
+            for symb in symbols:
+                symb = service.option_in_subscribed_symbol(symb, market)
+                var.env[market]["SYMBOLS"].append((symb, market))
+        Settings.apply()
+
+        return True
+
+    @staticmethod
+    def apply() -> None:
+        """
+        Sets the parameters that follow from var.env: the order book depth,
+        database, refresh rate, the trade table of the real or test
+        account and the websocket client. Shared by the GUI and headless
+        modes.
+        """
+        book_depth = var.env["ORDER_BOOK_DEPTH"].split(" ")
+        var.order_book_depth = book_depth[0]
+        var.db_sqlite = var.env["SQLITE_DATABASE"]
+        var.refresh_rate = min(max(100, int(1000 / int(var.env["REFRESH_RATE"]))), 1000)
+        if var.env["TESTNET"] == "YES":
+            var.database_table = var.database_test
+            var.platform_name = "Tmatic / testnet"
+        else:
+            var.database_table = var.database_real
+            var.platform_name = "Tmatic"
+        WsCore.ENABLED = var.env["WEBSOCKET_CORE"] == "YES"
@@ -7,6 +7,8 @@ from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Callable
 
+from common.orders import OrderRegistry
+
 
 class ListenLogger(logging.Filter):
     def filter(self, record):
@@ -114,9 +116,14 @@ class Variables:
     lock_kline_update = threading.Lock()
     lock_display = threading.Lock()
     sql_lock = threading.Lock()
+    sql_readers = threading.local()
+    # Read connections of all threads, closed by service.close().
+    sql_reader_connections = list()
     working_directory: str
     kline_update_active = True
-    orders = dict()
+    orders = OrderRegistry()
+    # Maximum number of kline periods returned by one request of any exchange.
+    kline_rows = 1000
     timeframe_human_format = OrderedDict(
         [
             ("1min", 1),
@@ -152,6 +159,12 @@ class Variables:
     selected_iid = dict()
     backtest = False
     backtest_symbols = list()
+    # Set by headless.py before the other modules are imported, so that the
+    # Tkinter display is not loaded.
+    headless = False
+    # Trading switch, "ON" or "OFF", <F9> in the GUI.
+    f9 = "OFF"
+    bot_orders_processing = False
     database_real = "real_trade"
     database_test = "test_trade"
     database_table: str
@@ -0,0 +1,220 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Union
+
+from common.variables import Variables as var
+
+
+class DatabaseWriter:
+    """
+    Writes rows to the SQLite database in a separate thread.
+
+    Rows are put in a queue and the thread groups them into transactions:
+    consecutive rows with the same query are written by a single
+    executemany() call, and the transaction is committed as soon as
+    BATCH_SIZE rows are collected or FLUSH_INTERVAL seconds have passed
+    since the first of them. This way restoring a long trading history
+    does not commit every execution separately.
+
+    Every row gets a Future, the result of which is None on success or an
+    error string, the same as insert_database() returns.
+
+    Keys of the rows that are not yet committed are kept in ``pending``,
+    so that a row can be found before it gets to the database.
+
+    If another process holds the database, the transaction is retried
+    every FLUSH_INTERVAL seconds, at most LOCKED_ATTEMPTS times, then the
+    rows get the error.
+    """
+
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.2
+    LOCKED_ATTEMPTS = 50
+    rows = queue.Queue()
+    pending = set()
+    pending_lock = threading.Lock()
+    thread = None
+    thread_lock = threading.Lock()
+
+    @staticmethod
+    def put(query: str, values: list, key=None) -> Future:
+        """
+        Adds a row to the queue.
+
+        Parameters
+        ----------
+        query: str
+            Insert query with placeholders.
+        values: list
+            Values of the row.
+        key
+            Optional key of the row added to ``pending`` until the row is
+            committed.
+
+        Returns
+        -------
+        Future
+            Its result is None or the error string.
+        """
+        DatabaseWriter.start()
+        future = Future()
+        if key is not None:
+            with DatabaseWriter.pending_lock:
+                DatabaseWriter.pending.add(key)
+        DatabaseWriter.rows.put((query, values, key, future))
+
+        return future
+
+    @staticmethod
+    def is_pending(key) -> bool:
+        with DatabaseWriter.pending_lock:
+            return key in DatabaseWriter.pending
+
+    @staticmethod
+    def flush() -> None:
+        """
+        Waits until all rows put before the call are committed.
+        """
+        if DatabaseWriter.thread is None or not DatabaseWriter.rows.unfinished_tasks:
+            return
+        future = Future()
+        DatabaseWriter.rows.put((None, None, None, future))
+        future.result()
+
+    @staticmethod
+    def start() -> None:
+        with DatabaseWriter.thread_lock:
+            if DatabaseWriter.thread is None:
+                DatabaseWriter.thread = threading.Thread(
+                    target=DatabaseWriter._run, daemon=True
+                )
+                DatabaseWriter.thread.start()
+
+    @staticmethod
+    def _run() -> None:
+        while True:
+            batch = [DatabaseWriter.rows.get()]
+            deadline = time.monotonic() + DatabaseWriter.FLUSH_INTERVAL
+            # A row with query None is a flush() call, so the rows
+            # collected before it are written without waiting.
+            while batch[-1][0] is not None and len(batch) < DatabaseWriter.BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(DatabaseWriter.rows.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                DatabaseWriter._write(batch)
+            except Exception as ex:
+                err_str = f"Sqlite Error: {str(ex)}"
+                var.logger.error(err_str)
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_result(err_str)
+            finally:
+                with DatabaseWriter.pending_lock:
+                    for _, _, key, _ in batch:
+                        DatabaseWriter.pending.discard(key)
+                for _ in batch:
+                    DatabaseWriter.rows.task_done()
+
+    @staticmethod
+    def _write(batch: list) -> None:
+        groups = list()
+        for query, values, key, future in batch:
+            if query is None:
+                continue
+            if not groups or groups[-1][0] != query:
+                groups.append((query, list(), list()))
+            groups[-1][1].append(values)
+            groups[-1][2].append(future)
+        err_locked = 0
+        while True:
+            error = DatabaseWriter._commit(groups)
+            if error is None:
+                for _, _, futures in groups:
+                    for future in futures:
+                        future.set_result(None)
+                break
+            elif "database is locked" not in str(error):
+                DatabaseWriter._write_rows(groups)
+                break
+            else:
+                err_locked += 1
+                if not DatabaseWriter._wait_locked(err_locked):
+                    DatabaseWriter._fail(groups, error)
+                    break
+        for query, values, key, future in batch:
+            if query is None:
+                future.set_result(None)
+
+    @staticmethod
+    def _commit(groups: list) -> Union[Exception, None]:
+        """
+        Writes the groups of rows in one transaction under var.sql_lock and
+        returns the exception if it was rolled back. The lock is released
+        exactly once, whatever happens.
+        """
+        with var.sql_lock:
+            try:
+                for query, rows, _ in groups:
+                    var.connect_sqlite.executemany(query, rows)
+                var.connect_sqlite.commit()
+            except Exception as ex:  # var.error_sqlite
+                var.connect_sqlite.rollback()
+                return ex
+
+        return None
+
+    @staticmethod
+    def _write_rows(groups: list) -> None:
+        """
+        The transaction failed, so the rows are written one by one to
+        commit the correct ones and return the error for the rest.
+        """
+        for query, rows, futures in groups:
+            for values, future in zip(rows, futures):
+                err_locked = 0
+                while True:
+                    error = DatabaseWriter._commit([(query, [values], None)])
+                    if error is None:
+                        future.set_result(None)
+                        break
+                    elif "database is locked" not in str(error):
+                        DatabaseWriter._fail([(query, [values], [future])], error)
+                        break
+                    else:
+                        err_locked += 1
+                        if not DatabaseWriter._wait_locked(err_locked):
+                            DatabaseWriter._fail([(query, [values], [future])], error)
+                            break
+
+    @staticmethod
+    def _wait_locked(attempt: int) -> bool:
+        """
+        Logs the attempt and waits FLUSH_INTERVAL seconds before the next
+        one. Returns False if there are no attempts left.
+        """
+        var.logger.error(
+            "Sqlite Error: Database is locked (attempt: " + str(attempt) + ")"
+        )
+        if attempt >= DatabaseWriter.LOCKED_ATTEMPTS:
+            return False
+        time.sleep(DatabaseWriter.FLUSH_INTERVAL)
+
+        return True
+
+    @staticmethod
+    def _fail(groups: list, error: Exception) -> None:
+        """
+        Returns the error for every row of the groups.
+        """
+        for _, rows, futures in groups:
+            for values, future in zip(rows, futures):
+                err_str = f"Sqlite Error: {str(error)} for: {values[0]}"
+                var.logger.error(err_str)
+                future.set_result(err_str)
@@ -1,25 +1,20 @@
 import threading
-from collections import OrderedDict
-from datetime import datetime, timedelta, timezone
-from time import sleep
+from datetime import datetime, timezone
 
-import botinit.init as botinit
-import common.init as common
 import functions
 import services as service
-from api.api import WS
-from api.init import Setup
 from api.setup import Markets
-from common.data import Bots, MetaInstrument
+from common.data import Bots
+from common.scheduler import KlineScheduler
 from common.variables import Variables as var
-from display.bot_menu import bot_manager, insert_bot_log
+from display.bot_menu import bot_manager, insert_bot_log, trade_treeTable
 from display.functions import info_display
 from display.settings import SettingsApp
 from display.variables import TreeTable
 from display.variables import Variables as disp
 from display.variables import trim_col_width
+from engine import Engine
 from functions import Function
-from tools import MetaTool
 
 settings = SettingsApp(disp.settings_page)
 disp.root.bind("<F3>", lambda event: terminal_reload(event))
@@ -30,39 +25,18 @@ thread.start()
 def setup(reload=False):
     """
     This function works the first time you start the program or when you
-    reboot after pressing F3. Markets are loaded using setup_market() in
-    parallel in threads to speed up the loading process.
+    reboot after pressing F3. The markets and bots are loaded by the
+    Engine, which is shared with the headless mode, see engine.py.
     """
-    clear_params()
+    Engine.clear_params()
     settings.load()
-    common.setup_database_connecion()
-    botinit.load_bot_parameters()
-    threads = []
-    for name in var.market_list.copy():
-        ws = Markets[name]
-        ws.object.transaction = Function.transaction
-        ws.instrument_index = OrderedDict()
-        MetaInstrument.market[ws.name] = dict()
-        Setup.variables(ws)
-        ws.setup_session()
-        if name in var.market_list:
-            t = threading.Thread(target=setup_market, args=(ws, reload))
-            threads.append(t)
-            t.start()
-    [thread.join() for thread in threads]
+    Engine.load_markets(reload=reload)
     disp.pw_rest1.pack_forget()
     for name in var.market_list:
-        finish_setup(Markets[name])
+        Engine.finish_setup(Markets[name])
     disp.pw_rest1.pack(fill="both", expand="yes")
-    merge_orders()
-    functions.clear_klines()
-    botinit.load_bots()
-    functions.setup_klines()
-    botinit.setup_bots()
-    if not var.market_list:
-        var.market_list = ["Fake"]
-        var.current_market = "Fake"
-        var.symbol = "Fake"
+    Engine.merge_orders()
+    Engine.load_bots()
     functions.init_bot_treetable_trades()
     settings.init()
     functions.clear_tables()
@@ -89,149 +63,16 @@ def setup(reload=False):
         else:
             disp.pw_rest4.add(check_frame)
     var.display_bottom = frame["method"]
-    for name in var.market_list:
-        if Markets[name].name != "Fake":
-            Markets[name].api_is_active = True
-
-
-def setup_market(ws: Markets, reload=False):
-    """
-    Market reboot. During program operation, when accessing endpoints or
-    receiving information from websockets, errors may occur due to the loss of
-    the Internet connection or errors for other reasons. If the program
-    detects such a case, it reboots the market to restore data integrity.
-
-    The download process may take time, because there are a large number
-    of calls to endpoints and websocket subscriptions. To speed up, many calls
-    are performed in parallel threads, within which parallel threads can also
-    be opened. If any download component is not received, the program will
-    restart again from the very beginning.
-
-    The download process is done in stages because the order in which the
-    information is received matters. Loading sequence:
-
-    1) All active instruments.
-    2) All active orders. After receiving orders, it may happen that the order
-       is executed even before the websocket comes up. In this case, the
-       websocket will not send execution, but the integrity of the information
-       will not be lost, because execution of order will be processed at the
-       end of loading in the load_trading_history() function.
-    3) Simultaneous download:
-        1. Subscribe to websockets only for those instruments that are
-           specified in the .env.Subscriptions files.
-        2. Getting the user id.
-        3. Obtaining information on account balances.
-        4. Obtaining initial information about the positions of signed
-           instruments.
-    4) Simultaneous download:
-        1. Receiving klines only for those instruments and timeframes that are
-           used by bots.
-        2. Trading history.
-    """
-
-    def get_history(ws, success, num):
-        res = common.Init.load_trading_history(ws)
-        if res in ["success", "empty"]:
-            success["history"] = res
-
-    '''def get_klines(ws, success, num):
-        if functions.init_market_klines(ws):
-            success["kline"] = "success"'''
-
-    ws.logNumFatal = "SETUP"
-    ws.api_is_active = False
-    for symbol in MetaTool.objects.copy().keys():
-        if symbol[1] == ws.name:
-            del MetaTool.objects[symbol]
-    ws.ticker = dict()
-    if reload:
-        WS.exit(ws)
-        sleep(3)
-    while ws.logNumFatal not in ["", "CANCEL"]:
-        ws.logNumFatal = ""
-        common.Init.clear_orders_by_market(ws)
-        var.queue_order.put({"action": "clear", "market": ws.name})
-        ws.logNumFatal = WS.connect_market(ws)
-        if ws.logNumFatal:
-            try:
-                WS.exit(ws)
-            except Exception as ex:
-                service.display_exception(ex)
-                service.unexpected_error(ws)
-            if ws.logNumFatal != "CANCEL":
-                sleep(2)
-        else:
-            common.Init.clear_params(ws)
-            if not ws.logNumFatal:
-                threads = []
-                """success = {"kline": None, "history": None}
-                t = threading.Thread(
-                    target=get_klines,
-                    args=(ws, success, len(success) - 1),
-                )
-                threads.append(t)
-                t.start()"""
-                success = {"history": None}
-                t = threading.Thread(
-                    target=get_history,
-                    args=(ws, success, len(success) - 1),
-                )
-                threads.append(t)
-                t.start()
-                [thread.join() for thread in threads]
-                if not success["history"]:
-                    var.logger.error(ws.name + ": The trade history is not loaded.")
-                """if not success["kline"]:
-                    var.logger.error(ws.name + ": Klines are not loaded.")"""
-            else:
-                var.logger.info("No robots loaded.")
-                sleep(2)
-        if ws.logNumFatal == "CANCEL":
-            service.cancel_market(market=ws.name)
-        if ws.logNumFatal not in ["", "CANCEL"]:
-            var.logger.info("\n\n")
-            var.logger.info(
-                "Boot went wrong while loading "
-                + ws.name
-                + ". See log file. Reboot.\n\n"
-            )
-            WS.exit(ws)
-            sleep(3)
-
+    Engine.activate_markets()
 
-def merge_orders():
-    orders_list = list()
-    for values in var.orders.values():
-        for value in values.values():
-            orders_list.append(value)
-    orders_list.sort(key=lambda x: x["transactTime"])
-    for order in orders_list:
-        var.queue_order.put({"action": "put", "order": order})
 
-
-def finish_setup(ws: Markets):
-    """
-    This part of the setup does not interact with HTTP, so there is no need to
-    load data from different threads to speed up the program and this function
-    is executed from the main loop. Moreover, the function uses
-    load_database() to fill data into the Treeview tables, which, according to
-    Tkinter capabilities, is only possible from the main loop.
-    """
-    common.Init.load_database(ws)
-    common.Init.account_balances(ws)
-    common.Init.load_orders(ws, ws.setup_orders)
-    ws.message_time = datetime.now(tz=timezone.utc)
+def reload_tables() -> None:
+    functions.clear_tables()
+    bot_manager.create_bots_menu()
 
 
-def reload_market(ws: Markets):
-    ws.api_is_active = False
-    Function.market_status(
-        ws, status="RELOADING...", message="Reloading...", error=True
-    )
-    TreeTable.market.tree.update()
-    setup_market(ws=ws, reload=True)
-    var.queue_reload.put(ws)
-    # functions.update_order_form()
+Engine.on_status = Function.market_status
+Engine.on_reload = reload_tables
 
 
 def refresh() -> None:
@@ -243,8 +84,14 @@ def refresh() -> None:
                 t.start()
         elif "trades_display" in info:
             Function.trades_display(
-                info["trades_display"], table=info["table"], val=info["message"]
+                info["trades_display"], table=TreeTable.trades, val=info["message"]
             )
+            if info["emi"] in Bots.keys():
+                Function.trades_display(
+                    info["trades_display"],
+                    table=trade_treeTable[info["emi"]],
+                    val=info["message"],
+                )
         elif "funding_display" in info:
             Function.funding_display(info["funding_display"], val=info["message"])
         else:
@@ -264,14 +111,7 @@ def refresh() -> None:
         if disp.f3:
             terminal_reload("None")
         while not var.queue_reload.empty():
-            ws: Markets = var.queue_reload.get()
-            finish_setup(ws=ws)
-            merge_orders()
-            Function.market_status(ws, status="ONLINE", message="", error=False)
-            functions.clear_tables()
-            bot_manager.create_bots_menu()
-            botinit.setup_bots()
-            ws.api_is_active = True
+            Engine.finish_reload(ws=var.queue_reload.get())
         while not var.queue_order.empty():
             """
             The queue thread-safely displays current orders that can be queued:
@@ -307,31 +147,7 @@ def refresh() -> None:
             elif job["action"] == "clear":
                 TreeTable.orders.clear_all(market=job["market"])
 
-        for name in var.market_list:
-            ws = Markets[name]
-            if ws.api_is_active:
-                if not ws.logNumFatal:
-                    # if ws.api_is_active:
-                    if utc > ws.message_time + timedelta(seconds=10):
-                        if not WS.ping_pong(ws):
-                            info_display(
-                                market=ws.name,
-                                message="The websocket does not respond within 10 sec. Reboot",
-                                warning="error",
-                            )
-                            ws.logNumFatal = "FATAL"  # reboot
-                        ws.message_time = utc
-                elif ws.logNumFatal == "BLOCK":
-                    if ws.message2000 == "":
-                        ws.message2000 = "Fatal error. Trading stopped"
-                        Function.market_status(
-                            ws, status="Error", message=ws.message2000, error=True
-                        )
-                    sleep(1)
-                elif ws.logNumFatal == "FATAL":  # reboot
-                    # if ws.api_is_active:
-                    t = threading.Thread(target=reload_market, args=(ws,))
-                    t.start()
+        Engine.check_markets(utc=utc)
         var.lock_display.acquire(True)
         ws = Markets[var.current_market]
         if ws.api_is_active:
@@ -341,13 +157,6 @@ def refresh() -> None:
     service.get_usage()
 
 
-def clear_params():
-    var.market_list = []
-    var.orders = dict()
-    MetaInstrument.market = dict()
-    var.rollup_symbol = "cancel"
-
-
 def terminal_reload_thread() -> None:
     var.reloading = True
     disp.menu_robots.pack_forget()
@@ -373,6 +182,7 @@ def on_closing(root, refresh_var):
     root.destroy()
     service.close(Markets)
     var.kline_update_active = False
+    KlineScheduler.stop()
 
 
 def init_fake():
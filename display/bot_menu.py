@@ -1,8 +1,6 @@
-import importlib
 import os
 import re
 import shutil
-import sys
 import tkinter as tk
 import traceback
 from collections import OrderedDict
@@ -18,10 +16,11 @@ import functions
 import indicators
 import services as service
 from api.setup import Markets
+from botinit.init import import_bot_module
 from botinit.variables import Variables as robo
 from common.data import BotData, Bots
+from common.executor import BotExecutor
 from common.variables import Variables as var
-from display.messages import ErrorMessage
 
 from .headers import Header
 from .tips import Tips
@@ -40,8 +39,8 @@ class BoldLabel(tk.Label):
 class SettingsApp:
     def __init__(self):
         self.button_strategy = None
-        self.algo_dir = f"{os.getcwd()}/algo/"
-        self.strategy_file = "strategy.py"
+        self.algo_dir = robo.algo_dir
+        self.strategy_file = robo.strategy_file
         self.timeframes = var.timeframe_human_format
         self.bot_entry = {}
         self.name_trace = StringVar(name="Name" + str(self))
@@ -72,7 +71,7 @@ class SettingsApp:
         # Create initial frames
 
         self.brief_frame = ScrollFrame(info_right, bg=disp.bg_color, bd=5)
-        self.modules = dict()
+        self.modules = robo.modules
         self.create_strategy_widget()
 
     def onFrameConfigure(self, event):
@@ -274,11 +273,8 @@ class SettingsApp:
             )
 
             import_bot_module(disp.bot_name, update=True)
-            qwr = (
-                "UPDATE robots SET"
-                + f" UPDATED = CURRENT_TIMESTAMP WHERE EMI = '{disp.bot_name}'"
-            )
-            err = service.update_database(query=qwr)
+            qwr = "UPDATE robots SET UPDATED = CURRENT_TIMESTAMP WHERE EMI = ?"
+            err = service.update_database(query=qwr, params=(disp.bot_name,))
             if err is None:
                 bot = Bots[disp.bot_name]
                 bot.updated = self.get_time()
@@ -460,10 +456,10 @@ class SettingsApp:
         def on_button(value: int) -> None:
             timefr = tuple(self.timeframes.keys())[value]
             qwr = (
-                f"UPDATE robots SET TIMEFR = '{timefr}'"
-                + f", UPDATED = CURRENT_TIMESTAMP WHERE EMI = '{bot_name}'"
+                "UPDATE robots SET TIMEFR = ?, UPDATED = CURRENT_TIMESTAMP "
+                + "WHERE EMI = ?"
             )
-            err = service.update_database(query=qwr)
+            err = service.update_database(query=qwr, params=(timefr, bot_name))
             if err is None:
                 bot.timefr = timefr
                 bot.updated = self.get_time()
@@ -531,25 +527,15 @@ class SettingsApp:
             if self.delete_warning(bot_name=bot_to_delete):
                 return
 
-            query_r = (
-                "UPDATE "
-                + var.database_real
-                + " SET EMI = '"
-                + bot_name
-                + "' WHERE EMI = '"
-                + bot_to_delete
-                + "'"
-            )
-            query_t = (
-                "UPDATE "
-                + var.database_test
-                + " SET EMI = '"
-                + bot_name
-                + "' WHERE EMI = '"
-                + bot_to_delete
-                + "'"
+            query_r = "UPDATE " + var.database_real + " SET EMI = ? WHERE EMI = ?"
+            query_t = "UPDATE " + var.database_test + " SET EMI = ? WHERE EMI = ?"
+            message = self.delete_all_bot_info(
+                bot_to_delete,
+                query_r,
+                query_t,
+                "Merge",
+                params=(bot_name, bot_to_delete),
             )
-            message = self.delete_all_bot_info(bot_to_delete, query_r, query_t, "Merge")
             if message[0] is None:
                 message[1] = "The merge operation completed successfully."
             else:
@@ -700,21 +686,11 @@ class SettingsApp:
         def delete_bot(bot_name: str) -> None:
             if self.delete_warning(bot_name=bot_name):
                 return
-            query_r = (
-                "UPDATE "
-                + var.database_real
-                + " SET EMI = '' WHERE EMI = '"
-                + bot_name
-                + "'"
+            query_r = "UPDATE " + var.database_real + " SET EMI = '' WHERE EMI = ?"
+            query_t = "UPDATE " + var.database_test + " SET EMI = '' WHERE EMI = ?"
+            message = self.delete_all_bot_info(
+                bot_name, query_r, query_t, "Delete", params=(bot_name,)
             )
-            query_t = (
-                "UPDATE "
-                + var.database_test
-                + " SET EMI = '' WHERE EMI = '"
-                + bot_name
-                + "'"
-            )
-            message = self.delete_all_bot_info(bot_name, query_r, query_t, "Delete")
             if message[0] is None:
                 message[1] = "The delete operation completed successfully."
                 values = ["" for _ in Header.name_bot]
@@ -888,7 +864,7 @@ class SettingsApp:
             info_right.pack(fill="both", expand=True, side="left")
 
     def delete_all_bot_info(
-        self, bot_name, query_r, query_t, type
+        self, bot_name, query_r, query_t, type, params=()
     ) -> Union[bool, None]:
         message = ""
         err = None
@@ -907,14 +883,14 @@ class SettingsApp:
             if type == "Delete":
                 disp.bot_name = None
             message = f"Bot ``{bot_name}`` removed from Tmatic's memory."
-            err = service.update_database(query=query_r)
+            err = service.update_database(query=query_r, params=params)
             if err is None:
                 message += "\nDatabase table `" + var.database_real + "` updated."
-                err = service.update_database(query=query_t)
+                err = service.update_database(query=query_t, params=params)
                 if err is None:
                     message += "\nDatabase table `" + var.database_test + "` updated."
                     err = service.update_database(
-                        query=f"DELETE FROM robots WHERE EMI = '{bot_name}'"
+                        query="DELETE FROM robots WHERE EMI = ?", params=(bot_name,)
                     )
                     if err is None:
                         message += f"\nBot ``{bot_name}`` deleted from the database."
@@ -926,6 +902,7 @@ class SettingsApp:
             disp.bot_event_prev = ""
             var.bot_thread_active[bot_name] = False
             del robo.run_bot[bot_name]
+            BotExecutor.discard(bot_name)
             del self.modules[bot_name]
             del var.orders[bot_name]
             functions.remove_bot_klines(bot_name)
@@ -1027,7 +1004,7 @@ def update_bot_state(new_state: str, bot: BotData, update=False) -> Union[str, N
         Description of the error, or None if successful.
     """
     err = service.update_database(
-        query=f"UPDATE robots SET STATE = '{new_state}' WHERE EMI = '{bot.name}'"
+        query="UPDATE robots SET STATE = ? WHERE EMI = ?", params=(new_state, bot.name)
     )
     if err is None:
         bot.state = new_state
@@ -1157,12 +1134,9 @@ def init_bot_trades(bot_name: str) -> None:
             "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, ABS(QTY) "
             + "as QTY, TRADE_PRICE, TTIME from "
             + var.database_table
-            + " where EMI == '"
-            + bot_name
-            + "' and SIDE <> 'Fund' order by TTIME desc limit "
-            + str(disp.table_limit)
+            + " where EMI == ? and SIDE <> 'Fund' order by TTIME desc limit ?"
         )
-        data = service.select_database(sql)
+        data = service.select_database(sql, (bot_name, disp.table_limit))
         indx_side = trade_treeTable[bot_name].title.index("SIDE")
         indx_market = trade_treeTable[bot_name].title.index("MARKET")
         line = False
@@ -1243,117 +1217,6 @@ def handler_bot_menu(event) -> None:
             disp.bot_event_prev = iid
 
 
-def import_bot_module(bot_name: str, update=False) -> None:
-    """
-    This function is called when bots are initially loaded, or reloaded due
-    to <F3>, or reloaded for some other reason, or when strategy.py is
-    updated.
-
-    Parameters
-    ----------
-    bot_name: str
-        Bot name.
-    update: bool
-        Evaluates to True when strategy.py is updated.
-    """
-    if Bots[bot_name].state != "Disconnected":
-        module = "algo." + bot_name + "." + bot_manager.strategy_file.split(".")[0]
-        Bots[bot_name].error_message = {}
-        Bots[bot_name].multitrade = False
-        try:
-            if module in sys.modules:
-                del sys.modules[module]
-            mod = importlib.import_module(module)
-            bot_manager.modules[bot_name] = mod
-        except ModuleNotFoundError as exception:
-            message = ErrorMessage.BOT_FOLDER_NOT_FOUND.format(
-                MODULE=module, EXCEPTION=exception, BOT_NAME=bot_name
-            )
-            var.logger.warning(message)
-            var.queue_info.put(
-                {
-                    "market": "",
-                    "message": message,
-                    "time": datetime.now(tz=timezone.utc),
-                    "warning": "warning",
-                    "emi": bot_name,
-                }
-            )
-            Bots[bot_name].error_message = {
-                "error_type": exception.__class__.__name__,
-                "message": message,
-            }
-        except Exception as exception:
-            err = service.display_exception(exception, display=False)
-            message = ErrorMessage.BOT_LOADING_ERROR.format(
-                MODULE=module,
-                CLASS=exception.__class__.__name__,
-                EXCEPTION=err,
-                BOT_NAME=bot_name,
-            )
-            var.logger.warning(message)
-            var.queue_info.put(
-                {
-                    "market": "",
-                    "message": message,
-                    "time": datetime.now(tz=timezone.utc),
-                    "warning": True,
-                    "emi": bot_name,
-                }
-            )
-            Bots[bot_name].error_message = {
-                "error_type": exception.__class__.__name__,
-                "message": message,
-            }
-        else:
-            if update:
-                var.queue_info.put(
-                    {
-                        "market": "",
-                        "message": "The bot `" + bot_name + "` updated successfully.",
-                        "time": datetime.now(tz=timezone.utc),
-                        "warning": None,
-                        "emi": bot_name,
-                    }
-                )
-        try:
-            robo.run_bot[bot_name] = bot_manager.modules[bot_name].run_bot
-        except Exception:
-            robo.run_bot[bot_name] = "No strategy"
-        try:
-            robo.setup_bot[bot_name] = bot_manager.modules[bot_name].setup_bot
-        except Exception:
-            robo.setup_bot[bot_name] = "No setup"
-        try:
-            robo.update_bot[bot_name] = bot_manager.modules[bot_name].update_bot
-        except Exception:
-            robo.update_bot[bot_name] = "No update"
-        try:
-            robo.activate_bot[bot_name] = bot_manager.modules[bot_name].activate_bot
-        except Exception:
-            robo.activate_bot[bot_name] = "No activate"
-        if update:
-            functions.init_bot_klines(bot_name)
-        tm = datetime.now()
-        month = "0" * (2 - len(str(tm.month))) + str(tm.month)
-        day = "0" * (2 - len(str(tm.day))) + str(tm.day)
-        hr = "0" * (2 - len(str(tm.hour))) + str(tm.hour)
-        min = "0" * (2 - len(str(tm.minute))) + str(tm.minute)
-        tm = f"{tm.year}{month}{day}-{hr}{min}"
-        Bots[bot_name].strategy_log = (
-            bot_manager.algo_dir + "/" + bot_name + "/strategy_" + tm + ".log"
-        )
-    else:
-        if bot_name in robo.run_bot:
-            del robo.run_bot[bot_name]
-        if bot_name in robo.setup_bot:
-            del robo.setup_bot[bot_name]
-        if bot_name in robo.update_bot:
-            del robo.update_bot[bot_name]
-        if bot_name in robo.activate_bot:
-            del robo.activate_bot[bot_name]
-
-
 def insert_bot_log(
     bot_name: str,
     message: str,
@@ -1383,14 +1246,9 @@ def insert_bot_log(
     """
     bot = Bots[bot_name]
     if not fill:
-        message = service.format_message(market=market, message=message, tm=tm)
-        bot.log.append((warning, message))
-        path = f"{bot_manager.algo_dir}{bot_name}/bot.log"
-        try:
-            with open(path, "a") as f:
-                f.write(message)
-        except FileNotFoundError:
-            pass
+        message = service.save_bot_log(
+            bot_name=bot_name, message=message, warning=warning, market=market, tm=tm
+        )
     if bot_name == disp.bot_name:
         num = message.count("\n")
         disp.text_bot_log.insert("1.0", message)
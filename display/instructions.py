@@ -76,6 +76,18 @@
 # Index -1 refers to the most recent period, -2 to the period before the most
 # recent, and so on.
 #
+# 6.1. Indicators
+#
+# sma = data.indicator("sma", period=20)
+# sma()                value for the latest closed period (float | None)
+# sma(-2)              value for the period before it
+#
+# Available indicators: "sma", "ema", "rsi", "atr", "bollinger" (returns
+# middle, upper, lower), "session_average", "max", "min". The source
+# parameter sets the price used: "open_bid" by default, any other field of
+# the kline data or "mid". Indicators are calculated once per period and
+# shared by all bots, backtest gives the same values as live trading.
+#
 #
 # 7. Functions related to instruments
 # -----------------------------------
@@ -8,6 +8,7 @@ from dotenv import dotenv_values, set_key
 
 import services as service
 from api.setup import Default, Documentation, MetaMarket
+from common.settings import Settings
 from common.variables import Variables as var
 from display.tips import Tips
 from display.variables import ClickLabel
@@ -35,6 +36,7 @@ class SettingsApp:
         self.common_settings["BOTTOM_FRAME"] = "Bots"
         self.common_settings["REFRESH_RATE"] = "5"
         self.common_settings["TESTNET"] = "YES"
+        self.common_settings["WEBSOCKET_CORE"] = "NO"
 
         for setting in self.common_settings.keys():
             self.common_trace_changed[setting] = StringVar(name=setting + str(self))
@@ -249,22 +251,12 @@ class SettingsApp:
 
         # Set parameters
 
-        book_depth = var.env["ORDER_BOOK_DEPTH"].split(" ")
-        var.order_book_depth = book_depth[0]
-        var.db_sqlite = var.env["SQLITE_DATABASE"]
-        var.refresh_rate = min(max(100, int(1000 / int(var.env["REFRESH_RATE"]))), 1000)
+        Settings.apply()
         if var.order_book_depth != "quote":
-            disp.num_book = int(book_depth[1]) * 2
+            disp.num_book = int(var.env["ORDER_BOOK_DEPTH"].split(" ")[1]) * 2
         else:
             disp.num_book = 2
-        if var.env["TESTNET"] == "YES":
-            var.database_table = var.database_test
-            var.platform_name = "Tmatic / testnet"
-            disp.root.title(var.platform_name)
-        else:
-            var.database_table = var.database_real
-            var.platform_name = "Tmatic"
-            disp.root.title(var.platform_name)
+        disp.root.title(var.platform_name)
 
     def save_dotenv_subscriptions(self, subscriptions: OrderedDict) -> None:
         """
@@ -697,7 +689,7 @@ class SettingsApp:
                     )
                     values = ("1", "2", "3", "4", "5", "6", "7", "8", "9", "10")
                     self.entry_common[setting]["values"] = values
-                elif setting == "TESTNET":
+                elif setting in ("TESTNET", "WEBSOCKET_CORE"):
                     self.entry_common[setting] = ttk.Combobox(
                         self.root_frame,
                         width=self.entry_width,
@@ -53,6 +53,12 @@ class Tips(Enum):
     TESTNET_API_KEY = API
     TESTNET_API_SECRET = API
     TESTNET = "Select YES if you are using a test account, otherwise select NO."
+    WEBSOCKET_CORE = (
+        "Select YES to run the websocket connections of all markets on one "
+        + "event loop instead of a websocket-client thread per connection. "
+        + "The default is NO. The changes will take effect after restarting "
+        + "<f3> or relaunching Tmatic."
+    )
     ACTIVE_STATE = "`Active` - all functions are operational. Trading is allowed."
     SUSPENDED_STATE = (
         "`Suspended` - the bot file strategy.py is loaded "
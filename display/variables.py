@@ -506,6 +506,13 @@ class Variables:
     label_time.pack(side="right")
     last_gmtime_sec = 0
 
+    # Versions of Changes and var.orders shown by refresh_tables()
+    shown_version = 0
+    shown_orders_version = -1
+    shown_view = None
+    full_refresh_time = 0
+    full_refresh_interval = 1
+
     pw_info_rest.grid(row=1, column=0, sticky="NSEW")
     frame_left.grid_rowconfigure(1, weight=1)
 
@@ -674,7 +681,6 @@ class Variables:
 
     refresh_var = None
     nfo_display_counter = 0
-    f9 = "OFF"
     f3 = False
     robots_window_trigger = "off"
     info_display_counter = 0
@@ -686,7 +692,6 @@ class Variables:
     refresh_bot_info = False
     bot_name = None
     bot_trades = dict()
-    bot_orders_processing = False
     bot_event_prev = ""
     bot_menu_option = ""
     image_cancel = tk.PhotoImage(file="display/unsubscribe.png")
@@ -894,21 +899,17 @@ class Variables:
 
 
 def on_trade_state(event) -> None:
-    if Variables.f9 == "ON":
-        Variables.menu_button.menu.entryconfigure(
-            0, label="<F9> Trading " + Variables.f9
-        )
-        Variables.f9 = "OFF"
+    if var.f9 == "ON":
+        Variables.menu_button.menu.entryconfigure(0, label="<F9> Trading " + var.f9)
+        var.f9 = "OFF"
         Variables.label_f9.config(bg=Variables.red_color)
-    elif Variables.f9 == "OFF":
-        Variables.menu_button.menu.entryconfigure(
-            0, label="<F9> Trading " + Variables.f9
-        )
-        Variables.f9 = "ON"
+    elif var.f9 == "OFF":
+        Variables.menu_button.menu.entryconfigure(0, label="<F9> Trading " + var.f9)
+        var.f9 = "ON"
         Variables.label_f9.config(bg=Variables.green_color)
         for market in var.market_list:
             Markets[market].logNumFatal = ""
-    Variables.label_f9["text"] = Variables.f9
+    Variables.label_f9["text"] = var.f9
 
 
 def on_f3_reload() -> None:
@@ -0,0 +1,299 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from time import sleep
+from typing import Callable
+
+import botinit.init as botinit
+import common.init as common
+import functions
+import services as service
+from api.api import WS
+from api.init import Setup
+from api.setup import Markets
+from common.data import MetaInstrument
+from common.orders import OrderRegistry
+from common.variables import Variables as var
+from functions import Function
+from tools import MetaTool
+
+
+def _put_message(market: str, message: str, warning=None) -> None:
+    """
+    Places an information message into the queue and the logger.
+    """
+    var.queue_info.put(
+        {
+            "market": market,
+            "message": message,
+            "time": datetime.now(tz=timezone.utc),
+            "warning": warning,
+        }
+    )
+    if not warning:
+        var.logger.info(market + " - " + message)
+    elif warning == "warning":
+        var.logger.warning(market + " - " + message)
+    else:
+        var.logger.error(market + " - " + message)
+
+
+def put_status(ws: Markets, status: str, message: str, error=False) -> None:
+    """
+    Default market status handler without the display.
+    """
+    if message:
+        _put_message(
+            market=ws.name, message=message, warning="error" if error else None
+        )
+
+
+def do_nothing(*args, **kwargs):
+    pass
+
+
+class Engine:
+    """
+    Trading engine shared by the GUI (main.py, connect.py) and the headless
+    mode (headless.py): loading and reloading of markets, bots and klines,
+    and the websocket watchdog. Nothing here refers to the display, which
+    is attached through the handlers below.
+
+    on_status: Callable
+        Shows the market status, e.g. "ONLINE" or "RELOADING...". The GUI
+        sets Function.market_status, which updates the market table.
+    on_reload: Callable
+        Called after a market has been reloaded, before the bots are set up
+        again. The GUI clears the tables and rebuilds the bot menu.
+    """
+
+    on_status: Callable = put_status
+    on_reload: Callable = do_nothing
+
+    @staticmethod
+    def clear_params() -> None:
+        var.market_list = []
+        var.orders = OrderRegistry()
+        MetaInstrument.market = dict()
+        var.rollup_symbol = "cancel"
+
+    @staticmethod
+    def load_markets(reload=False) -> None:
+        """
+        Connects the database, loads the bot parameters and the markets of
+        var.market_list. Markets are loaded using setup_market() in
+        parallel in threads to speed up the loading process.
+        """
+        common.setup_database_connecion()
+        botinit.load_bot_parameters()
+        threads = []
+        for name in var.market_list.copy():
+            ws = Markets[name]
+            ws.object.transaction = Function.transaction
+            ws.instrument_index = OrderedDict()
+            MetaInstrument.market[ws.name] = dict()
+            Setup.variables(ws)
+            ws.setup_session()
+            if name in var.market_list:
+                t = threading.Thread(target=Engine.setup_market, args=(ws, reload))
+                threads.append(t)
+                t.start()
+        [thread.join() for thread in threads]
+
+    @staticmethod
+    def finish_markets() -> None:
+        for name in var.market_list:
+            Engine.finish_setup(Markets[name])
+        Engine.merge_orders()
+
+    @staticmethod
+    def load_bots() -> None:
+        """
+        Loads the bots and their klines after the markets are loaded.
+        """
+        functions.clear_klines()
+        botinit.load_bots()
+        functions.setup_klines()
+        botinit.setup_bots()
+        if not var.market_list:
+            var.market_list = ["Fake"]
+            var.current_market = "Fake"
+            var.symbol = "Fake"
+
+    @staticmethod
+    def activate_markets() -> None:
+        for name in var.market_list:
+            if Markets[name].name != "Fake":
+                Markets[name].api_is_active = True
+
+    @staticmethod
+    def setup_market(ws: Markets, reload=False):
+        """
+        Market reboot. During program operation, when accessing endpoints or
+        receiving information from websockets, errors may occur due to the
+        loss of the Internet connection or errors for other reasons. If the
+        program detects such a case, it reboots the market to restore data
+        integrity.
+
+        The download process may take time, because there are a large
+        number of calls to endpoints and websocket subscriptions. To speed
+        up, many calls are performed in parallel threads, within which
+        parallel threads can also be opened. If any download component is
+        not received, the program will restart again from the very
+        beginning.
+
+        The download process is done in stages because the order in which
+        the information is received matters. Loading sequence:
+
+        1) All active instruments.
+        2) All active orders. After receiving orders, it may happen that the
+           order is executed even before the websocket comes up. In this
+           case, the websocket will not send execution, but the integrity of
+           the information will not be lost, because execution of order will
+           be processed at the end of loading in the load_trading_history()
+           function.
+        3) Simultaneous download:
+            1. Subscribe to websockets only for those instruments that are
+               specified in the .env.Subscriptions files.
+            2. Getting the user id.
+            3. Obtaining information on account balances.
+            4. Obtaining initial information about the positions of signed
+               instruments.
+        4) Simultaneous download:
+            1. Receiving klines only for those instruments and timeframes
+               that are used by bots.
+            2. Trading history.
+        """
+
+        def get_history(ws, success, num):
+            res = common.Init.load_trading_history(ws)
+            if res in ["success", "empty"]:
+                success["history"] = res
+
+        ws.logNumFatal = "SETUP"
+        ws.api_is_active = False
+        for symbol in MetaTool.objects.copy().keys():
+            if symbol[1] == ws.name:
+                del MetaTool.objects[symbol]
+        ws.ticker = dict()
+        if reload:
+            WS.exit(ws)
+            sleep(3)
+        while ws.logNumFatal not in ["", "CANCEL"]:
+            ws.logNumFatal = ""
+            common.Init.clear_orders_by_market(ws)
+            var.queue_order.put({"action": "clear", "market": ws.name})
+            ws.logNumFatal = WS.connect_market(ws)
+            if ws.logNumFatal:
+                try:
+                    WS.exit(ws)
+                except Exception as ex:
+                    service.display_exception(ex)
+                    service.unexpected_error(ws)
+                if ws.logNumFatal != "CANCEL":
+                    sleep(2)
+            else:
+                common.Init.clear_params(ws)
+                if not ws.logNumFatal:
+                    threads = []
+                    success = {"history": None}
+                    t = threading.Thread(
+                        target=get_history,
+                        args=(ws, success, len(success) - 1),
+                    )
+                    threads.append(t)
+                    t.start()
+                    [thread.join() for thread in threads]
+                    if not success["history"]:
+                        var.logger.error(ws.name + ": The trade history is not loaded.")
+                else:
+                    var.logger.info("No robots loaded.")
+                    sleep(2)
+            if ws.logNumFatal == "CANCEL":
+                service.cancel_market(market=ws.name)
+            if ws.logNumFatal not in ["", "CANCEL"]:
+                var.logger.info("\n\n")
+                var.logger.info(
+                    "Boot went wrong while loading "
+                    + ws.name
+                    + ". See log file. Reboot.\n\n"
+                )
+                WS.exit(ws)
+                sleep(3)
+
+    @staticmethod
+    def merge_orders():
+        orders_list = list()
+        for values in var.orders.values():
+            for value in values.values():
+                orders_list.append(value)
+        orders_list.sort(key=lambda x: x["transactTime"])
+        for order in orders_list:
+            var.queue_order.put({"action": "put", "order": order})
+
+    @staticmethod
+    def finish_setup(ws: Markets):
+        """
+        This part of the setup does not interact with HTTP, so there is no
+        need to load data from different threads to speed up the program
+        and this function is executed from the main loop. Moreover, the
+        function uses load_database() to fill data into the Treeview tables,
+        which, according to Tkinter capabilities, is only possible from the
+        main loop.
+        """
+        common.Init.load_database(ws)
+        common.Init.account_balances(ws)
+        common.Init.load_orders(ws, ws.setup_orders)
+        ws.message_time = datetime.now(tz=timezone.utc)
+
+    @staticmethod
+    def reload_market(ws: Markets):
+        ws.api_is_active = False
+        Engine.on_status(ws, status="RELOADING...", message="Reloading...", error=True)
+        Engine.setup_market(ws=ws, reload=True)
+        var.queue_reload.put(ws)
+
+    @staticmethod
+    def finish_reload(ws: Markets) -> None:
+        """
+        Completes the reload of the market taken from var.queue_reload in
+        the main loop.
+        """
+        Engine.finish_setup(ws=ws)
+        Engine.merge_orders()
+        Engine.on_status(ws, status="ONLINE", message="", error=False)
+        Engine.on_reload()
+        botinit.setup_bots()
+        ws.api_is_active = True
+
+    @staticmethod
+    def check_markets(utc: datetime) -> None:
+        """
+        Websocket watchdog, called from the main loop. A market whose
+        websocket does not respond within 10 seconds or which has a fatal
+        error is reloaded in a separate thread.
+        """
+        for name in var.market_list:
+            ws = Markets[name]
+            if ws.api_is_active:
+                if not ws.logNumFatal:
+                    if utc > ws.message_time + timedelta(seconds=10):
+                        if not WS.ping_pong(ws):
+                            _put_message(
+                                market=ws.name,
+                                message="The websocket does not respond within "
+                                + "10 sec. Reboot",
+                                warning="error",
+                            )
+                            ws.logNumFatal = "FATAL"  # reboot
+                        ws.message_time = utc
+                elif ws.logNumFatal == "BLOCK":
+                    if ws.message2000 == "":
+                        ws.message2000 = "Fatal error. Trading stopped"
+                        Engine.on_status(
+                            ws, status="Error", message=ws.message2000, error=True
+                        )
+                    sleep(1)
+                elif ws.logNumFatal == "FATAL":  # reboot
+                    t = threading.Thread(target=Engine.reload_market, args=(ws,))
+                    t.start()
@@ -1,7 +1,7 @@
 import re
 import threading
 import time
-import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from enum import Enum
@@ -10,35 +10,43 @@ from typing import Tuple, Union
 
 from dotenv import dotenv_values
 
-import display.bot_menu as bot_menu
 import services as service
 from api.api import WS
 from api.setup import Markets
 from api.variables import Variables
 from botinit.variables import Variables as robo
-from common.data import Bots, Instrument
+from common.archive import KlineArchive
+from common.data import Bots, Changes, Instrument, IntraBar, KlineSeries
+from common.executor import BotExecutor
+from common.messages import ErrorMessage, Message
+from common.scheduler import KlineScheduler
 from common.variables import Variables as var
-from display.functions import info_display
-from display.headers import Header
-from display.messages import ErrorMessage, Message
-from display.option_desk import options_desk
-from display.variables import AutoScrollbar
-from display.variables import OrderForm as form
-from display.variables import (
-    RadioButtonFrame,
-    SubTreeviewTable,
-    TreeTable,
-    TreeviewTable,
-)
-from display.variables import Variables as disp
+from indicators import IndicatorStream
+
+if not var.headless:
+    import tkinter as tk
+
+    import display.bot_menu as bot_menu
+    from display.functions import info_display
+    from display.headers import Header
+    from display.option_desk import options_desk
+    from display.variables import AutoScrollbar
+    from display.variables import OrderForm as form
+    from display.variables import (
+        RadioButtonFrame,
+        SubTreeviewTable,
+        TreeTable,
+        TreeviewTable,
+    )
+    from display.variables import Variables as disp
 
 
 class SelectDatabase(str, Enum):
     QWR = (
         "select SYMBOL, TICKER, CATEGORY, EMI, POS, PNL, MARKET, TTIME from (select "
-        + "EMI, SYMBOL, TICKER, CATEGORY, sum(QTY) POS, sum(SUMREAL) PNL, MARKET, "
-        + "TTIME from {DATABASE_TABLE}"
-        + " where SIDE <> 'Fund' group by EMI, SYMBOL, "
+        + "EMI, SYMBOL, max(TICKER) TICKER, max(CATEGORY) CATEGORY, sum(POS) POS, "
+        + "sum(SUMREAL) PNL, MARKET, max(LTIME) TTIME from {DATABASE_TABLE}_summary"
+        + " where TRADES > 0 group by EMI, SYMBOL, "
         + "MARKET) res where POS <> 0 order by SYMBOL desc;"
     )
 
@@ -123,16 +131,10 @@ class Function(WS, Variables):
     def add_symbol(self: Markets, symb: str, ticker: str, category: str) -> None:
         symbol = (symb, self.name)
         if symbol not in self.Instrument.get_keys():
-            qwr = (
-                "select * from "
-                + var.expired_table
-                + " where SYMBOL ='"
-                + symb
-                + "' and MARKET = '"
-                + self.name
-                + "';"
+            qwr = "select * from %s where SYMBOL = ? and MARKET = ?;" % (
+                var.expired_table
             )
-            data = service.select_database(qwr)
+            data = service.select_database(qwr, (symb, self.name))
             if not data:
                 WS.get_instrument(self, ticker=ticker, category=category)
                 service.add_symbol_database(
@@ -144,29 +146,20 @@ class Function(WS, Variables):
                 service.set_symbol(instrument=instrument, data=data)
 
     def kline_data_filename(self: Markets, symbol: tuple, timefr: str) -> str:
-        return "data/" + symbol[0] + "_" + self.name + "_" + str(timefr) + ".txt"
+        return "data/" + symbol[0] + "_" + self.name + "_" + str(timefr) + ".bin"
 
     def save_kline_data(self: Markets, row: dict, symbol: tuple, timefr: int) -> None:
+        """
+        Appends a closed period to the kline archive. The funding field
+        takes the current funding rate of the instrument.
+        """
         filename = Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
-        zero = (4 - len(str(row["time"]))) * "0"
-        data = (
-            str(row["date"])
-            + ";"
-            + str(zero)
-            + str(row["time"])
-            + ";"
-            + str(row["open_bid"])
-            + ";"
-            + str(row["open_ask"])
-            + ";"
-            + str(row["hi"])
-            + ";"
-            + str(row["lo"])
-            + ";"
-            + str(round(self.Instrument[symbol].fundingRate, 6))
-        )
-        with open(filename, "a") as f:
-            f.write(data + "\n")
+        row = row.copy()
+        try:
+            row["funding"] = round(self.Instrument[symbol].fundingRate, 6)
+        except TypeError:
+            row["funding"] = 0
+        KlineArchive.get(filename).append(row)
 
     def noll(self: Markets, val: str, length: int) -> str:
         r = ""
@@ -234,7 +227,7 @@ class Function(WS, Variables):
                 row["transactTime"],
                 self.user_id,
             ]
-            service.insert_database(values=values, table=var.database_table)
+            service.insert_execution(values=values)
             message = {
                 "SYMBOL": row["symbol"],
                 "MARKET": row["market"],
@@ -250,20 +243,10 @@ class Function(WS, Variables):
                 var.queue_info.put(
                     {
                         "trades_display": self,
-                        "table": TreeTable.trades,
                         "message": message,
                         "emi": emi,
                     }
                 )
-                if emi in Bots.keys():
-                    var.queue_info.put(
-                        {
-                            "trades_display": self,
-                            "table": bot_menu.trade_treeTable[emi],
-                            "message": message,
-                            "emi": emi,
-                        }
-                    )
 
         var.lock.acquire(True)
         try:
@@ -284,11 +267,12 @@ class Function(WS, Variables):
                 refer = emi
                 if emi not in Bots.keys():
                     emi = ""
-                data = service.select_database(  # read_database
-                    "select EXECID from %s where EXECID='%s' and account=%s"
-                    % (var.database_table, row["execID"], self.user_id),
-                )
-                if not data:
+                if not service.execution_exists(
+                    execID=row["execID"],
+                    account=self.user_id,
+                    market=self.name,
+                    ttime=row["transactTime"],
+                ):
                     handle_trade_or_delivery(row, emi, refer, cl_id)
                 Function.orders_processing(self, row=row, info=info)
 
@@ -304,7 +288,7 @@ class Function(WS, Variables):
                 else:
                     lastQty = 0
                 qwr = SelectDatabase.QWR.format(DATABASE_TABLE=var.database_table)
-                unclosed_positions = service.select_database(qwr)
+                unclosed_positions = service.select_database(qwr, flush=True)
                 for position in unclosed_positions:
                     symbol = (position["SYMBOL"], position["MARKET"])
                     if row["symbol"] == symbol and position["POS"] != 0:
@@ -323,16 +307,14 @@ class Function(WS, Variables):
                     qwr = (
                         "select sum(QTY) as sum from "
                         + var.database_table
-                        + " where SYMBOL = '"  # d emi
-                        + row["symbol"][0]
-                        + "' and MARKET = '"
-                        + self.name
-                        + "' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and side <> 'Fund'"
-                        + ";"
+                        + " where SYMBOL = ? and MARKET = ? and ACCOUNT = ?"
+                        + " and side <> 'Fund';"
                     )
-                    data = service.select_database(query=qwr)[0]
+                    data = service.select_database(
+                        query=qwr,
+                        params=(row["symbol"][0], self.name, self.user_id),
+                        flush=True,
+                    )[0]
                     if data["sum"] != diff:
                         message = ErrorMessage.IMPOSSIBLE_DATABASE_POSITION.format(
                             SYMBOL=row["symbol"][0],
@@ -396,7 +378,7 @@ class Function(WS, Variables):
                     row["transactTime"],
                     self.user_id,
                 ]
-                service.insert_database(values=values, table=var.database_table)
+                service.insert_execution(values=values)
                 results.funding += calc["funding"]
                 if not info:
                     var.queue_info.put({"funding_display": self, "message": message})
@@ -498,14 +480,10 @@ class Function(WS, Variables):
                 emi = service.set_emi(symbol=row["symbol"])
         else:  # Retrieved from /execution or /execution/tradeHistory. The order
             # was made outside Tmatic.
-            for emi, values in var.orders.items():
-                for clOrdID, value in values.items():
-                    if value["orderID"] == row["orderID"]:
-                        # emi and clOrdID were defined in var.orders
-                        break
-                else:
-                    continue
-                break
+            order = var.orders.find_orderID(row["orderID"])
+            if order is not None:
+                # emi and clOrdID were defined in var.orders
+                emi, clOrdID = order.owner.emi, order.clOrdID
             else:
                 """There is no order with this orderID in the var.orders. The
                 order was not sent via Tmatic. Possibly retrieved from
@@ -555,14 +533,12 @@ class Function(WS, Variables):
                         if emi in Bots.keys():
                             if Bots[emi].multitrade:
                                 if Bots[emi].state != "Disconnected":
-                                    t = threading.Thread(
-                                        target=service.call_bot_function,
-                                        args=(
-                                            robo.run_bot[emi],
-                                            emi,
-                                        ),
+                                    BotExecutor.submit(
+                                        bot_name=emi,
+                                        function=run_bot_thread,
+                                        args=(emi,),
+                                        policy="queue",
                                     )
-                                    t.start()
                     var.queue_order.put(
                         {"action": "delete", "clOrdID": clOrdID, "market": self.name}
                     )
@@ -651,10 +627,10 @@ class Function(WS, Variables):
         if emi in var.orders and clOrdID in var.orders[emi]:
             var.queue_order.put({"action": "put", "order": var.orders[emi][clOrdID]})
             var.orders[emi].move_to_end(clOrdID)
-        disp.bot_orders_processing = True
+        var.bot_orders_processing = True
 
     def trades_display(
-        self: Markets, val: dict, table: TreeviewTable, init=False
+        self: Markets, val: dict, table: "TreeviewTable", init=False
     ) -> Union[None, list]:
         """
         Update trades widget
@@ -773,74 +749,105 @@ class Function(WS, Variables):
                 number = number + "0"
         return number
 
-    def kline_update_market(self: Markets, utcnow: datetime) -> None:
+    def kline_update_market(self: Markets, utcnow: datetime, timeframes: list) -> None:
         """
-        Processing timeframes.
+        Processing the klines whose periods have closed, see kline_update().
+        The timeframes are processed in ascending order, so that a closed
+        period of a base timeframe is added to the derived timeframes
+        before they are processed. Then the klines are scheduled for the
+        closing of the next period.
+
+        Parameters
+        ----------
+        utcnow: datetime
+            Current time.
+        timeframes: list
+            (symbol, timefr) elements.
         """
-        for symbol, kline in self.klines.items():
-            for timefr, values in kline.items():
-                timefr_minutes = var.timeframe_human_format[timefr]
-                if utcnow > values["time"] + timedelta(minutes=timefr_minutes):
-                    instrument = self.Instrument[symbol]
-                    bot_list = list()
-                    for bot_name in values["robots"]:
-                        bot = Bots[bot_name]
-                        if bot.timefr == timefr:
-                            if not bot.error_message:
-                                if bot.state != "Disconnected":
-                                    bot_list.append(bot_name)
-                                    service.call_bot_function(
-                                        function=robo.update_bot[bot_name],
-                                        bot_name=bot_name,
-                                    )
-                    run_bots(bot_list=bot_list)
-                    Function.save_kline_data(
-                        self,
-                        row=values["data"][-1],
-                        symbol=symbol,
-                        timefr=timefr,
+        timeframes = sorted(timeframes, key=lambda x: var.timeframe_human_format[x[1]])
+        for symbol, timefr in timeframes:
+            kline = self.klines.get(symbol)
+            if not kline or timefr not in kline:
+                continue
+            values = kline[timefr]
+            timefr_minutes = var.timeframe_human_format[timefr]
+            if utcnow >= values["time"] + timedelta(minutes=timefr_minutes):
+                instrument = self.Instrument[symbol]
+                bot_list = list()
+                for bot_name in values["robots"]:
+                    bot = Bots[bot_name]
+                    if bot.timefr == timefr:
+                        if not bot.error_message:
+                            if bot.state != "Disconnected":
+                                bot_list.append(bot_name)
+                                service.call_bot_function(
+                                    function=robo.update_bot[bot_name],
+                                    bot_name=bot_name,
+                                )
+                run_bots(bot_list=bot_list)
+                Function.save_kline_data(
+                    self,
+                    row=values["data"][-1],
+                    symbol=symbol,
+                    timefr=timefr,
+                )
+                closed = values["data"]
+                for value in kline.values():
+                    if value.get("base") == timefr and value["data"]:
+                        if closed.hi[-1] > value["data"].hi[-1]:
+                            value["data"].hi[-1] = closed.hi[-1]
+                        if closed.lo[-1] < value["data"].lo[-1]:
+                            value["data"].lo[-1] = closed.lo[-1]
+                timestamp = utcnow.timestamp()
+                dt_now = datetime.fromtimestamp(
+                    timestamp - timestamp % (timefr_minutes * 60), tz=timezone.utc
+                )
+                try:
+                    ask = instrument.asks[0][0]
+                except IndexError:
+                    message = ErrorMessage.EMPTY_ORDERBOOK_DATA_KLINE.format(
+                        SIDE="ask",
+                        SYMBOL=symbol,
+                        PRICE=values["data"][-1]["open_ask"],
                     )
-                    next_minute = int(utcnow.minute / timefr_minutes) * timefr_minutes
-                    dt_now = utcnow.replace(minute=next_minute, second=0, microsecond=0)
-                    try:
-                        ask = instrument.asks[0][0]
-                    except IndexError:
-                        message = ErrorMessage.EMPTY_ORDERBOOK_DATA_KLINE.format(
-                            SIDE="ask",
-                            SYMBOL=symbol,
-                            PRICE=values["data"][-1]["open_ask"],
-                        )
-                        _put_message(
-                            market=instrument.market, message=message, warning=True
-                        )
-                        ask = values["data"][-1]["open_ask"]
-                    try:
-                        bid = instrument.bids[0][0]
-                    except IndexError:
-                        message = ErrorMessage.EMPTY_ORDERBOOK_DATA_KLINE.format(
-                            SIDE="bid",
-                            SYMBOL=symbol,
-                            PRICE=values["data"][-1]["open_bid"],
-                        )
-                        _put_message(
-                            market=instrument.market, message=message, warning=True
-                        )
-                        bid = values["data"][-1]["open_bid"]
-                    values["data"].append(
-                        {
-                            "date": (utcnow.year - 2000) * 10000
-                            + utcnow.month * 100
-                            + utcnow.day,
-                            "time": utcnow.hour * 100 + utcnow.minute,
-                            "open_bid": bid,
-                            "open_ask": ask,
-                            "hi": ask,
-                            "lo": bid,
-                            "funding": instrument.fundingRate,
-                            "datetime": dt_now,
-                        }
+                    _put_message(
+                        market=instrument.market, message=message, warning=True
                     )
-                    values["time"] = dt_now
+                    ask = values["data"][-1]["open_ask"]
+                try:
+                    bid = instrument.bids[0][0]
+                except IndexError:
+                    message = ErrorMessage.EMPTY_ORDERBOOK_DATA_KLINE.format(
+                        SIDE="bid",
+                        SYMBOL=symbol,
+                        PRICE=values["data"][-1]["open_bid"],
+                    )
+                    _put_message(
+                        market=instrument.market, message=message, warning=True
+                    )
+                    bid = values["data"][-1]["open_bid"]
+                base = values.get("base")
+                if base in kline and kline[base]["data"]:
+                    if kline[base]["data"].datetime[-1] == dt_now:
+                        ask = kline[base]["data"].open_ask[-1]
+                        bid = kline[base]["data"].open_bid[-1]
+                values["data"].append(
+                    {
+                        "date": (dt_now.year - 2000) * 10000
+                        + dt_now.month * 100
+                        + dt_now.day,
+                        "time": dt_now.hour * 100 + dt_now.minute,
+                        "open_bid": bid,
+                        "open_ask": ask,
+                        "hi": ask,
+                        "lo": bid,
+                        "funding": instrument.fundingRate,
+                        "datetime": dt_now,
+                    }
+                )
+                IntraBar.reset(symbol)
+                values["time"] = dt_now
+            schedule_kline(self, symbol=symbol, timefr=timefr)
 
     def refresh_on_screen(self: Markets, utc: datetime) -> None:
         """
@@ -866,13 +873,22 @@ class Function(WS, Variables):
             disp.last_gmtime_sec = current_time.tm_sec
         Function.refresh_tables(self)
 
-    def display_instruments(self: Markets, indx=0):
+    def display_instruments(self: Markets, indx=0, dirty: set = None):
+        """
+        Updates the instrument table. If ``dirty`` is a set, only the rows
+        of the instruments in it are compared and updated, other rows
+        already in the table are skipped.
+        """
         tree = TreeTable.instrument
         # d tm = datetime.now()
         for market in var.market_list:
             ws = Markets[market]
             if market == var.current_market:
                 for symbol in ws.symbol_list:
+                    iid = f"{symbol[1]}!{symbol[0]}"
+                    if dirty is not None and symbol not in dirty:
+                        if iid in tree.children_hierarchical[market]:
+                            continue
                     instrument = ws.Instrument[symbol]
                     compare = [
                         symbol[0],
@@ -884,7 +900,6 @@ class Function(WS, Variables):
                         instrument.volume24h,
                         instrument.expire,
                     ]
-                    iid = f"{symbol[1]}!{symbol[0]}"
                     if iid in tree.children_hierarchical[market]:
                         if compare != tree.cache[iid]:
                             tree.cache[iid] = compare.copy()
@@ -1222,9 +1237,30 @@ class Function(WS, Variables):
 
         # service.count_orders()
 
+        # The websockets mark the changed instruments, order books and
+        # accounts, see Changes. Only the rows marked since the previous
+        # refresh are updated, unless the view has changed or a second has
+        # passed since the last full refresh, which also picks up values
+        # changed by http requests.
+
+        version = Changes.version
+        orders_version = var.orders.version
+        view = (var.current_market, var.symbol, current_notebook_tab)
+        full = (
+            view != disp.shown_view
+            or time.monotonic() - disp.full_refresh_time >= disp.full_refresh_interval
+        )
+        if full:
+            instruments = None
+            disp.full_refresh_time = time.monotonic()
+        else:
+            instruments = Changes.since("instrument", disp.shown_version)
+        changed = full or version != disp.shown_version
+        changed_orders = orders_version != disp.shown_orders_version
+
         # Refresh instrument table
 
-        Function.display_instruments(self)
+        Function.display_instruments(self, dirty=instruments)
 
         # Refresh orderbook table
 
@@ -1302,43 +1338,55 @@ class Function(WS, Variables):
                         tree.update(row=number, values=compare)
                 count += 1
 
-        num = int(disp.num_book / 2)
-        display_order_book_values(
-            val=instrument.bids,
-            start=num,
-            end=disp.num_book,
-            direct=1,
-            side="bids",
-        )
-        display_order_book_values(
-            val=instrument.asks,
-            start=num - 1,
-            end=-1,
-            direct=-1,
-            side="asks",
-        )
+        if (
+            full
+            or changed_orders
+            or var.symbol in Changes.since("orderbook", disp.shown_version)
+        ):
+            num = int(disp.num_book / 2)
+            display_order_book_values(
+                val=instrument.bids,
+                start=num,
+                end=disp.num_book,
+                direct=1,
+                side="bids",
+            )
+            display_order_book_values(
+                val=instrument.asks,
+                start=num - 1,
+                end=-1,
+                direct=-1,
+                side="asks",
+            )
         # d print("___orderbook", datetime.now() - tm)
 
         # Refresh account table
 
         if current_notebook_tab == "Account":
-            Function.display_account(self)
+            if full or Changes.since("account", disp.shown_version):
+                Function.display_account(self)
 
         # Refresh result table
 
         elif current_notebook_tab == "Results":
-            Function.display_results(self)
+            if changed or changed_orders:
+                Function.display_results(self)
 
         # Refresh position table
 
         elif current_notebook_tab == "Positions":
-            Function.display_positions(self)
+            if changed or changed_orders:
+                Function.display_positions(self)
 
         # Refresh bots table
 
         elif current_notebook_tab == "Bots":
             Function.display_robots(self)
 
+        disp.shown_version = version
+        disp.shown_orders_version = orders_version
+        disp.shown_view = view
+
         # Refresh instrument parameters
 
         Function.display_parameters(self, instrument)
@@ -1435,9 +1483,9 @@ class Function(WS, Variables):
             # Bot orders table
 
             elif current_bot_note_tab == "Orders":
-                if disp.bot_orders_processing:
+                if var.bot_orders_processing:
                     bot_menu.refresh_bot_orders()
-                    disp.bot_orders_processing = False
+                    var.bot_orders_processing = False
 
             # Bot results table
 
@@ -1529,7 +1577,7 @@ class Function(WS, Variables):
         return compare
 
     def update_result_line(
-        self, iid: str, compare: list, market: str, tree: TreeviewTable
+        self, iid: str, compare: list, market: str, tree: "TreeviewTable"
     ) -> None:
         def form_result_line(compare):
             for num in range(len(compare)):
@@ -1555,7 +1603,7 @@ class Function(WS, Variables):
         columns: list,
         symbol: tuple,
         market: str,
-        tree: TreeviewTable,
+        tree: "TreeviewTable",
     ) -> None:
         def form_line(compare):
             for column in columns:
@@ -1715,11 +1763,7 @@ class Function(WS, Variables):
         TreeTable.market.tree.update()
 
     def find_order(self: Markets, price: float, symbol: str) -> Union[float, str]:
-        qty = 0
-        for values in var.orders.values():
-            for value in values.values():
-                if value["price"] == price and value["symbol"] == symbol:
-                    qty += value["leavesQty"]
+        qty = var.orders.level_qty(symbol=symbol, price=price)
         if not qty:
             qty = ""
 
@@ -2680,16 +2724,16 @@ def clear_tables():
 
 
 def run_bot_thread(bot_name):
-    service.call_bot_function(function=robo.run_bot[bot_name], bot_name=bot_name)
+    service.call_bot_function(function=robo.run_bot.get(bot_name), bot_name=bot_name)
 
 
 def run_bots(bot_list: list) -> None:
+    """
+    Passes run_bot() of the bots to the BotExecutor. If a bot has not yet
+    finished the previous bar, the call is handled by its overrun policy.
+    """
     for bot_name in bot_list:
-        t = threading.Thread(
-            target=run_bot_thread,
-            args=(bot_name,),
-        )
-        t.start()
+        BotExecutor.submit(bot_name=bot_name, function=run_bot_thread, args=(bot_name,))
 
 
 """def target_time(timeframe_sec):
@@ -2722,27 +2766,60 @@ def download_kline_data(
     return res
 
 
+def schedule_kline(self: Markets, symbol: tuple, timefr: str) -> None:
+    """
+    Schedules processing of the kline at the closing of its current period.
+    Called when a period begins or the data is loaded, so the intrabar
+    bounds of the symbol are also reset.
+    """
+    IntraBar.reset(symbol)
+    values = self.klines[symbol][timefr]
+    deadline = values["time"] + timedelta(minutes=var.timeframe_human_format[timefr])
+    KlineScheduler.schedule(
+        key=(self.name, symbol, timefr), deadline=deadline.timestamp()
+    )
+
+
 def kline_update():
-    while var.kline_update_active:
-        utcnow = datetime.now(tz=timezone.utc)
-        var.lock_kline_update.acquire(True)
-        threads = []
-        for market in var.market_list:
-            ws = Markets[market]
-            if ws.api_is_active:
-                t = threading.Thread(
-                    target=Function.kline_update_market,
-                    args=(
-                        ws,
-                        utcnow,
-                    ),
-                )
-                threads.append(t)
-                t.start()
-        [thread.join() for thread in threads]
-        var.lock_kline_update.release()
-        rest = 1 - time.time() % 1
-        time.sleep(rest)
+    """
+    Sleeps until the nearest closing of a kline period, see KlineScheduler,
+    and processes the klines closed at that moment. If the market is
+    reloading, the klines are checked again in a second.
+    """
+    with ThreadPoolExecutor(
+        max_workers=len(Markets.names), thread_name_prefix="kline"
+    ) as pool:
+        while var.kline_update_active:
+            due = KlineScheduler.wait()
+            if not due:
+                continue
+            utcnow = datetime.now(tz=timezone.utc)
+            markets = dict()
+            for market, symbol, timefr in due:
+                if market not in markets:
+                    markets[market] = list()
+                markets[market].append((symbol, timefr))
+            var.lock_kline_update.acquire(True)
+            futures = []
+            for market, timeframes in markets.items():
+                ws = Markets[market]
+                if ws.api_is_active:
+                    futures.append(
+                        pool.submit(
+                            Function.kline_update_market, ws, utcnow, timeframes
+                        )
+                    )
+                else:
+                    for symbol, timefr in timeframes:
+                        KlineScheduler.schedule(
+                            key=(market, symbol, timefr), deadline=time.time() + 1
+                        )
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as exception:
+                    service.display_exception(exception)
+            var.lock_kline_update.release()
 
 
 def merge_klines(data: list, timefr_minutes: int, prev: int):
@@ -2808,38 +2885,73 @@ def load_klines(
     symbol: tuple,
     timefr: str,
     klines: dict,
+    number: int = 0,
 ) -> Union[dict, None]:
     """
-    Loading kline data from the exchange server. Data is recorded
-    in files for each timeframe. Every time you reboot the files are
-    overwritten.
+    Loading kline data. The series kept in memory since the previous loading
+    is updated from its latest period, so on a reload only the missing
+    periods are downloaded from the exchange server. If there is no such
+    series or the gap is larger than its capacity, the closed periods are
+    taken from the binary archive for each symbol and timeframe, provided
+    that it reaches the required CANDLESTICK_NUMBER periods, otherwise the
+    whole range is downloaded.
+
+    The number parameter is the number of periods required, if omitted
+    CANDLESTICK_NUMBER. It is larger for the base timeframes, from which
+    other timeframes are derived, see kline_bases(), and the series then
+    holds at least this number of periods.
     """
-    filename = Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
-    with open(filename, "w") as f:
-        f.write("date;time;open_bid;open_ask;hi;lo;fund" + "\n")
+    if not number:
+        number = robo.CANDLESTICK_NUMBER
+    archive = KlineArchive.get(
+        Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
+    )
     target = datetime.now(tz=timezone.utc)
     target = target.replace(second=0, microsecond=0)
     timefr_minutes = var.timeframe_human_format[timefr]
     original = timefr_minutes
-    prev = 1
-    for tf_min in reversed(self.timefrs.keys()):
-        if tf_min == timefr_minutes:
-            prev = tf_min
-            break
-        elif tf_min < timefr_minutes:
-            if timefr_minutes % tf_min == 0:
-                prev = tf_min
-                break
+    prev = kline_download_timeframe(self, minutes=timefr_minutes)
     factor = int(timefr_minutes / prev)
     timefr_minutes = prev
     start_time = target - timedelta(
-        minutes=robo.CANDLESTICK_NUMBER * timefr_minutes * factor - timefr_minutes
+        minutes=number * timefr_minutes * factor - timefr_minutes
     )
     delta = timedelta(
         minutes=target.minute % timefr_minutes + (target.hour * 60) % timefr_minutes
     )
     target -= delta
 
+    # Only the tail is downloaded if there is no gap between the series in
+    # memory or the archive and the required range. The current period is
+    # never archived, so at least one period is downloaded.
+
+    series = klines[symbol][timefr]["data"]
+    first = start_time
+    archived = archive.last_datetime()
+    last = None
+    reach = first + timedelta(minutes=original)
+    if series:
+        last = series.datetime[-1]
+        gap = timedelta(minutes=original * series.capacity)
+        if target - gap < last <= target and series.datetime[0] <= reach:
+            source = "memory"
+            start_time = last
+        else:
+            last = None
+    if last is None:
+        if (
+            archived
+            and start_time - timedelta(minutes=original) <= archived < target
+            and archive.first_datetime() <= reach
+        ):
+            source = "archive"
+            last = archived
+            start_time = last + timedelta(minutes=original)
+        else:
+            source = "exchange"
+    if last is not None and start_time >= target:
+        start_time = last - timedelta(minutes=original)
+
     # Loading timeframe data
 
     res = download_kline_data(
@@ -2866,10 +2978,30 @@ def load_klines(
         res.reverse()
     if factor > 1:
         res = merge_klines(data=res, timefr_minutes=original, prev=prev)
-    klines[symbol][timefr]["data"] = []
-    for num, row in enumerate(res):
+    if source == "memory":
+        res = [row for row in res if row["timestamp"] >= last]
+    elif source == "archive":
+        res = [row for row in res if row["timestamp"] > last]
+    if not res:
+        message = str(symbol) + " " + str(timefr) + " kline data was not loaded!"
+        var.logger.error(message)
+        return None
+    klines[symbol][timefr]["base"] = None
+    if source == "memory":
+        if res[0]["timestamp"] == last:
+            row = res.pop(0)
+            if float(row["high"]) > series.hi[-1]:
+                series.hi[-1] = float(row["high"])
+            if float(row["low"]) < series.lo[-1]:
+                series.lo[-1] = float(row["low"])
+    else:
+        series = KlineSeries(capacity=kline_capacity(number=number))
+        if source == "archive":
+            for row in archive.rows(start=first):
+                series.append(row)
+    for row in res:
         tm = row["timestamp"]  # - timedelta(minutes=timefr_minutes)
-        klines[symbol][timefr]["data"].append(
+        series.append(
             {
                 "date": (tm.year - 2000) * 10000 + tm.month * 100 + tm.day,
                 "time": tm.hour * 100 + tm.minute,
@@ -2880,14 +3012,154 @@ def load_klines(
                 "datetime": tm,
             }
         )
-        if num < len(res) - 1:
-            Function.save_kline_data(
-                self,
-                row=klines[symbol][timefr]["data"][-1],
-                symbol=symbol,
-                timefr=timefr,
+
+    archive_closed_klines(self, symbol=symbol, timefr=timefr, series=series)
+    klines[symbol][timefr]["data"] = series
+    klines[symbol][timefr]["time"] = series.datetime[-1]
+    schedule_kline(self, symbol=symbol, timefr=timefr)
+
+    return klines
+
+
+def kline_capacity(number: int = 0) -> int:
+    """
+    Returns the capacity of a new kline series: CANDLESTICK_CAPACITY, but
+    not less than CANDLESTICK_NUMBER and the number of periods loaded.
+    """
+    return max(number, robo.CANDLESTICK_NUMBER, robo.CANDLESTICK_CAPACITY)
+
+
+def archive_closed_klines(
+    self: Markets, symbol: tuple, timefr: str, series: KlineSeries
+) -> None:
+    """
+    Saves closed periods of the series that are not yet in the archive. The
+    latest period is not closed.
+    """
+    filename = Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
+    archived = KlineArchive.get(filename).last_datetime()
+    closed = list()
+    for num in range(len(series) - 2, -1, -1):
+        if archived and series.datetime[num] <= archived:
+            break
+        closed.append(num)
+    for num in reversed(closed):
+        Function.save_kline_data(self, row=series[num], symbol=symbol, timefr=timefr)
+
+
+def kline_download_timeframe(self: Markets, minutes: int) -> int:
+    """
+    Returns the timeframe of the exchange in which the kline data of the
+    given timeframe is downloaded: the same timeframe or the largest one
+    that it is a multiple of, then the periods are merged.
+    """
+    for tf_min in reversed(self.timefrs.keys()):
+        if tf_min == minutes:
+            return tf_min
+        elif tf_min < minutes:
+            if minutes % tf_min == 0:
+                return tf_min
+
+    return 1
+
+
+def kline_requests(self: Markets, minutes: int, number: int) -> int:
+    """
+    Returns the number of requests needed to download the given number of
+    periods of the timeframe, up to var.kline_rows periods per request.
+    """
+    rows = number * (minutes // kline_download_timeframe(self, minutes=minutes))
+
+    return -(-rows // var.kline_rows)
+
+
+def kline_bases(self: Markets, symbol: tuple) -> Tuple[dict, dict]:
+    """
+    Distributes the timeframes of the symbol between the base timeframes,
+    which are loaded from the exchange, and the timeframes derived from the
+    base. A timeframe is derived from the smallest timeframe of the symbol
+    if it is a multiple of it and the additional base periods required for
+    CANDLESTICK_NUMBER periods of the derived timeframe do not take more
+    requests than downloading the timeframe itself. For example, 5min is
+    derived from 1min, since 750 periods of 1min fit in one request, while
+    1h and 1d are downloaded.
+
+    Returns
+    -------
+    tuple
+        The base timeframes with the number of periods to load, and the
+        derived timeframes with their base timeframes.
+    """
+    timeframes = sorted(
+        self.klines[symbol].keys(), key=lambda x: var.timeframe_human_format[x]
+    )
+    bases, derived = dict(), dict()
+    if not timeframes:
+        return bases, derived
+    base = timeframes[0]
+    base_minutes = var.timeframe_human_format[base]
+    bases[base] = robo.CANDLESTICK_NUMBER
+    for timefr in timeframes[1:]:
+        minutes = var.timeframe_human_format[timefr]
+        if minutes % base_minutes == 0:
+            number = max(bases[base], robo.CANDLESTICK_NUMBER * minutes // base_minutes)
+            before = kline_requests(self, minutes=base_minutes, number=bases[base])
+            after = kline_requests(self, minutes=base_minutes, number=number)
+            direct = kline_requests(
+                self, minutes=minutes, number=robo.CANDLESTICK_NUMBER
+            )
+            if after - before <= direct:
+                derived[timefr] = base
+                bases[base] = number
+                continue
+        bases[timefr] = robo.CANDLESTICK_NUMBER
+
+    return bases, derived
+
+
+def derive_klines(
+    self: Markets, symbol: tuple, timefr: str, base: str, klines: dict
+) -> Union[dict, None]:
+    """
+    Builds kline data of the timefr from the data of the base timeframe of
+    the same symbol, without requests to the exchange. If the base data
+    starts in the middle of a period, this period is skipped.
+    """
+    source = klines[symbol][base]["data"]
+    if not source:
+        return None
+    period = var.timeframe_human_format[timefr] * 60
+    series = KlineSeries(capacity=kline_capacity())
+    for row in source:
+        timestamp = row["datetime"].timestamp()
+        start = timestamp - timestamp % period
+        if series and series.datetime[-1].timestamp() == start:
+            if row["hi"] > series.hi[-1]:
+                series.hi[-1] = row["hi"]
+            if row["lo"] < series.lo[-1]:
+                series.lo[-1] = row["lo"]
+            series.funding[-1] = row["funding"]
+        elif series or start == timestamp:
+            tm = datetime.fromtimestamp(start, tz=timezone.utc)
+            series.append(
+                {
+                    "date": (tm.year - 2000) * 10000 + tm.month * 100 + tm.day,
+                    "time": tm.hour * 100 + tm.minute,
+                    "open_bid": row["open_bid"],
+                    "open_ask": row["open_ask"],
+                    "hi": row["hi"],
+                    "lo": row["lo"],
+                    "funding": row["funding"],
+                    "datetime": tm,
+                }
             )
-    klines[symbol][timefr]["time"] = tm
+    if not series:
+        return None
+    archive_closed_klines(self, symbol=symbol, timefr=timefr, series=series)
+    klines[symbol][timefr]["data"] = series
+    klines[symbol][timefr]["time"] = series.datetime[-1]
+    schedule_kline(self, symbol=symbol, timefr=timefr)
+    klines[symbol][timefr]["base"] = base
 
     return klines
 
@@ -2908,9 +3180,11 @@ def add_new_kline(self: Markets, symbol: tuple, bot_name: str, timefr: str) -> N
             "time": time,
             "robots": set(),
             "open": 0,
-            "data": [],
+            "base": None,
+            "data": KlineSeries(capacity=kline_capacity()),
         }
         self.klines[symbol][timefr]["robots"].add(bot_name)
+        schedule_kline(self, symbol=symbol, timefr=timefr)
 
     try:
         self.klines[symbol][timefr]["robots"].add(bot_name)
@@ -2926,18 +3200,23 @@ def init_market_klines(
     self: Markets,
 ) -> Union[dict, None]:
     """
-    Downloads kline data from the endpoint of the specific exchange.
+    Downloads kline data from the endpoint of the specific exchange. Only
+    the base timeframes are downloaded, the others are derived from them,
+    see kline_bases().
     """
 
     success = []
 
-    def get_in_thread(symbol: tuple, timefr: str, klines: dict, number: int):
+    def get_in_thread(
+        symbol: tuple, timefr: str, klines: dict, number: int, periods: int
+    ):
         nonlocal success
         res = load_klines(
             self,
             symbol=symbol,
             timefr=timefr,
             klines=klines,
+            number=periods,
         )
         if not res:
             return
@@ -2945,13 +3224,15 @@ def init_market_klines(
         success[number] = "success"
 
     threads = []
+    derived = dict()
 
-    for symbol, timeframes in self.klines.items():
-        for timefr in timeframes.keys():
+    for symbol in self.klines.keys():
+        bases, derived[symbol] = kline_bases(self, symbol=symbol)
+        for timefr, periods in bases.items():
             success.append(None)
             t = threading.Thread(
                 target=get_in_thread,
-                args=(symbol, timefr, self.klines, len(success) - 1),
+                args=(symbol, timefr, self.klines, len(success) - 1, periods),
             )
 
             threads.append(t)
@@ -2960,6 +3241,12 @@ def init_market_klines(
     for s in success:
         if not s:
             return
+    for symbol, timeframes in derived.items():
+        for timefr, base in timeframes.items():
+            if not derive_klines(
+                self, symbol=symbol, timefr=timefr, base=base, klines=self.klines
+            ):
+                return
 
     return "success"
 
@@ -2975,12 +3262,27 @@ def init_bot_klines(bot_name: str) -> None:
         ws: Markets, symbol: tuple, timefr: str, klines: dict, number: int
     ):
         nonlocal success
-        res = load_klines(
-            ws,
-            symbol=symbol,
-            timefr=timefr,
-            klines=klines,
-        )
+        bases, derived = kline_bases(ws, symbol=symbol)
+        res = None
+        if timefr in derived and klines[symbol][derived[timefr]]["data"]:
+            base = klines[symbol][derived[timefr]]["data"]
+            minutes = var.timeframe_human_format[timefr]
+            reach = timedelta(minutes=minutes * robo.CANDLESTICK_NUMBER)
+            if base.datetime[-1] - base.datetime[0] >= reach:
+                res = derive_klines(
+                    ws,
+                    symbol=symbol,
+                    timefr=timefr,
+                    base=derived[timefr],
+                    klines=klines,
+                )
+        if not res:
+            res = load_klines(
+                ws,
+                symbol=symbol,
+                timefr=timefr,
+                klines=klines,
+            )
         if not res:
             return
         success[number] = "success"
@@ -3054,6 +3356,8 @@ def remove_bot_klines(bot_name: str) -> None:
                     ws.klines[symbol][timefr]["robots"].remove(bot_name)
                     if not ws.klines[symbol][timefr]["robots"]:
                         var.lock_kline_update.acquire(True)
+                        KlineScheduler.cancel(key=(market, symbol, timefr))
+                        IndicatorStream.remove(key=(symbol, timefr))
                         del ws.klines[symbol][timefr]
                         if not ws.klines:
                             del ws.klines[symbol]
@@ -3069,6 +3373,8 @@ def setup_klines():
         if init_market_klines(ws):
             success[ws.name] = "success"
 
+    for market in var.market_list:
+        remove_unused_klines(Markets[market])
     market_list = var.market_list.copy()
     while market_list:
         threads = []
@@ -3115,10 +3421,25 @@ def _put_message(market: str, message: str, warning=None, logger=True) -> None:
 
 def clear_klines():
     """
-    Erase all kline data.
+    Erase the bots from kline data. The kline series are kept, so that on
+    reboot only the missing periods are loaded, see load_klines(). The
+    series that are no longer used by any bot are removed by setup_klines().
     """
     for market in var.market_list:
-        Markets[market].klines = dict()
+        for timeframes in Markets[market].klines.values():
+            for values in timeframes.values():
+                values["robots"] = set()
+
+
+def remove_unused_klines(ws: Markets) -> None:
+    for symbol, timeframes in ws.klines.copy().items():
+        for timefr, values in timeframes.copy().items():
+            if not values["robots"]:
+                KlineScheduler.cancel(key=(ws.name, symbol, timefr))
+                IndicatorStream.remove(key=(symbol, timefr))
+                del timeframes[timefr]
+        if not timeframes:
+            del ws.klines[symbol]
 
 
 def update_instruments():
@@ -3218,225 +3539,11 @@ def update_instruments():
             )
 
 
-TreeTable.orderbook = TreeviewTable(
-    frame=disp.frame_orderbook,
-    name="orderbook",
-    title=Header.name_book,
-    size=disp.num_book,
-    style="orderbook.Treeview",
-    bind=handler_orderbook,
-    multicolor=True,
-    autoscroll=True,
-)
-TreeTable.i_options = SubTreeviewTable(
-    frame=disp.frame_i_options,
-    name="options",
-    title=Header.name_i_options,
-    bind=handler_option,
-)
-
-TreeTable.i_options.tree.column("#1", width=200)
-TreeTable.i_options.tree.column("#2", width=80)
-TreeTable.i_options.tree.column("#3", width=80)
-TreeTable.i_options.tree.column("#4", width=80)
-TreeTable.i_options.tree.column("#5", width=80)
-TreeTable.i_options.tree.column("#6", width=80)
-
-TreeTable.instrument = SubTreeviewTable(
-    frame=disp.frame_instrument,
-    name="instrument",
-    title=Header.name_instrument,
-    bind=handler_instrument,
-    hierarchy=True,
-    lines=var.market_list,
-    subtable=TreeTable.i_options,
-    hide=["7", "8", "2"],
-)
-
-TreeTable.i_options.main_table = TreeTable.instrument
-TreeTable.instrument.main_table = TreeTable.instrument
-
-TreeTable.account = TreeviewTable(
-    frame=disp.frame_account,
-    name="account",
-    title=Header.name_account,
-    bind=handler_account,
-    hierarchy=True,
-    lines=var.market_list,
-    hide=["3", "5", "6"],
-)
-TreeTable.i_symbols = SubTreeviewTable(
-    frame=disp.frame_i_symbols,
-    name="symbols",
-    size=0,
-    style="menu.Treeview",
-    title=["Symbol"],
-    bind=handler_subscription,
-)
-
-TreeTable.i_symbols.tree.column("#1", width=250)
-
-TreeTable.i_currency = SubTreeviewTable(
-    frame=disp.frame_i_currency,
-    name="currency",
-    size=0,
-    style="menu.Treeview",
-    title=["Currency"],
-    subtable=TreeTable.i_symbols,
-)
-
-TreeTable.i_currency.tree.column("#1", width=150)
-
-TreeTable.i_category = SubTreeviewTable(
-    frame=disp.frame_i_category,
-    name="category",
-    size=0,
-    style="menu.Treeview",
-    title=["Category"],
-    subtable=TreeTable.i_currency,
-)
-
-TreeTable.i_category.tree.column("#1", width=150)
-
-TreeTable.market = SubTreeviewTable(
-    frame=disp.frame_market,
-    name="market",
-    title=Header.name_market,
-    size=var.market_list,
-    style="market.Treeview",
-    autoscroll=True,
-    subtable=TreeTable.i_category,
-    selectmode="none",
-)
-
-TreeTable.i_symbols.main_table = TreeTable.market
-TreeTable.i_currency.main_table = TreeTable.market
-TreeTable.i_category.main_table = TreeTable.market
-TreeTable.market.main_table = TreeTable.market
-
-TreeTable.results = TreeviewTable(
-    frame=disp.frame_results,
-    name="results",
-    title=Header.name_results,
-    hierarchy=True,
-    lines=var.market_list,
-)
-TreeTable.position = TreeviewTable(
-    frame=disp.frame_positions,
-    name="position",
-    title=Header.name_position,
-    hierarchy=True,
-    lines=var.market_list,
-)
-TreeTable.bots = TreeviewTable(
-    frame=disp.frame_bots,
-    name="bots",
-    title=Header.name_bots,
-    bind=handler_bot,
-    hierarchy=False,
-)
-TreeTable.bot_menu = TreeviewTable(
-    frame=bot_menu.menu_frame,
-    name="bot_menu",
-    title=Header.name_bot_menu,
-    style="bots.Treeview",
-    bind=bot_menu.handler_bot_menu,
-    autoscroll=True,
-    hierarchy=True,
-    rollup=True,
-)
-TreeTable.bot_info = TreeviewTable(
-    frame=disp.frame_bot_parameters,
-    name="bot_info",
-    title=Header.name_bot,
-    bind=bot_menu.handler_bot_info,
-    size=1,
-    autoscroll=True,
-)
-TreeTable.bot_position = TreeviewTable(
-    frame=disp.bot_positions,
-    name="bot_position",
-    title=Header.name_bot_position,
-    autoscroll=True,
-    hierarchy=True,
-    lines=var.market_list,
-)
-TreeTable.bot_results = TreeviewTable(
-    frame=disp.bot_results,
-    name="bot_results",
-    title=Header.name_bot_results,
-    autoscroll=True,
-    hierarchy=True,
-)
-TreeTable.orders = TreeviewTable(
-    frame=disp.frame_orders,
-    name="orders",
-    size=0,
-    title=Header.name_order,
-    bind=handler_order,
-    hide=["8", "3", "5"],
-)
-TreeTable.trades = TreeviewTable(
-    frame=disp.frame_trades,
-    name="trades",
-    size=0,
-    title=Header.name_trade,
-    bind=handler_account,
-    hide=["8", "3", "5"],
-)
-TreeTable.funding = TreeviewTable(
-    frame=disp.frame_funding,
-    name="funding",
-    size=0,
-    title=Header.name_funding,
-    bind=handler_account,
-    hide=["3", "5"],
-)
-TreeTable.bot_orders = TreeviewTable(
-    frame=disp.bot_orders,
-    name="bot_orders",
-    size=0,
-    title=Header.name_bot_order,
-    bind=handler_order,
-)
-
-
 def do_nothing(*args, **kwargs):
     pass
 
 
-disp.notebook_frames["Orders"] = {"frame": disp.frame_orders, "method": do_nothing}
-disp.notebook_frames["Positions"] = {
-    "frame": disp.frame_positions,
-    "method": Function.display_positions,
-}
-disp.notebook_frames["Trades"] = {"frame": disp.frame_trades, "method": do_nothing}
-disp.notebook_frames["Funding"] = {"frame": disp.frame_funding, "method": do_nothing}
-disp.notebook_frames["Account"] = {
-    "frame": disp.frame_account,
-    "method": Function.display_account,
-}
-disp.notebook_frames["Results"] = {
-    "frame": disp.frame_results,
-    "method": Function.display_results,
-}
-disp.notebook_frames["Bots"] = {
-    "frame": disp.frame_bots,
-    "method": Function.display_robots,
-}
-
-for name, values in disp.notebook_frames.items():
-    if name != "Bots":
-        disp.notebook.add(values["frame"], text=name)
-    else:
-        var.display_bottom = values["method"]
-if "MAIN_TAB_SELECTED" in disp.pref_params:
-    disp.notebook.select(disp.pref_params["MAIN_TAB_SELECTED"])
-if "BOT_TAB_SELECTED" in disp.pref_params:
-    disp.bot_note.select(disp.pref_params["BOT_TAB_SELECTED"])
-
-
-def form_trace(item, index, mode, str_var: tk.StringVar, widget: tk.Entry) -> None:
+def form_trace(item, index, mode, str_var: "tk.StringVar", widget: "tk.Entry") -> None:
     """
     Formats the price and quantity on an order form according to the
     precision of the values ​​in the specified instrument.
@@ -3484,19 +3591,236 @@ def form_trace_type(item, index, mode) -> None:
         form.buy_button.configure(text="Buy limit")
 
 
-form.sell_button.configure(command=lambda: callback_order("Sell"))
-form.buy_button.configure(command=lambda: callback_order("Buy"))
-form.price_var.trace_add(
-    "write",
-    lambda *trace: form_trace(*trace, form.price_var, form.entry_price),
-)
-form.qty_var.trace_add(
-    "write",
-    lambda *trace: form_trace(*trace, form.qty_var, form.entry_quantity),
-)
-form.type_var.trace_add(
-    "write",
-    lambda *trace: form_trace_type(*trace),
-)
+if not var.headless:
+    TreeTable.orderbook = TreeviewTable(
+        frame=disp.frame_orderbook,
+        name="orderbook",
+        title=Header.name_book,
+        size=disp.num_book,
+        style="orderbook.Treeview",
+        bind=handler_orderbook,
+        multicolor=True,
+        autoscroll=True,
+    )
+    TreeTable.i_options = SubTreeviewTable(
+        frame=disp.frame_i_options,
+        name="options",
+        title=Header.name_i_options,
+        bind=handler_option,
+    )
+
+    TreeTable.i_options.tree.column("#1", width=200)
+    TreeTable.i_options.tree.column("#2", width=80)
+    TreeTable.i_options.tree.column("#3", width=80)
+    TreeTable.i_options.tree.column("#4", width=80)
+    TreeTable.i_options.tree.column("#5", width=80)
+    TreeTable.i_options.tree.column("#6", width=80)
+
+    TreeTable.instrument = SubTreeviewTable(
+        frame=disp.frame_instrument,
+        name="instrument",
+        title=Header.name_instrument,
+        bind=handler_instrument,
+        hierarchy=True,
+        lines=var.market_list,
+        subtable=TreeTable.i_options,
+        hide=["7", "8", "2"],
+    )
+
+    TreeTable.i_options.main_table = TreeTable.instrument
+    TreeTable.instrument.main_table = TreeTable.instrument
+
+    TreeTable.account = TreeviewTable(
+        frame=disp.frame_account,
+        name="account",
+        title=Header.name_account,
+        bind=handler_account,
+        hierarchy=True,
+        lines=var.market_list,
+        hide=["3", "5", "6"],
+    )
+    TreeTable.i_symbols = SubTreeviewTable(
+        frame=disp.frame_i_symbols,
+        name="symbols",
+        size=0,
+        style="menu.Treeview",
+        title=["Symbol"],
+        bind=handler_subscription,
+    )
+
+    TreeTable.i_symbols.tree.column("#1", width=250)
+
+    TreeTable.i_currency = SubTreeviewTable(
+        frame=disp.frame_i_currency,
+        name="currency",
+        size=0,
+        style="menu.Treeview",
+        title=["Currency"],
+        subtable=TreeTable.i_symbols,
+    )
+
+    TreeTable.i_currency.tree.column("#1", width=150)
+
+    TreeTable.i_category = SubTreeviewTable(
+        frame=disp.frame_i_category,
+        name="category",
+        size=0,
+        style="menu.Treeview",
+        title=["Category"],
+        subtable=TreeTable.i_currency,
+    )
+
+    TreeTable.i_category.tree.column("#1", width=150)
+
+    TreeTable.market = SubTreeviewTable(
+        frame=disp.frame_market,
+        name="market",
+        title=Header.name_market,
+        size=var.market_list,
+        style="market.Treeview",
+        autoscroll=True,
+        subtable=TreeTable.i_category,
+        selectmode="none",
+    )
+
+    TreeTable.i_symbols.main_table = TreeTable.market
+    TreeTable.i_currency.main_table = TreeTable.market
+    TreeTable.i_category.main_table = TreeTable.market
+    TreeTable.market.main_table = TreeTable.market
+
+    TreeTable.results = TreeviewTable(
+        frame=disp.frame_results,
+        name="results",
+        title=Header.name_results,
+        hierarchy=True,
+        lines=var.market_list,
+    )
+    TreeTable.position = TreeviewTable(
+        frame=disp.frame_positions,
+        name="position",
+        title=Header.name_position,
+        hierarchy=True,
+        lines=var.market_list,
+    )
+    TreeTable.bots = TreeviewTable(
+        frame=disp.frame_bots,
+        name="bots",
+        title=Header.name_bots,
+        bind=handler_bot,
+        hierarchy=False,
+    )
+    TreeTable.bot_menu = TreeviewTable(
+        frame=bot_menu.menu_frame,
+        name="bot_menu",
+        title=Header.name_bot_menu,
+        style="bots.Treeview",
+        bind=bot_menu.handler_bot_menu,
+        autoscroll=True,
+        hierarchy=True,
+        rollup=True,
+    )
+    TreeTable.bot_info = TreeviewTable(
+        frame=disp.frame_bot_parameters,
+        name="bot_info",
+        title=Header.name_bot,
+        bind=bot_menu.handler_bot_info,
+        size=1,
+        autoscroll=True,
+    )
+    TreeTable.bot_position = TreeviewTable(
+        frame=disp.bot_positions,
+        name="bot_position",
+        title=Header.name_bot_position,
+        autoscroll=True,
+        hierarchy=True,
+        lines=var.market_list,
+    )
+    TreeTable.bot_results = TreeviewTable(
+        frame=disp.bot_results,
+        name="bot_results",
+        title=Header.name_bot_results,
+        autoscroll=True,
+        hierarchy=True,
+    )
+    TreeTable.orders = TreeviewTable(
+        frame=disp.frame_orders,
+        name="orders",
+        size=0,
+        title=Header.name_order,
+        bind=handler_order,
+        hide=["8", "3", "5"],
+    )
+    TreeTable.trades = TreeviewTable(
+        frame=disp.frame_trades,
+        name="trades",
+        size=0,
+        title=Header.name_trade,
+        bind=handler_account,
+        hide=["8", "3", "5"],
+    )
+    TreeTable.funding = TreeviewTable(
+        frame=disp.frame_funding,
+        name="funding",
+        size=0,
+        title=Header.name_funding,
+        bind=handler_account,
+        hide=["3", "5"],
+    )
+    TreeTable.bot_orders = TreeviewTable(
+        frame=disp.bot_orders,
+        name="bot_orders",
+        size=0,
+        title=Header.name_bot_order,
+        bind=handler_order,
+    )
+
+    disp.notebook_frames["Orders"] = {"frame": disp.frame_orders, "method": do_nothing}
+    disp.notebook_frames["Positions"] = {
+        "frame": disp.frame_positions,
+        "method": Function.display_positions,
+    }
+    disp.notebook_frames["Trades"] = {"frame": disp.frame_trades, "method": do_nothing}
+    disp.notebook_frames["Funding"] = {
+        "frame": disp.frame_funding,
+        "method": do_nothing,
+    }
+    disp.notebook_frames["Account"] = {
+        "frame": disp.frame_account,
+        "method": Function.display_account,
+    }
+    disp.notebook_frames["Results"] = {
+        "frame": disp.frame_results,
+        "method": Function.display_results,
+    }
+    disp.notebook_frames["Bots"] = {
+        "frame": disp.frame_bots,
+        "method": Function.display_robots,
+    }
+
+    for name, values in disp.notebook_frames.items():
+        if name != "Bots":
+            disp.notebook.add(values["frame"], text=name)
+        else:
+            var.display_bottom = values["method"]
+    if "MAIN_TAB_SELECTED" in disp.pref_params:
+        disp.notebook.select(disp.pref_params["MAIN_TAB_SELECTED"])
+    if "BOT_TAB_SELECTED" in disp.pref_params:
+        disp.bot_note.select(disp.pref_params["BOT_TAB_SELECTED"])
+
+    form.sell_button.configure(command=lambda: callback_order("Sell"))
+    form.buy_button.configure(command=lambda: callback_order("Buy"))
+    form.price_var.trace_add(
+        "write",
+        lambda *trace: form_trace(*trace, form.price_var, form.entry_price),
+    )
+    form.qty_var.trace_add(
+        "write",
+        lambda *trace: form_trace(*trace, form.qty_var, form.entry_quantity),
+    )
+    form.type_var.trace_add(
+        "write",
+        lambda *trace: form_trace_type(*trace),
+    )
+
 
 # change_color(color=disp.title_color, container=disp.root)
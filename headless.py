@@ -0,0 +1,269 @@
+"""
+Headless mode: the markets, klines, bots and the database writer run
+without the Tkinter display, e.g. on a server.
+
+    python headless.py [--host 127.0.0.1] [--port 8090] [--trading]
+
+The settings are taken from the .env.Settings and .env.Subscriptions files
+created on the settings page of the GUI. Information messages and trades
+are printed to the console, the log is written to logfile.log as usual.
+The current state (markets, positions, bots, execution statistics,
+websocket table sizes and connections, rate limits, HTTP and websocket
+request latency) is available as JSON on http://host:port/status.
+Trading is off unless --trading is given, the same as <F9> in the GUI.
+"""
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.variables import Variables as var
+
+# Must be set before the modules of the engine are imported.
+var.headless = True
+
+import functions  # noqa: E402
+import services as service  # noqa: E402
+from api.ratelimit import RateLimiter  # noqa: E402
+from api.setup import Markets  # noqa: E402
+from api.transport import Transport  # noqa: E402
+from api.wscore import WsCore  # noqa: E402
+from common.data import Bots  # noqa: E402
+from common.executor import BotExecutor  # noqa: E402
+from common.scheduler import KlineScheduler  # noqa: E402
+from common.settings import Settings  # noqa: E402
+from engine import Engine  # noqa: E402
+
+
+class Headless:
+    """
+    The main loop of the headless mode. The loop drains the queues that are
+    displayed in the GUI, completes the reloads of markets, runs the
+    websocket watchdog and, once a second, takes a snapshot of the state
+    for the status API.
+    """
+
+    active = True
+    lock = threading.Lock()
+    snapshot = dict()
+    snapshot_time = 0
+
+    @staticmethod
+    def setup() -> None:
+        Engine.clear_params()
+        if not Settings.load():
+            sys.exit(
+                "The settings file "
+                + var.settings
+                + " is not found. Set up the markets in the GUI (python main.py)"
+                + " first."
+            )
+        Engine.load_markets()
+        Engine.finish_markets()
+        Engine.load_bots()
+        Engine.activate_markets()
+
+    @staticmethod
+    def run() -> None:
+        while Headless.active:
+            Headless.refresh()
+            time.sleep(var.refresh_rate / 1000)
+
+    @staticmethod
+    def refresh() -> None:
+        while not var.queue_info.empty():
+            info = var.queue_info.get()
+            if "trades_display" in info:
+                val = info["message"]
+                message = (
+                    "Trade "
+                    + str(val["EMI"])
+                    + " "
+                    + val["SIDE"]
+                    + " "
+                    + str(val["QTY"])
+                    + " "
+                    + val["SYMBOL"][0]
+                    + " at "
+                    + str(val["TRADE_PRICE"])
+                )
+                print(
+                    service.format_message(market=val["MARKET"], message=message),
+                    end="",
+                )
+            elif "funding_display" in info:
+                val = info["message"]
+                message = (
+                    "Funding "
+                    + str(val["SYMBOL"][0])
+                    + " "
+                    + str(val["QTY"])
+                    + " at "
+                    + str(val["PRICE"])
+                    + ": "
+                    + str(val["COMMISS"])
+                )
+                print(
+                    service.format_message(market=val["MARKET"], message=message),
+                    end="",
+                )
+            elif "message" in info:
+                if "bot_log" not in info:
+                    print(
+                        service.format_message(
+                            market=info["market"],
+                            message=info["message"],
+                            tm=info["time"],
+                        ),
+                        end="",
+                    )
+                if "emi" in info and info["emi"] in Bots.keys():
+                    service.save_bot_log(
+                        bot_name=info["emi"],
+                        message=info["message"],
+                        warning=info["warning"],
+                        market=info["market"],
+                        tm=info["time"],
+                    )
+        while not var.queue_reload.empty():
+            Engine.finish_reload(ws=var.queue_reload.get())
+        while not var.queue_order.empty():
+            # The orders themselves are in var.orders, the queue only
+            # feeds the Orders table of the GUI.
+            var.queue_order.get()
+        Engine.check_markets(utc=datetime.now(tz=timezone.utc))
+        service.get_usage()
+        if time.time() - Headless.snapshot_time >= 1:
+            snapshot = Headless.status()
+            with Headless.lock:
+                Headless.snapshot = snapshot
+                Headless.snapshot_time = time.time()
+
+    @staticmethod
+    def status() -> dict:
+        """
+        Returns the state of the engine for the status API.
+        """
+        markets = dict()
+        for name in var.market_list.copy():
+            if name == "Fake":
+                continue
+            ws = Markets[name]
+            balances = dict()
+            for currency, account in ws.Account.copy().items():
+                balances[currency[0]] = {
+                    "walletBalance": account.walletBalance,
+                    "unrealisedPnl": account.unrealisedPnl,
+                    "marginBalance": account.marginBalance,
+                    "availableMargin": account.availableMargin,
+                }
+            positions = dict()
+            for symbol in ws.symbol_list.copy():
+                instrument = ws.Instrument[symbol]
+                if instrument.currentQty:
+                    positions[symbol[0]] = instrument.currentQty
+            markets[name] = {
+                "online": ws.api_is_active,
+                "error": ws.logNumFatal,
+                "account": ws.user_id,
+                "balances": balances,
+                "positions": positions,
+            }
+            if hasattr(ws, "table_usage"):
+                markets[name]["tables"] = ws.table_usage()
+            markets[name]["rate_limits"] = RateLimiter.metrics(name)
+            markets[name]["http"] = Transport.metrics(name)
+            markets[name]["websockets"] = WsCore.metrics(name)
+            if hasattr(ws, "request_latency"):
+                markets[name]["ws_requests"] = ws.request_latency()
+        bots = dict()
+        for name, bot in Bots.items():
+            positions = dict()
+            for symbol, position in bot.bot_positions.copy().items():
+                if position["position"]:
+                    positions[symbol[0] + "." + symbol[1]] = position["position"]
+            bots[name] = {
+                "state": bot.state,
+                "timefr": bot.timefr,
+                "positions": positions,
+                "orders": len(var.orders.get(name, ())),
+                "error": bot.error_message,
+                "executor": BotExecutor.statistics(name),
+            }
+
+        return {
+            "time": datetime.now(tz=timezone.utc),
+            "platform": var.platform_name,
+            "trading": var.f9,
+            "markets": markets,
+            "bots": bots,
+            "klines": KlineScheduler.jitter(),
+            "cpu": service.Variables.cpu_usage,
+            "memory": service.Variables.memory_usage,
+        }
+
+    @staticmethod
+    def stop(*args) -> None:
+        Headless.active = False
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    GET /status returns the last snapshot of Headless.status() as JSON.
+    """
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") not in ("", "/status"):
+            self.send_error(404)
+            return
+        with Headless.lock:
+            body = json.dumps(Headless.snapshot, default=str).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tmatic without the display.")
+    parser.add_argument("--host", default="127.0.0.1", help="status API host")
+    parser.add_argument(
+        "--port", type=int, default=8090, help="status API port, 0 disables it"
+    )
+    parser.add_argument("--trading", action="store_true", help="turn trading on")
+    args = parser.parse_args()
+    signal.signal(signal.SIGINT, Headless.stop)
+    signal.signal(signal.SIGTERM, Headless.stop)
+    if args.trading:
+        var.f9 = "ON"
+    thread = threading.Thread(target=functions.kline_update)
+    thread.start()
+    server = None
+    try:
+        Headless.setup()
+        if args.port:
+            server = ThreadingHTTPServer((args.host, args.port), StatusHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            var.logger.info(
+                "Status API on http://" + args.host + ":" + str(args.port) + "/status"
+            )
+        Headless.run()
+    finally:
+        if server:
+            server.shutdown()
+        service.close(Markets)
+        var.kline_update_active = False
+        KlineScheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,55 @@
-from common.data import BotData, Instrument
+import itertools
+import math
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Iterable, Union
+
+from common.data import BotData, Instrument, KlineSeries
+
+
+class BreakDownParameters(dict):
+    """
+    Parameters of a BreakDown instance. Changing ``up``, ``dn``, ``first``
+    or ``number`` moves the triggers of the instance in the indexes of its
+    symbol, see BreakDown.arm().
+    """
+
+    __slots__ = ("entries", "key")
+    TRIGGERS = ("up", "dn", "first", "number")
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.entries = {"up": None, "dn": None}
+        # (symbol, timefr), the key of the levels in BreakDown.levels.
+        self.key = None
+
+    def __setitem__(self, key, value) -> None:
+        if key in BreakDownParameters.TRIGGERS:
+            with BreakDown.lock:
+                dict.__setitem__(self, key, value)
+                BreakDown.arm(self)
+        else:
+            dict.__setitem__(self, key, value)
 
 
 class BreakDown:
+    """
+    Counts the breakdowns of the ``up`` and ``dn`` levels set by the bot.
+    After the ``up`` level is broken, only the ``dn`` level is tracked and
+    vice versa.
+
+    Besides ``symbols``, the tracked levels of all instances are kept in
+    ``levels`` for each symbol and timeframe: "up" and "dn" lists sorted by
+    price. An order book update finds the broken levels by binary search,
+    so its cost does not depend on the number of bots, see process().
+    """
+
     symbols = dict()
+    levels = dict()
+    lock = threading.RLock()
+    sequence = itertools.count()
 
     def __init__(self, instrument: Instrument, bot: BotData) -> None:
         self.symbol = (instrument.symbol, instrument.market)
@@ -16,35 +63,513 @@ class BreakDown:
         self.parameters = BreakDown.symbols[self.symbol][self.bot.timefr][self.bot.name]
 
     def setup(self):
-        BreakDown.symbols[self.symbol][self.bot.timefr][self.bot.name] = {
-            "bot_name": self.bot.name,
-            "symbol": self.symbol,
-            "up": False,
-            "dn": False,
-            "first": 0,
-            "number": 0,
-            "trades": 0,
-        }
+        timeframes = BreakDown.symbols[self.symbol][self.bot.timefr]
+        with BreakDown.lock:
+            if self.bot.name in timeframes:
+                BreakDown.disarm(timeframes[self.bot.name])
+            parameters = BreakDownParameters(
+                {
+                    "bot_name": self.bot.name,
+                    "symbol": self.symbol,
+                    "up": False,
+                    "dn": False,
+                    "first": 0,
+                    "number": 0,
+                    "trades": 0,
+                }
+            )
+            parameters.key = (self.symbol, self.bot.timefr)
+            timeframes[self.bot.name] = parameters
 
     def default(self):
         self.parameters["first"] = 0
         self.parameters["number"] = 0
         self.parameters["trades"] = 0
 
+    @staticmethod
+    def arm(parameters: BreakDownParameters) -> None:
+        """
+        Puts the levels of the instance that are tracked in the current
+        direction into the indexes and removes the rest.
+        """
+        direct = parameters["first"] * (parameters["number"] % 2 * 2 - 1)
+        tracked = {
+            "up": parameters["up"] if direct >= 0 else False,
+            "dn": parameters["dn"] if direct <= 0 else False,
+        }
+        for side, level in tracked.items():
+            entry = parameters.entries[side]
+            if entry is not None:
+                if level and entry[0] == level:
+                    continue
+                BreakDown._remove(parameters, side=side)
+            if level:
+                key = parameters.key
+                if key not in BreakDown.levels:
+                    BreakDown.levels[key] = {"up": list(), "dn": list()}
+                entry = (level, next(BreakDown.sequence), parameters)
+                insort(BreakDown.levels[key][side], entry)
+                parameters.entries[side] = entry
+
+    @staticmethod
+    def disarm(parameters: BreakDownParameters) -> None:
+        """
+        Removes the levels of the instance from the indexes.
+        """
+        with BreakDown.lock:
+            for side in ("up", "dn"):
+                if parameters.entries[side] is not None:
+                    BreakDown._remove(parameters, side=side)
+
+    @staticmethod
+    def _remove(parameters: BreakDownParameters, side: str) -> None:
+        entry = parameters.entries[side]
+        key = parameters.key
+        entries = BreakDown.levels[key][side]
+        index = bisect_left(entries, entry[:2])
+        if index < len(entries) and entries[index] is entry:
+            del entries[index]
+        parameters.entries[side] = None
+        if not BreakDown.levels[key]["up"] and not BreakDown.levels[key]["dn"]:
+            del BreakDown.levels[key]
+
+    @staticmethod
+    def process(symbol: tuple, timeframes: Iterable, ask: float, bid: float) -> None:
+        """
+        Called on an order book update. The "up" levels below the ask and
+        the "dn" levels above the bid are broken. Only these instances are
+        updated and their levels of the opposite direction are indexed.
+
+        Only the instances of the given timeframes are processed, which are
+        the timeframes of the symbol with kline data in the market.
+        """
+        with BreakDown.lock:
+            for timefr in timeframes:
+                if (symbol, timefr) in BreakDown.levels:
+                    BreakDown._break(key=(symbol, timefr), ask=ask, bid=bid)
+
+    @staticmethod
+    def _break(key: tuple, ask: float, bid: float) -> None:
+        """
+        Processes the levels of the (symbol, timefr) key, BreakDown.lock
+        is held by the caller.
+        """
+        levels = BreakDown.levels[key]
+        up = bisect_left(levels["up"], (ask,))
+        dn = bisect_right(levels["dn"], (bid, float("inf")))
+        if not up and dn == len(levels["dn"]):
+            return
+        broken = dict()
+        for _, _, parameters in levels["up"][:up]:
+            broken[id(parameters)] = [parameters, True, False]
+        for _, _, parameters in levels["dn"][dn:]:
+            if id(parameters) in broken:
+                broken[id(parameters)][2] = True
+            else:
+                broken[id(parameters)] = [parameters, False, True]
+        del levels["up"][:up]
+        del levels["dn"][dn:]
+        for parameters, is_up, is_dn in broken.values():
+            if is_up:
+                parameters.entries["up"] = None
+                dict.__setitem__(parameters, "number", parameters["number"] + 1)
+                if parameters["first"] == 0:
+                    dict.__setitem__(parameters, "first", -1)
+            if is_dn:
+                parameters.entries["dn"] = None
+                dict.__setitem__(parameters, "number", parameters["number"] + 1)
+                if parameters["first"] == 0:
+                    dict.__setitem__(parameters, "first", 1)
+        if not levels["up"] and not levels["dn"]:
+            del BreakDown.levels[key]
+        for parameters, _, _ in broken.values():
+            BreakDown.arm(parameters)
+
 
 def clean_indicators(bot_name: str, timefr="") -> None:
-    for symbol in BreakDown.symbols.copy():
-        if timefr:
-            if timefr in BreakDown.symbols[symbol]:
-                if bot_name in BreakDown.symbols[symbol][timefr]:
-                    del BreakDown.symbols[symbol][timefr][bot_name]
-                if not BreakDown.symbols[symbol][timefr]:
-                    del BreakDown.symbols[symbol][timefr]
+    with BreakDown.lock:
+        for symbol in BreakDown.symbols.copy():
+            if timefr:
+                if timefr in BreakDown.symbols[symbol]:
+                    if bot_name in BreakDown.symbols[symbol][timefr]:
+                        BreakDown.disarm(BreakDown.symbols[symbol][timefr][bot_name])
+                        del BreakDown.symbols[symbol][timefr][bot_name]
+                    if not BreakDown.symbols[symbol][timefr]:
+                        del BreakDown.symbols[symbol][timefr]
+            else:
+                for tf in BreakDown.symbols[symbol].copy():
+                    if bot_name in BreakDown.symbols[symbol][tf]:
+                        BreakDown.disarm(BreakDown.symbols[symbol][tf][bot_name])
+                        del BreakDown.symbols[symbol][tf][bot_name]
+                    if not BreakDown.symbols[symbol][tf]:
+                        del BreakDown.symbols[symbol][tf]
+            if not BreakDown.symbols[symbol]:
+                del BreakDown.symbols[symbol]
+
+
+class Indicator(ABC):
+    """
+    Base class of the streaming indicators. update() takes the next closed
+    line of kline data and returns the indicator value, or None while there
+    are not enough lines yet. Each line takes O(1) time regardless of the
+    period.
+
+    Parameters
+    ----------
+    period: int
+        Number of lines.
+    source: str
+        The price taken from the line: a field of KlineSeries, such as
+        "open_bid" or "hi", or "mid", the middle of "hi" and "lo".
+    """
+
+    def __init__(self, period: int = 14, source: str = "open_bid") -> None:
+        if period < 1:
+            raise ValueError("The period must be at least 1.")
+        if source != "mid" and source not in KlineSeries.FIELDS:
+            raise ValueError("Unknown source: " + str(source))
+        self.period = period
+        self.source = source
+
+    def price(self, row: dict) -> float:
+        if self.source == "mid":
+            return (row["hi"] + row["lo"]) / 2
+
+        return row[self.source]
+
+    @abstractmethod
+    def update(self, row: dict):
+        pass
+
+
+class SMA(Indicator):
+    """
+    Simple moving average.
+    """
+
+    def __init__(self, period: int = 14, source: str = "open_bid") -> None:
+        super().__init__(period=period, source=source)
+        self.window = deque()
+        self.sum = 0.0
+
+    def update(self, row: dict) -> Union[float, None]:
+        value = self.price(row)
+        self.window.append(value)
+        self.sum += value
+        if len(self.window) > self.period:
+            self.sum -= self.window.popleft()
+        if len(self.window) < self.period:
+            return None
+
+        return self.sum / self.period
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average. The first value is the simple average of
+    the first period lines.
+    """
+
+    def __init__(self, period: int = 14, source: str = "open_bid") -> None:
+        super().__init__(period=period, source=source)
+        self.alpha = 2 / (period + 1)
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, row: dict) -> Union[float, None]:
+        price = self.price(row)
+        self.count += 1
+        if self.count <= self.period:
+            self.value += (price - self.value) / self.count
+            if self.count < self.period:
+                return None
+        else:
+            self.value += self.alpha * (price - self.value)
+
+        return self.value
+
+
+class RSI(Indicator):
+    """
+    Relative strength index with Wilder's smoothing, from 0 to 100.
+    """
+
+    def __init__(self, period: int = 14, source: str = "open_bid") -> None:
+        super().__init__(period=period, source=source)
+        self.previous = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, row: dict) -> Union[float, None]:
+        price = self.price(row)
+        previous, self.previous = self.previous, price
+        if previous is None:
+            return None
+        change = price - previous
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        self.count += 1
+        if self.count <= self.period:
+            self.gain += (gain - self.gain) / self.count
+            self.loss += (loss - self.loss) / self.count
+            if self.count < self.period:
+                return None
+        else:
+            self.gain += (gain - self.gain) / self.period
+            self.loss += (loss - self.loss) / self.period
+        if self.loss == 0:
+            return 100.0
+
+        return 100 - 100 / (1 + self.gain / self.loss)
+
+
+class ATR(Indicator):
+    """
+    Average true range with Wilder's smoothing. Kline data has no closing
+    price, the period opens at the closing price of the previous one, so
+    the true range of a line is its "hi" minus "lo".
+    """
+
+    def __init__(self, period: int = 14, source: str = "open_bid") -> None:
+        super().__init__(period=period, source=source)
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, row: dict) -> Union[float, None]:
+        true_range = row["hi"] - row["lo"]
+        self.count += 1
+        if self.count <= self.period:
+            self.value += (true_range - self.value) / self.count
+            if self.count < self.period:
+                return None
         else:
-            for tf in BreakDown.symbols[symbol].copy():
-                if bot_name in BreakDown.symbols[symbol][tf]:
-                    del BreakDown.symbols[symbol][tf][bot_name]
-                if not BreakDown.symbols[symbol][tf]:
-                    del BreakDown.symbols[symbol][tf]
-        if not BreakDown.symbols[symbol]:
-            del BreakDown.symbols[symbol]
+            self.value += (true_range - self.value) / self.period
+
+        return self.value
+
+
+class Bollinger(Indicator):
+    """
+    Bollinger bands: the simple moving average and the bands ``width``
+    standard deviations above and below it. The value is a tuple
+    (middle, upper, lower).
+    """
+
+    def __init__(
+        self, period: int = 20, source: str = "open_bid", width: float = 2
+    ) -> None:
+        super().__init__(period=period, source=source)
+        self.width = width
+        self.window = deque()
+        self.sum = 0.0
+        self.squares = 0.0
+
+    def update(self, row: dict) -> Union[tuple, None]:
+        value = self.price(row)
+        self.window.append(value)
+        self.sum += value
+        self.squares += value * value
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            self.sum -= old
+            self.squares -= old * old
+        if len(self.window) < self.period:
+            return None
+        middle = self.sum / self.period
+        deviation = math.sqrt(max(self.squares / self.period - middle * middle, 0))
+
+        return (
+            middle,
+            middle + self.width * deviation,
+            middle - self.width * deviation,
+        )
+
+
+class SessionAverage(Indicator):
+    """
+    The average price since the beginning of the day (the ``date`` field),
+    a VWAP-like measure. Kline data has no volume, so all lines have equal
+    weight. The period is not used.
+    """
+
+    def __init__(self, period: int = 1, source: str = "mid") -> None:
+        super().__init__(period=period, source=source)
+        self.date = None
+        self.count = 0
+        self.sum = 0.0
+
+    def update(self, row: dict) -> float:
+        if row["date"] != self.date:
+            self.date = row["date"]
+            self.count = 0
+            self.sum = 0.0
+        self.count += 1
+        self.sum += self.price(row)
+
+        return self.sum / self.count
+
+
+class RollingMax(Indicator):
+    """
+    The highest value over the period, by default of "hi". Candidates are
+    kept in a monotonic queue, so each line takes O(1) amortized time.
+    """
+
+    def __init__(self, period: int = 14, source: str = "hi") -> None:
+        super().__init__(period=period, source=source)
+        self.count = 0
+        self.window = deque()
+
+    def better(self, value: float, other: float) -> bool:
+        return value >= other
+
+    def update(self, row: dict) -> Union[float, None]:
+        value = self.price(row)
+        while self.window and self.better(value, self.window[-1][1]):
+            self.window.pop()
+        self.window.append((self.count, value))
+        if self.window[0][0] <= self.count - self.period:
+            self.window.popleft()
+        self.count += 1
+        if self.count < self.period:
+            return None
+
+        return self.window[0][1]
+
+
+class RollingMin(RollingMax):
+    """
+    The lowest value over the period, by default of "lo".
+    """
+
+    def __init__(self, period: int = 14, source: str = "lo") -> None:
+        super().__init__(period=period, source=source)
+
+    def better(self, value: float, other: float) -> bool:
+        return value <= other
+
+
+class IndicatorStream:
+    """
+    An indicator attached to the kline data of a symbol and timeframe.
+
+    The instances are shared: all bots asking for the same indicator with
+    the same parameters on the same kline data get the same instance, see
+    get(). The indicator is calculated on request from the closed lines it
+    has not yet seen, so every line is processed once, no matter how many
+    bots use it. The same code is used in backtest and live mode, the only
+    difference is the number of closed lines passed to update().
+
+    The values are kept for the last ``capacity`` lines.
+    """
+
+    NAMES = {
+        "sma": SMA,
+        "ema": EMA,
+        "rsi": RSI,
+        "atr": ATR,
+        "bollinger": Bollinger,
+        "session_average": SessionAverage,
+        "max": RollingMax,
+        "min": RollingMin,
+    }
+    streams = dict()
+    streams_lock = threading.Lock()
+
+    def __init__(self, name: str, parameters: dict, capacity: int) -> None:
+        self.name = name
+        self.parameters = parameters
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.indicator = IndicatorStream.NAMES[self.name](**self.parameters)
+        self.values = deque(maxlen=self.capacity)
+        self.last = None
+
+    @staticmethod
+    def get(key: tuple, name: str, parameters: dict, capacity: int):
+        """
+        Returns the shared instance of the indicator.
+
+        Parameters
+        ----------
+        key: tuple
+            Identifies the kline data, e.g. (symbol, timefr).
+        name: str
+            A key of NAMES.
+        parameters: dict
+            Parameters of the indicator class.
+        capacity: int
+            The number of values kept.
+        """
+        if name not in IndicatorStream.NAMES:
+            raise ValueError("Unknown indicator: " + str(name))
+        stream_key = (key, name, tuple(sorted(parameters.items())))
+        with IndicatorStream.streams_lock:
+            if stream_key not in IndicatorStream.streams:
+                IndicatorStream.streams[stream_key] = IndicatorStream(
+                    name=name, parameters=parameters, capacity=capacity
+                )
+
+            return IndicatorStream.streams[stream_key]
+
+    @staticmethod
+    def remove(key: tuple) -> None:
+        """
+        Removes the indicators of the kline data.
+        """
+        with IndicatorStream.streams_lock:
+            for stream_key in list(IndicatorStream.streams):
+                if stream_key[0] == key:
+                    del IndicatorStream.streams[stream_key]
+
+    def update(self, series: KlineSeries, closed: int) -> None:
+        """
+        Processes the closed lines of the series that have not been seen
+        yet. The lines are found by time, so a series reloaded or shifted
+        by new lines is handled correctly. If the time goes back, as in a
+        new backtest run, or the lines since the last seen one are no longer
+        in the series, the indicator is calculated anew.
+
+        Parameters
+        ----------
+        series: KlineSeries
+            Kline data.
+        closed: int
+            The number of the first lines of the series that are closed.
+        """
+        with self.lock:
+            if closed <= 0:
+                return
+            latest = series.timestamp(closed - 1)
+            if self.last is not None:
+                if latest == self.last:
+                    return
+                if latest < self.last or series.timestamp(0) > self.last:
+                    self.reset()
+            start = 0
+            if self.last is not None:
+                first, end = 0, closed
+                while first < end:
+                    middle = (first + end) // 2
+                    if series.timestamp(middle) <= self.last:
+                        first = middle + 1
+                    else:
+                        end = middle
+                start = first
+            for index in range(start, closed):
+                self.values.append(self.indicator.update(series[index]))
+            self.last = latest
+
+    def value(self, index: int = -1):
+        """
+        Returns the value for the closed line with the given index, -1 is
+        the latest one, or None if there is no value yet.
+        """
+        with self.lock:
+            try:
+                return self.values[index]
+            except IndexError:
+                return None
@@ -1,19 +1,28 @@
 import os
 import platform
+import sqlite3
+import threading
 import time
-import tkinter as tk
 import traceback
 from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime, timezone
 from typing import Callable, Union
 
 from dotenv import dotenv_values, set_key
 
-from common.data import BotData, Bots, Instrument
+from botinit.variables import Variables as robo
+from common.data import BotData, Bots, Instrument, IntraBar
+from common.execids import ExecutionIndex
+from common.executor import BotExecutor
+from common.messages import ErrorMessage, Message
 from common.variables import Variables as var
-from display.messages import ErrorMessage, Message
+from common.writer import DatabaseWriter
 from indicators import BreakDown
 
+if not var.headless:
+    import tkinter as tk
+
 if platform.system() == "Windows":
     import ctypes
     import ctypes.wintypes
@@ -215,6 +224,9 @@ def add_space(line: list) -> str:
 
 
 def close(markets):
+    DatabaseWriter.flush()
+    BotExecutor.shutdown()
+    close_read_connections()
     for bot_name in var.bot_thread_active:
         var.bot_thread_active[bot_name] = False
     for name in var.market_list:
@@ -235,23 +247,91 @@ def display_exception(exception, display=True) -> str:
     return formated
 
 
-def select_database(query: str) -> list:
+EXECUTION_QUERY = (
+    "insert into %s (EXECID,EMI,REFER,CURRENCY,SYMBOL,"
+    + "TICKER,CATEGORY,MARKET,SIDE,QTY,QTY_REST,PRICE,"
+    + "THEOR_PRICE,TRADE_PRICE,SUMREAL,COMMISS,CLORDID,TTIME,"
+    + "ACCOUNT) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+)
+
+
+def read_connection() -> sqlite3.Connection:
+    """
+    Returns the read connection of the calling thread. Each thread opens
+    its own connection, so reads do not wait for var.sql_lock, and in WAL
+    mode they do not wait for writers either. Prepared statements are
+    cached by the connection per query text, which is why queries should
+    pass values as parameters rather than format them into the text.
+    """
+    connection = getattr(var.sql_readers, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(
+            var.db_sqlite, check_same_thread=False, cached_statements=256
+        )
+        var.sql_readers.connection = connection
+        var.sql_reader_connections.append(connection)
+
+    return connection
+
+
+def close_read_connections() -> None:
+    """
+    Closes the read connections opened by read_connection() in all threads.
+    A thread that reads afterwards opens a new connection.
+    """
+    var.sql_readers = threading.local()
+    while var.sql_reader_connections:
+        var.sql_reader_connections.pop().close()
+
+
+def select_database(
+    query: str,
+    params: Union[tuple, list, dict] = (),
+    flush: bool = False,
+    rows: str = "dict",
+) -> Union[list, None]:
+    """
+    Executes the query on the read connection of the calling thread.
+
+    Parameters
+    ----------
+    query: str
+        SQL query with "?" or ":name" placeholders.
+    params: tuple | list | dict
+        Values bound to the placeholders.
+    flush: bool
+        If True, executions queued by insert_execution() are committed
+        first. Only the reads that need the rows just written, such as the
+        positions and sums of executions, pass True.
+    rows: str
+        "dict" - each row is a dictionary, "tuple" - a tuple of values in
+        the order of the columns, "record" - sqlite3.Row accessible both by
+        index and column name.
+
+    Returns
+    -------
+    list | None
+        List of rows or None on error.
+    """
+    if flush:
+        DatabaseWriter.flush()
     err_locked = 0
     while True:
         try:
-            var.sql_lock.acquire(True)
-            var.cursor_sqlite.execute(query)
-            orig = var.cursor_sqlite.fetchall()
-            var.sql_lock.release()
-            data = []
-            if orig:
-                data = list(map(lambda x: dict(zip(orig[0].keys(), x)), orig))
+            cursor = read_connection().cursor()
+            if rows == "record":
+                cursor.row_factory = sqlite3.Row
+            cursor.execute(query, params)
+            data = cursor.fetchall()
+            if rows == "dict" and data:
+                names = [column[0] for column in cursor.description]
+                data = [dict(zip(names, row)) for row in data]
+            cursor.close()
             return data
         except Exception as e:  # var.error_sqlite
             if "database is locked" not in str(e):
                 print("_____query:", query)
                 var.logger.error("Sqlite Error: " + str(e) + ")")
-                var.sql_lock.release()
                 break
             else:
                 err_locked += 1
@@ -260,7 +340,6 @@ def select_database(query: str) -> list:
                     + str(err_locked)
                     + ")"
                 )
-                var.sql_lock.release()
 
 
 def insert_database(values: list, table: str) -> None:
@@ -269,15 +348,7 @@ def insert_database(values: list, table: str) -> None:
         try:
             var.sql_lock.acquire(True)
             if table == var.database_table:
-                var.cursor_sqlite.execute(
-                    "insert into "
-                    + var.database_table
-                    + " (EXECID,EMI,REFER,CURRENCY,SYMBOL,"
-                    + "TICKER,CATEGORY,MARKET,SIDE,QTY,QTY_REST,PRICE,"
-                    + "THEOR_PRICE,TRADE_PRICE,SUMREAL,COMMISS,CLORDID,TTIME,"
-                    + "ACCOUNT) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-                    values,
-                )
+                var.cursor_sqlite.execute(EXECUTION_QUERY % var.database_table, values)
             elif table == "robots":
                 var.cursor_sqlite.execute(
                     "insert into robots (EMI,STATE,TIMEFR) VALUES (?,?,?)",
@@ -315,12 +386,134 @@ def insert_database(values: list, table: str) -> None:
                 var.sql_lock.release()
 
 
-def update_database(query: list) -> Union[str, None]:
+def insert_execution(values: list) -> Future:
+    """
+    Queues a row of var.database_table to be written by the DatabaseWriter
+    thread together with other executions in one transaction.
+
+    Parameters
+    ----------
+    values: list
+        Values in the same order as for insert_database().
+
+    Returns
+    -------
+    Future
+        Its result is None or the error string, the same as
+        insert_database() returns.
+    """
+    ExecutionIndex.add([values[0]], account=values[18], times={values[0]: values[17]})
+    future = DatabaseWriter.put(
+        query=EXECUTION_QUERY % var.database_table,
+        values=values,
+        key=(values[0], values[18]),
+    )
+
+    def forget_failed(future: Future) -> None:
+        if future.result():
+            ExecutionIndex.discard(values[0], values[18])
+
+    future.add_done_callback(forget_failed)
+
+    return future
+
+
+def execution_exists(
+    execID: str, account: int, market: str = "", ttime: datetime = None
+) -> bool:
+    """
+    Checks if the execution is already recorded, including the rows queued
+    by insert_execution() but not yet committed. The ExecutionIndex is
+    consulted first, and the database is queried only if the index does
+    not know the answer, e.g. for an execution older than the time covered
+    by preload_executions().
+    """
+    known = ExecutionIndex.lookup(execID, account, market=market, ttime=ttime)
+    if known is not None:
+        return known
+    if DatabaseWriter.is_pending((execID, account)):
+        return True
+    query = "select EXECID from %s where EXECID = ? and ACCOUNT = ?" % (
+        var.database_table
+    )
+    params = [execID, account]
+    if market:
+        query += " and MARKET = ?"
+        params.append(market)
+
+    exists = bool(select_database(query, params, rows="tuple"))
+    if exists:
+        ExecutionIndex.add([execID], account=account, times={execID: ttime})
+
+    return exists
+
+
+def preload_executions(account: int, market: str, since: datetime) -> None:
+    """
+    Loads the execution IDs of the account and market recorded since the
+    given time into the ExecutionIndex with one query, so that executions
+    from this time on are checked for duplicates without the database.
+    """
+    query = (
+        "select EXECID from %s where ACCOUNT = ? and MARKET = ? and TTIME >= ?"
+        % var.database_table
+    )
+    data = select_database(
+        query, (account, market, since - ExecutionIndex.MARGIN), rows="tuple"
+    )
+    if isinstance(data, list):
+        ExecutionIndex.cover(
+            account=account,
+            market=market,
+            since=since,
+            execIDs=(row[0] for row in data),
+        )
+
+
+def prefetch_executions(rows: list, account: int, market: str) -> None:
+    """
+    Looks up the execIDs of a page of history rows that the ExecutionIndex
+    does not know with a single "IN (...)" query instead of one query per
+    row.
+    """
+    execIDs = list()
+    times = dict()
+    for row in rows:
+        known = ExecutionIndex.lookup(
+            row["execID"], account, market=market, ttime=row.get("transactTime")
+        )
+        if known is None:
+            execIDs.append(row["execID"])
+            times[row["execID"]] = row.get("transactTime")
+    if not execIDs:
+        return
+    found = set()
+    # SQLite limits the number of host parameters in a statement.
+    for num in range(0, len(execIDs), 500):
+        chunk = execIDs[num : num + 500]
+        query = "select EXECID from %s where ACCOUNT = ? and MARKET = ? " % (
+            var.database_table
+        ) + "and EXECID in (%s)" % ",".join("?" * len(chunk))
+        data = select_database(query, [account, market] + chunk, rows="tuple")
+        if not isinstance(data, list):
+            return
+        found.update(row[0] for row in data)
+    ExecutionIndex.add(found, account=account, times=times)
+    ExecutionIndex.mark_checked(
+        (execID for execID in execIDs if execID not in found),
+        account=account,
+        times=times,
+    )
+
+
+def update_database(
+    query: str, params: Union[tuple, list, dict] = ()
+) -> Union[str, None]:
     err_locked = 0
     while True:
         try:
             var.sql_lock.acquire(True)
-            var.cursor_sqlite.execute(query)
+            var.cursor_sqlite.execute(query, params)
             var.connect_sqlite.commit()
             var.sql_lock.release()
             return None
@@ -341,6 +534,54 @@ def update_database(query: list) -> Union[str, None]:
                 var.sql_lock.release()
 
 
+def rebuild_summary(table: str = "") -> Union[str, None]:
+    """
+    Recalculates the <table>_summary table from the trades table. The
+    summary is maintained by triggers, so this is only needed when the
+    summary table is created for an existing database or if it is
+    suspected to be inconsistent.
+
+    Parameters
+    ----------
+    table: str
+        Trades table. If omitted, var.database_table.
+
+    Returns
+    -------
+    str | None
+        None on success, otherwise the error string.
+    """
+    table = table or var.database_table
+    DatabaseWriter.flush()
+    try:
+        with var.sql_lock:
+            try:
+                var.cursor_sqlite.execute("delete from %s_summary;" % table)
+                var.cursor_sqlite.execute(
+                    "insert into %s_summary (EMI, MARKET, ACCOUNT, SYMBOL, TICKER, "
+                    "CATEGORY, CURRENCY, NUM, TRADES, POS, VOL, SUMREAL, COMMISS, "
+                    "FUND_SUMREAL, FUNDING, LTIME) select EMI, MARKET, ACCOUNT, "
+                    "SYMBOL, max(TICKER), max(CATEGORY), max(CURRENCY), count(*), "
+                    "sum(case when SIDE = 'Fund' then 0 else 1 end), "
+                    "total(case when SIDE = 'Fund' then 0 else QTY end), "
+                    "total(case when SIDE = 'Fund' then 0 else abs(QTY) end), "
+                    "total(case when SIDE = 'Fund' then 0 else SUMREAL end), "
+                    "total(case when SIDE = 'Fund' then 0 else COMMISS end), "
+                    "total(case when SIDE = 'Fund' then SUMREAL else 0 end), "
+                    "total(case when SIDE = 'Fund' then COMMISS else 0 end), "
+                    "max(TTIME) from %s group by EMI, MARKET, ACCOUNT, SYMBOL;"
+                    % (table, table)
+                )
+                var.connect_sqlite.commit()
+            except Exception:
+                var.connect_sqlite.rollback()
+                raise
+    except Exception as e:  # var.error_sqlite
+        err_str = f"Sqlite Error: {str(e)}"
+        var.logger.error(err_str)
+        return err_str
+
+
 def set_clOrdID(emi: str = False) -> str:
     var.last_order += 1
     if emi is False:
@@ -355,18 +596,19 @@ def fill_order(emi: str, clOrdID: str, category: str, value: dict) -> None:
     if emi not in var.orders:
         var.orders[emi] = OrderedDict()
     if clOrdID not in var.orders[emi]:
-        var.orders[emi][clOrdID] = dict()
-        var.orders[emi][clOrdID]["emi"] = emi
-        var.orders[emi][clOrdID]["leavesQty"] = value["leavesQty"]
-        var.orders[emi][clOrdID]["transactTime"] = value["transactTime"]
-        var.orders[emi][clOrdID]["price"] = value["price"]
-        var.orders[emi][clOrdID]["symbol"] = value["symbol"]
-        var.orders[emi][clOrdID]["category"] = category
-        var.orders[emi][clOrdID]["market"] = value["symbol"][1]
-        var.orders[emi][clOrdID]["side"] = value["side"]
-        var.orders[emi][clOrdID]["orderID"] = value["orderID"]
-        var.orders[emi][clOrdID]["clOrdID"] = clOrdID
-        var.orders[emi][clOrdID]["orderQty"] = value["orderQty"]
+        var.orders[emi][clOrdID] = {
+            "emi": emi,
+            "leavesQty": value["leavesQty"],
+            "transactTime": value["transactTime"],
+            "price": value["price"],
+            "symbol": value["symbol"],
+            "category": category,
+            "market": value["symbol"][1],
+            "side": value["side"],
+            "orderID": value["orderID"],
+            "clOrdID": clOrdID,
+            "orderQty": value["orderQty"],
+        }
 
 
 def fill_bot_position(
@@ -404,21 +646,15 @@ def fill_bot_position(
     # Checks if this bot has any records in the database on this instrument.
     if not var.backtest:
         qwr = (
-            "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, "
-            + "sum(SUMREAL) as SUM_SUMREAL, sum(COMMISS) as "
-            + "SUM_COMMISS, TTIME from (select * from "
+            "select sum(VOL) as SUM_QTY, sum(SUMREAL) as SUM_SUMREAL, "
+            + "sum(COMMISS) as SUM_COMMISS from "
             + var.database_table
-            + " where EMI = '"
-            + bot_name
-            + "' and SYMBOL = '"
-            + instrument.symbol
-            + "' and MARKET = '"
-            + instrument.market
-            + "' and ACCOUNT = "
-            + str(user_id)
-            + " and SIDE <> 'Fund' order by ID desc) T;"
+            + "_summary where EMI = ? and SYMBOL = ? and MARKET = ? and ACCOUNT = ?"
+            + " and TRADES > 0;"
         )
-        data = select_database(qwr)[0]
+        data = select_database(
+            qwr, (bot_name, instrument.symbol, instrument.market, user_id)
+        )[0]
         if data and data["SUM_QTY"]:
             bot.bot_positions[symbol]["volume"] = float(data["SUM_QTY"])
             bot.bot_positions[symbol]["sumreal"] = float(data["SUM_SUMREAL"])
@@ -468,31 +704,24 @@ def kline_hi_lo_values(ws, symbol: tuple, instrument: Instrument) -> None:
             The order book is probably empty.
             """
             return
-        for timefr, values in ws.klines[symbol].items():
-            if values["data"]:
-                if ask > values["data"][-1]["hi"]:
-                    values["data"][-1]["hi"] = ask
-                if bid < values["data"][-1]["lo"]:
-                    values["data"][-1]["lo"] = bid
-
-            # Processing the BreakDown indicator
-
-            if symbol in BreakDown.symbols:
-                if timefr in BreakDown.symbols[symbol]:
-                    for parameters in BreakDown.symbols[symbol][timefr].values():
-                        direct = parameters["first"] * (
-                            parameters["number"] % 2 * 2 - 1
-                        )
-                        if parameters["up"]:
-                            if direct >= 0 and ask > parameters["up"]:
-                                parameters["number"] += 1
-                                if parameters["first"] == 0:
-                                    parameters["first"] = -1
-                        if parameters["dn"]:
-                            if direct <= 0 and bid < parameters["dn"]:
-                                parameters["number"] += 1
-                                if parameters["first"] == 0:
-                                    parameters["first"] = 1
+        bounds = IntraBar.bounds.get(symbol)
+        if bounds is None or ask > bounds[0] or bid < bounds[1]:
+            epoch = IntraBar.epoch(symbol)
+            hi, lo = float("inf"), float("-inf")
+            for values in ws.klines[symbol].values():
+                data = values["data"]
+                if data:
+                    if ask > data.hi[-1]:
+                        data.hi[-1] = ask
+                    if bid < data.lo[-1]:
+                        data.lo[-1] = bid
+                    hi = min(hi, data.hi[-1])
+                    lo = max(lo, data.lo[-1])
+            IntraBar.store(symbol, epoch=epoch, bounds=(hi, lo))
+
+        # Processing the BreakDown indicator
+
+        BreakDown.process(symbol, timeframes=ws.klines[symbol], ask=ask, bid=bid)
 
 
 def count_orders():
@@ -527,7 +756,30 @@ def format_message(market: str, message: str, tm=None) -> str:
     return text
 
 
-def wrap(frame: tk.Frame, padx):
+def save_bot_log(
+    bot_name: str,
+    message: str,
+    warning: Union[str, None],
+    market: str = None,
+    tm: datetime = None,
+) -> str:
+    """
+    Adds the message to the log of the bot and saves it to bot.log. Returns
+    the formatted message.
+    """
+    message = format_message(market=market, message=message, tm=tm)
+    Bots[bot_name].log.append((warning, message))
+    path = f"{robo.algo_dir}{bot_name}/bot.log"
+    try:
+        with open(path, "a") as f:
+            f.write(message)
+    except FileNotFoundError:
+        pass
+
+    return message
+
+
+def wrap(frame: "tk.Frame", padx):
     for child in frame.winfo_children():
         if type(child) is tk.Label:
             child.config(wraplength=frame.winfo_width() - child.winfo_x() - padx * 2)
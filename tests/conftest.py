@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules of Tmatic are imported from the root of the repository, as
+# main.py does.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
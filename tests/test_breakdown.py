@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from common.data import BotData
+from indicators import BreakDown, clean_indicators
+
+SYMBOL = ("BTCUSDT", "Bybit")
+
+
+class Tool:
+    symbol = SYMBOL[0]
+    market = SYMBOL[1]
+
+
+def make_bot(name: str, timefr: str) -> BotData:
+    bot = BotData()
+    bot.name = name
+    bot.timefr = timefr
+    return bot
+
+
+def loop(parameters: dict, ask: float, bid: float) -> None:
+    """
+    The loop over the instances that was run on each order book update
+    before the levels were indexed.
+    """
+    direct = parameters["first"] * (parameters["number"] % 2 * 2 - 1)
+    if parameters["up"]:
+        if direct >= 0 and ask > parameters["up"]:
+            parameters["number"] += 1
+            if parameters["first"] == 0:
+                parameters["first"] = -1
+    if parameters["dn"]:
+        if direct <= 0 and bid < parameters["dn"]:
+            parameters["number"] += 1
+            if parameters["first"] == 0:
+                parameters["first"] = 1
+
+
+@pytest.fixture
+def bots():
+    bots = [make_bot("bot" + str(num), ["1min", "5min"][num % 2]) for num in range(40)]
+    yield bots
+    for bot in bots:
+        clean_indicators(bot_name=bot.name)
+    assert BreakDown.levels == {}
+
+
+def test_bisect_matches_loop(bots):
+    rng = random.Random(5)
+    instances = [BreakDown(Tool, bot) for bot in bots]
+    reference = [dict(x.parameters) for x in instances]
+    price = 100.0
+    for tick in range(3000):
+        if rng.random() < 0.1:
+            num = rng.randrange(len(instances))
+            for key in ("up", "dn"):
+                if rng.random() < 0.5:
+                    value = rng.choice([False, round(price + rng.uniform(-3, 3), 1)])
+                    instances[num].parameters[key] = value
+                    reference[num][key] = value
+            if rng.random() < 0.1:
+                instances[num].default()
+                for key in ("first", "number", "trades"):
+                    reference[num][key] = 0
+        price += rng.uniform(-0.5, 0.5)
+        ask = round(price + 0.1, 1)
+        bid = round(price - 0.1, 1)
+        timeframes = rng.choice([["1min", "5min"], ["1min"], ["5min"], []])
+        BreakDown.process(SYMBOL, timeframes=timeframes, ask=ask, bid=bid)
+        for bot, parameters in zip(bots, reference):
+            if bot.timefr in timeframes:
+                loop(parameters, ask=ask, bid=bid)
+        for instance, parameters in zip(instances, reference):
+            assert dict(instance.parameters) == parameters, tick
+    assert sum(x["number"] for x in reference) > 100
+
+
+def test_timeframe_without_klines_is_skipped(bots):
+    instance = BreakDown(Tool, bots[0])
+    instance.parameters["up"] = 101.0
+    BreakDown.process(SYMBOL, timeframes=["5min"], ask=102.0, bid=101.9)
+    assert instance.parameters["number"] == 0
+    BreakDown.process(SYMBOL, timeframes=["1min"], ask=102.0, bid=101.9)
+    assert instance.parameters["number"] == 1
+    assert instance.parameters["first"] == -1
@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common.execids import ExecutionIndex
+
+
+@pytest.fixture(autouse=True)
+def index():
+    ExecutionIndex.keys = dict()
+    ExecutionIndex.checked = dict()
+    ExecutionIndex.covered = dict()
+    ExecutionIndex.evicted = time.monotonic()
+
+
+def test_lookup_added_and_checked_ids():
+    assert ExecutionIndex.lookup("a", account=1) is None
+    ExecutionIndex.add(["a"], account=1)
+    assert ExecutionIndex.lookup("a", account=1) is True
+    assert ExecutionIndex.lookup("a", account=2) is None
+    ExecutionIndex.mark_checked(["b"], account=1)
+    assert ExecutionIndex.lookup("b", account=1) is False
+    ExecutionIndex.add(["b"], account=1)
+    assert ExecutionIndex.lookup("b", account=1) is True
+    ExecutionIndex.discard("b", account=1)
+    assert ExecutionIndex.lookup("b", account=1) is None
+
+
+def test_covered_range_answers_from_memory():
+    since = datetime(2024, 1, 10, tzinfo=timezone.utc)
+    ExecutionIndex.cover(account=1, market="Bybit", since=since, execIDs=["a"])
+    later = since + timedelta(hours=1)
+    assert ExecutionIndex.lookup("a", 1, market="Bybit", ttime=later) is True
+    assert ExecutionIndex.lookup("x", 1, market="Bybit", ttime=later) is False
+    assert ExecutionIndex.lookup("x", 1, market="Bybit", ttime=since) is False
+    earlier = since - timedelta(seconds=1)
+    assert ExecutionIndex.lookup("x", 1, market="Bybit", ttime=earlier) is None
+    assert ExecutionIndex.lookup("x", 1, market="Bitmex", ttime=later) is None
+    assert ExecutionIndex.lookup("x", 2, market="Bybit", ttime=later) is None
+
+
+def test_cover_keeps_earliest_time_and_naive_times():
+    since = datetime(2024, 1, 10, tzinfo=timezone.utc)
+    ExecutionIndex.cover(1, "Bybit", since=since, execIDs=[])
+    ExecutionIndex.cover(1, "Bybit", since=since + timedelta(days=5), execIDs=[])
+    assert ExecutionIndex.covered[(1, "Bybit")] == since
+    naive = datetime(2024, 1, 11)
+    assert ExecutionIndex.lookup("x", 1, market="Bybit", ttime=naive) is False
+
+
+def test_evict_forgets_old_ids_and_moves_covered_time():
+    since = datetime(2024, 1, 10, tzinfo=timezone.utc)
+    ExecutionIndex.cover(1, "Bybit", since=since, execIDs=[])
+    old = since + timedelta(days=1)
+    recent = since + timedelta(days=20)
+    ExecutionIndex.add(["old", "recent"], 1, times={"old": old, "recent": recent})
+    ExecutionIndex.mark_checked(["gone"], 1, times={"gone": datetime(2024, 1, 11)})
+    ExecutionIndex.add(["unknown"], 1)
+    before = since + timedelta(days=10)
+    ExecutionIndex.evict(before)
+    assert set(ExecutionIndex.keys) == {("recent", 1), ("unknown", 1)}
+    assert ExecutionIndex.checked == {}
+    assert ExecutionIndex.covered[(1, "Bybit")] == before
+    # Executions before the new covered time are looked up in the database.
+    assert ExecutionIndex.lookup("old", 1, market="Bybit", ttime=old) is None
+    assert ExecutionIndex.lookup("x", 1, market="Bybit", ttime=recent) is False
+    assert ExecutionIndex.lookup("recent", 1, market="Bybit", ttime=recent) is True
+
+
+def test_expired_ids_are_evicted_on_add():
+    old = datetime.now(tz=timezone.utc) - ExecutionIndex.RETAIN * 2
+    ExecutionIndex.evicted = 0.0
+    ExecutionIndex.add(["a"], 1, times={"a": old})
+    assert ExecutionIndex.lookup("a", 1) is None
+    ExecutionIndex.add(["b"], 1, times={"b": old})
+    # Not evicted again within EVICT_INTERVAL.
+    assert ExecutionIndex.lookup("b", 1) is True
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from common.executor import BotExecutor
+
+
+@pytest.fixture
+def executor():
+    yield BotExecutor
+    with BotExecutor.lock:
+        for name in list(BotExecutor.bots):
+            if name.startswith("test_"):
+                BotExecutor.bots[name]["calls"].clear()
+        for name in list(BotExecutor.policies):
+            if name.startswith("test_"):
+                del BotExecutor.policies[name]
+
+
+def test_blocking_bot_does_not_hold_back_others(executor):
+    release = threading.Event()
+    names = ["test_blocking_%d" % num for num in range(6)]
+    for name in names:
+        executor.submit(name, release.wait, (10,))
+    finished = threading.Event()
+    executor.submit("test_free", finished.set)
+    try:
+        assert finished.wait(5)
+        assert len(executor.threads) >= len(names) + 1
+    finally:
+        release.set()
+
+
+def test_overrun_policy(executor):
+    release = threading.Event()
+    calls = list()
+    executor.set_policy("test_queue", "queue")
+    executor.submit("test_skip", release.wait, (10,))
+    executor.submit("test_queue", release.wait, (10,))
+    assert not executor.submit("test_skip", calls.append, ("skip",))
+    assert executor.submit("test_queue", calls.append, ("queue",))
+    release.set()
+    finished = threading.Event()
+    executor.submit("test_queue", finished.set, policy="queue")
+    assert finished.wait(5)
+    assert calls == ["queue"]
+    assert executor.statistics("test_skip")["skipped"] == 1
+    with pytest.raises(ValueError):
+        executor.set_policy("test_queue", "wait")
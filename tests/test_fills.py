@@ -0,0 +1,87 @@
+import random
+from array import array
+
+from backtest.fills import FillBook, PriceTree
+from common.orders import OrderRegistry
+
+
+def first_brute(values, start, price, sign):
+    for num in range(start, len(values)):
+        if (sign == 1 and values[num] > price) or (sign == -1 and values[num] < price):
+            return num
+    return len(values)
+
+
+def test_price_tree_matches_scan():
+    rng = random.Random(7)
+    for length in (1, 2, 3, 7, 8, 9, 100, 257):
+        values = array("d", (rng.uniform(90, 110) for _ in range(length)))
+        for sign in (1, -1):
+            tree = PriceTree(values, sign=sign)
+            for _ in range(200):
+                start = rng.randrange(length + 2)
+                price = rng.uniform(85, 115)
+                assert tree.first(start, price) == first_brute(
+                    values, start, price, sign
+                )
+
+
+def test_price_tree_strict_comparison():
+    values = [100.0, 101.0, 100.0]
+    assert PriceTree(values).first(0, 101.0) == 3
+    assert PriceTree(values).first(0, 100.5) == 1
+    assert PriceTree(values, sign=-1).first(1, 100.0) == 3
+    assert PriceTree(memoryview(array("d", values))).first(2, 99) == 2
+
+
+def simulate(hi, lo, actions, use_book):
+    """
+    Runs the same sequence of placed orders through the per-line loop of
+    the former _fill_orders() or through FillBook, returns the fills.
+    """
+    symbol = ("BTCUSD", "Bitmex")
+    registry = OrderRegistry()
+    registry["bot"] = dict()
+    orders = registry["bot"]
+    book = FillBook(hi={symbol: hi}, lo={symbol: lo})
+    fills = list()
+    for line in range(1, len(hi)):
+        if orders:
+            if use_book:
+                filled = book.filled(orders, line=line, version=registry.version)
+            else:
+                filled = [
+                    clOrdID
+                    for clOrdID, order in orders.items()
+                    if (order["side"] == "Sell" and hi[line] > order["price"])
+                    or (order["side"] == "Buy" and lo[line] < order["price"])
+                ]
+            for clOrdID in filled:
+                fills.append((line, clOrdID, orders[clOrdID]["price"]))
+                del orders[clOrdID]
+        for clOrdID, side, price in actions.get(line, []):
+            if clOrdID in orders:
+                orders[clOrdID]["price"] = price
+            else:
+                orders[clOrdID] = {"symbol": symbol, "side": side, "price": price}
+    return fills
+
+
+def test_fill_book_matches_per_line_loop():
+    rng = random.Random(11)
+    price = 100.0
+    hi, lo = array("d"), array("d")
+    for _ in range(2000):
+        price += rng.uniform(-1, 1)
+        hi.append(price + rng.uniform(0, 1))
+        lo.append(price - rng.uniform(0, 1))
+    actions = dict()
+    for num in range(300):
+        line = rng.randrange(1, 2000)
+        clOrdID = "order" + str(rng.randrange(60))
+        side = rng.choice(["Buy", "Sell"])
+        level = lo[line] - rng.uniform(0, 3) if side == "Buy" else hi[line] + 1
+        actions.setdefault(line, []).append((clOrdID, side, level))
+    expected = simulate(hi, lo, actions, use_book=False)
+    assert len(expected) > 20
+    assert simulate(hi, lo, actions, use_book=True) == expected
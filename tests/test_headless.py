@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+pytest.importorskip("websocket")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_headless_does_not_import_tkinter():
+    code = (
+        "import sys; import headless; "
+        + "assert 'tkinter' not in sys.modules, 'tkinter imported'"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.fixture
+def headless():
+    from common.variables import Variables as var
+
+    var.headless = True
+    import headless
+
+    return headless
+
+
+def test_engine_clear_params(headless):
+    from common.variables import Variables as var
+    from engine import Engine
+
+    var.market_list = ["Bitmex"]
+    Engine.clear_params()
+    assert var.market_list == []
+    assert len(var.orders) == 0
+
+
+def test_status_without_markets_and_bots(headless):
+    from common.variables import Variables as var
+
+    var.market_list = []
+    status = headless.Headless.status()
+    assert status["markets"] == {}
+    assert set(status) >= {"time", "trading", "bots", "klines", "cpu", "memory"}
+    json.dumps(status, default=str)
+
+
+def test_status_handler(headless):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), headless.StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        with headless.Headless.lock:
+            headless.Headless.snapshot = {"trading": "OFF", "markets": {}}
+        with urllib.request.urlopen(url + "/status", timeout=5) as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"] == "application/json"
+            assert json.loads(response.read()) == {"trading": "OFF", "markets": {}}
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/orders", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("requests")
+pytest.importorskip("websocket")
+
+from common import history  # noqa: E402
+from common.history import HistoryRestorer  # noqa: E402
+
+
+class Market:
+    name = "Bybit"
+    user_id = 1
+    logNumFatal = ""
+
+
+def restorer():
+    restorer = HistoryRestorer.__new__(HistoryRestorer)
+    restorer.ws = Market()
+    restorer.table = "coins_checkpoint"
+    restorer.origin = HistoryRestorer.DEFAULT_TIME
+    return restorer
+
+
+def test_windows_cover_period():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=30)
+    windows = restorer().windows(start=start, end=end)
+    assert len(windows) == HistoryRestorer.WORKERS["Bybit"] * 4
+    assert windows[0][0] == start
+    assert windows[-1][1] == end
+    for (_, first_end), (second_start, _) in zip(windows, windows[1:]):
+        assert first_end == second_start
+
+
+def test_short_period_has_one_day_windows():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    windows = restorer().windows(start=start, end=start + timedelta(hours=30))
+    assert windows == [
+        (start, start + timedelta(days=1)),
+        (start + timedelta(days=1), start + timedelta(hours=30)),
+    ]
+
+
+def test_fetch_pages_until_short_page(monkeypatch):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    calls = list()
+
+    def trading_history(ws, histCount, start_time, end_time):
+        calls.append(start_time)
+        number = histCount if len(calls) < 3 else 7
+        data = [
+            {"execID": str(len(calls)) + "_" + str(x), "transactTime": start_time}
+            for x in range(number)
+        ]
+        data[-1]["transactTime"] = start_time + timedelta(hours=1)
+        return {"data": data, "length": number}
+
+    monkeypatch.setattr(history.WS, "trading_history", trading_history)
+    rows = restorer().fetch(start, start + timedelta(days=1))
+    assert len(rows) == HistoryRestorer.PAGE * 2 + 7
+    assert calls == [start + timedelta(hours=x) for x in range(3)]
+
+
+def test_fetch_returns_error_type(monkeypatch):
+    monkeypatch.setattr(history.WS, "trading_history", lambda *a, **k: "RETRY")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert restorer().fetch(start, start + timedelta(days=1)) == "RETRY"
+
+
+def test_run_limits_windows_in_flight(monkeypatch):
+    workers = HistoryRestorer.WORKERS["Bybit"]
+    submitted = list()
+    processed = list()
+    ahead = list()
+    item = restorer()
+
+    def fetch(window_start, window_end):
+        submitted.append(window_start)
+        return [{"execID": str(window_start), "transactTime": window_start}]
+
+    def process(rows):
+        processed.append(rows[0]["transactTime"])
+        ahead.append(len(submitted) - len(processed))
+
+    monkeypatch.setattr(item, "requested_time", lambda: "2024-01-01 00:00:00")
+    monkeypatch.setattr(item, "checkpoint", lambda: None)
+    monkeypatch.setattr(item, "fetch", fetch)
+    monkeypatch.setattr(item, "process", process)
+    monkeypatch.setattr(item, "save_checkpoint", lambda tm: None)
+    monkeypatch.setattr(history.service, "preload_executions", lambda **k: None)
+    assert item.run() == "success"
+    assert len(processed) == workers * HistoryRestorer.WINDOWS_PER_WORKER
+    assert processed == sorted(submitted)
+    assert max(ahead) < workers
+
+
+def test_parse():
+    assert HistoryRestorer.parse("2024-01-02 03:04:05.123") == datetime(
+        2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc
+    )
+    with pytest.raises(ValueError):
+        HistoryRestorer.parse("yesterday")
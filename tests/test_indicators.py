@@ -0,0 +1,110 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common.data import KlineSeries
+from indicators import Indicator, IndicatorStream
+
+CASES = [
+    ("sma", {"period": 3}),
+    ("sma", {"period": 20, "source": "mid"}),
+    ("ema", {"period": 10}),
+    ("rsi", {"period": 14}),
+]
+
+
+def make_rows(number: int, seed: int = 1) -> list:
+    """
+    Lines as in the backtest data files: date, time and prices, no
+    datetime.
+    """
+    generator = random.Random(seed)
+    tm = datetime(2024, 1, 30, 22, 0, tzinfo=timezone.utc)
+    price = 100.0
+    rows = list()
+    for _ in range(number):
+        price += generator.uniform(-1, 1)
+        rows.append(
+            {
+                "date": (tm.year - 2000) * 10000 + tm.month * 100 + tm.day,
+                "time": tm.hour * 100 + tm.minute,
+                "open_bid": price,
+                "open_ask": price + 0.5,
+                "hi": price + generator.uniform(0, 1),
+                "lo": price - generator.uniform(0, 1),
+                "funding": 0,
+            }
+        )
+        tm += timedelta(minutes=1)
+
+    return rows
+
+
+def recompute(name: str, parameters: dict, rows: list):
+    indicator = IndicatorStream.NAMES[name](**parameters)
+    value = None
+    for row in rows:
+        value = indicator.update(row)
+
+    return value
+
+
+def check(value, expected) -> None:
+    if expected is None:
+        assert value is None
+    else:
+        assert value == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("name, parameters", CASES)
+def test_backtest_rows_match_full_recomputation(name, parameters):
+    rows = make_rows(120)
+    series = KlineSeries.from_rows(rows)
+    stream = IndicatorStream(name=name, parameters=parameters, capacity=1000)
+    # The second run goes back in time and starts anew, as a new backtest.
+    for _ in range(2):
+        for closed in range(1, len(rows)):
+            stream.update(series, closed=closed)
+            check(stream.value(), recompute(name, parameters, rows[:closed]))
+
+
+@pytest.mark.parametrize("name, parameters", CASES)
+def test_live_series_matches_full_recomputation(name, parameters):
+    rows = make_rows(200, seed=2)
+    # The ring buffer is smaller than the history, the stream keeps its
+    # state while the oldest lines are overwritten.
+    series = KlineSeries(capacity=50)
+    stream = IndicatorStream(name=name, parameters=parameters, capacity=1000)
+    for num, row in enumerate(rows):
+        line = dict(row)
+        line["datetime"] = KlineSeries.timestamp_of(row["date"], row["time"])
+        series.append(line)
+        # The latest line is not closed yet.
+        stream.update(series, closed=len(series) - 1)
+        check(stream.value(), recompute(name, parameters, rows[:num]))
+
+
+def test_sma_moves_on_backtest_rows():
+    rows = make_rows(10)
+    for num, row in enumerate(rows):
+        row["open_bid"] = float(num + 1)
+    series = KlineSeries.from_rows(rows)
+    stream = IndicatorStream(name="sma", parameters={"period": 3}, capacity=100)
+    values = list()
+    for closed in range(3, 10):
+        stream.update(series, closed=closed)
+        values.append(stream.value())
+    assert values == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+
+
+def test_from_rows_calculates_datetime():
+    series = KlineSeries.from_rows([{"date": 240131, "time": 2359, "hi": 1}])
+    assert series[0]["datetime"] == datetime(2024, 1, 31, 23, 59, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        KlineSeries.from_rows([{"hi": 1}])
+
+
+def test_indicator_is_abstract():
+    with pytest.raises(TypeError):
+        Indicator()
@@ -0,0 +1,60 @@
+from array import array
+
+import pytest
+
+from common.data import KlineColumn, KlineSeries
+
+
+def series_of(values, capacity=None):
+    series = KlineSeries(capacity=capacity or len(values))
+    for num, value in enumerate(values):
+        series.append({"date": 240101, "time": num, "hi": value, "funding": None})
+    return series
+
+
+def test_convert_rejects_bad_values():
+    assert KlineSeries.convert("hi", "1.5") == 1.5
+    assert KlineSeries.convert("funding", None) == 0
+    with pytest.raises(ValueError, match="hi"):
+        KlineSeries.convert("hi", "abc")
+    with pytest.raises(ValueError, match="date"):
+        KlineSeries.convert("date", "")
+    with pytest.raises(ValueError):
+        series_of([1.0]).append({"date": 240101, "lo": object()})
+
+
+def test_slices_are_arrays_for_mapped_columns():
+    columns = {
+        "date": memoryview(array("q", [1, 2, 3]).tobytes()).cast("q"),
+        "hi": memoryview(array("d", [1, 2, 3]).tobytes()).cast("d"),
+    }
+    series = KlineSeries.from_columns(columns, copy=False)
+    assert series.hi[1:] == array("d", [2, 3])
+    assert series.hi[:0] == array("d")
+    assert isinstance(series.date[::2], array)
+
+
+def test_limited_column_shows_first_lines():
+    series = series_of([10.0, 11.0, 12.0, 13.0, 14.0])
+    line = [3]
+    column = KlineColumn(series, "hi", limit=lambda: line[0])
+    assert len(column) == 3
+    assert column[-1] == 12.0
+    assert column[0] == 10.0
+    assert column[-2:] == array("d", [11.0, 12.0])
+    assert column[::-1] == array("d", [12.0, 11.0, 10.0])
+    assert list(column) == [10.0, 11.0, 12.0]
+    with pytest.raises(IndexError):
+        column[3]
+    with pytest.raises(IndexError):
+        column[-4]
+    line[0] = 5
+    assert column[-1] == 14.0
+    assert column[:] == series.hi[:]
+
+
+def test_limited_column_of_ring_buffer():
+    series = series_of([1.0, 2.0, 3.0], capacity=3)
+    series.append({"date": 240101, "time": 9, "hi": 4.0})
+    column = KlineColumn(series, "hi", limit=lambda: 2)
+    assert column[:] == array("d", [2.0, 3.0])
@@ -0,0 +1,112 @@
+import copy
+import pickle
+from collections import OrderedDict
+
+import pytest
+
+from common.orders import BotOrders, Order, OrderRegistry
+
+SYMBOL = ("BTCUSD", "Bitmex")
+
+
+def order(side="Buy", price=100.0, orderID="id1", qty=1):
+    return {
+        "symbol": SYMBOL,
+        "side": side,
+        "price": price,
+        "orderID": orderID,
+        "leavesQty": qty,
+        "market": "Bitmex",
+    }
+
+
+@pytest.fixture
+def registry():
+    registry = OrderRegistry()
+    registry["bot"] = OrderedDict(
+        [
+            ("b1", order(orderID="id1")),
+            ("s1", order(side="Sell", price=110.0, orderID="id2")),
+            ("b2", order(price=100.0, orderID="id3", qty=2)),
+        ]
+    )
+    return registry
+
+
+def test_set_converts_and_indexes(registry):
+    orders = registry["bot"]
+    assert isinstance(orders, BotOrders)
+    assert isinstance(orders["b1"], Order)
+    assert registry.find_clOrdID("s1") == "bot"
+    assert registry.find_orderID("id3") is orders["b2"]
+    assert registry.level_qty(SYMBOL, 100.0) == 3
+    assert [x.clOrdID for x in orders.select(SYMBOL, "Buy")] == ["b1", "b2"]
+
+
+def test_price_change_moves_level(registry):
+    orders = registry["bot"]
+    version = registry.version
+    orders["b2"]["price"] = 99.0
+    assert registry.version > version
+    assert registry.level_qty(SYMBOL, 100.0) == 1
+    assert registry.level_qty(SYMBOL, 99.0) == 2
+    orders["b2"]["side"] = "Sell"
+    assert [x.clOrdID for x in orders.select(SYMBOL, "Sell")] == ["s1", "b2"]
+    assert [x.clOrdID for x in orders.select(SYMBOL, "Buy")] == ["b1"]
+
+
+def test_move_to_end_keeps_side_order(registry):
+    orders = registry["bot"]
+    orders.move_to_end("b1")
+    assert list(orders) == ["s1", "b2", "b1"]
+    assert [x.clOrdID for x in orders.select(SYMBOL, "Buy")] == ["b2", "b1"]
+    orders.move_to_end("b1", last=False)
+    assert [x.clOrdID for x in orders.select(SYMBOL, "Buy")] == ["b1", "b2"]
+
+
+def test_delete_removes_indexes(registry):
+    orders = registry["bot"]
+    removed = orders.pop("b1")
+    assert removed.owner is None
+    assert registry.find_orderID("id1") is None
+    assert registry.find_clOrdID("b1") is None
+    assert registry.level_qty(SYMBOL, 100.0) == 2
+    del registry["bot"]
+    assert registry.prices == {}
+    assert registry.orderIDs == {}
+    assert registry.clOrdIDs == {}
+
+
+def test_update_setdefault_pop_reindex(registry):
+    orders = registry["bot"]
+    orders["b1"].update(price=101.0, orderID="new")
+    assert registry.level_qty(SYMBOL, 101.0) == 1
+    assert registry.find_orderID("new") is orders["b1"]
+    assert registry.find_orderID("id1") is None
+    orders["b1"] |= {"price": 102.0}
+    assert registry.level_qty(SYMBOL, 102.0) == 1
+    assert orders["b1"].setdefault("price", 1) == 102.0
+    assert orders["b1"].setdefault("text", "x") == "x"
+    orders["s1"].pop("orderID")
+    assert registry.find_orderID("id2") is None
+    del orders["b2"]["price"]
+    assert registry.level_qty(SYMBOL, 100.0) == 0
+
+
+def test_deepcopy_and_pickle(registry):
+    orders = registry["bot"]
+    for clone in (copy.deepcopy(orders), pickle.loads(pickle.dumps(orders))):
+        assert isinstance(clone, BotOrders)
+        assert clone.emi == "bot"
+        assert list(clone) == list(orders)
+        assert clone["b1"] == orders["b1"]
+        assert clone["b1"] is not orders["b1"]
+        clone["b1"]["price"] = 50.0
+        assert clone.registry.level_qty(SYMBOL, 50.0) == 1
+        assert orders["b1"]["price"] == 100.0
+        assert registry.find_orderID("id1") is orders["b1"]
+    clone = pickle.loads(pickle.dumps(registry))
+    assert isinstance(clone, OrderRegistry)
+    assert clone.level_qty(SYMBOL, 100.0) == 3
+    assert copy.deepcopy(orders["s1"]).owner is None
+    assert copy.copy(registry).find_clOrdID("s1") == "bot"
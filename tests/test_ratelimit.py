@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from api.ratelimit import RateLimiter, RateLimitExceeded, TokenBucket
+
+
+def test_burst_then_refill():
+    bucket = TokenBucket(burst=3, rate=20)
+    for _ in range(3):
+        assert bucket.try_acquire("normal")
+    assert not bucket.try_acquire("normal")
+    time.sleep(0.06)
+    assert bucket.try_acquire("normal")
+    waited = bucket.acquire("normal")
+    assert 0.02 < waited < 0.2
+    metrics = bucket.metrics()
+    assert metrics["requests"] == 5
+    assert metrics["rejected"] == 1
+    assert metrics["throttled"] == 1
+
+
+def test_reserve_is_kept_for_critical_requests():
+    bucket = TokenBucket(burst=4, rate=0.001, reserve=2)
+    assert bucket.try_acquire("normal")
+    assert bucket.try_acquire("bulk")
+    assert not bucket.try_acquire("normal")
+    assert bucket.try_acquire("critical")
+    assert bucket.try_acquire("critical")
+    assert not bucket.try_acquire("critical")
+
+
+def test_configure_restores_reserve():
+    bucket = TokenBucket(burst=10, rate=1, reserve=3)
+    bucket.configure(burst=2, rate=1)
+    assert bucket.reserve == 1
+    bucket.configure(burst=20, rate=1)
+    assert bucket.reserve == 3
+    assert bucket.tokens <= 2
+
+
+def test_waiting_requests_go_by_priority():
+    bucket = TokenBucket(burst=1, rate=20)
+    assert bucket.try_acquire("critical")
+    order = list()
+    threads = list()
+    for priority in ("bulk", "normal", "critical"):
+        thread = threading.Thread(
+            target=lambda p=priority: order.append(bucket.acquire(p) and p)
+        )
+        threads.append(thread)
+        thread.start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["critical", "normal", "bulk"]
+
+
+def test_try_acquire_does_not_overtake_waiting_requests():
+    bucket = TokenBucket(burst=1, rate=10)
+    assert bucket.try_acquire("critical")
+    thread = threading.Thread(target=bucket.acquire, args=("critical",))
+    thread.start()
+    time.sleep(0.02)
+    assert not bucket.try_acquire("critical")
+    thread.join(timeout=5)
+    assert bucket.metrics()["requests"] == 2
+
+
+def test_limiter_buckets_and_metrics():
+    market = "TestMarket"
+    RateLimiter.LIMITS[market] = {"order": (2, 0.001, 0)}
+    try:
+        assert RateLimiter.try_acquire(market, "order", "user")
+        assert RateLimiter.try_acquire(market, "order", "user")
+        assert not RateLimiter.try_acquire(market, "order", "user")
+        assert RateLimiter.try_acquire(market, "order", "other")
+        assert RateLimiter.bucket(market, "public", "user") is RateLimiter.bucket(
+            market, "public", "other"
+        )
+        metrics = RateLimiter.metrics(market)
+        assert metrics["order.user"]["rejected"] == 1
+        assert metrics["order.other"]["requests"] == 1
+    finally:
+        del RateLimiter.LIMITS[market]
+        for key in list(RateLimiter.buckets):
+            if key[0] == market:
+                del RateLimiter.buckets[key]
+
+
+def test_admit_does_not_wait_for_orders():
+    market = "TestMarket"
+    RateLimiter.LIMITS[market] = {"order": (1, 0.001, 0), "private": (1, 20, 0)}
+    try:
+        RateLimiter.admit(market, "order", "user", "critical")
+        start = time.time()
+        with pytest.raises(RateLimitExceeded):
+            RateLimiter.admit(market, "order", "user", "critical")
+        assert time.time() - start < 0.05
+        RateLimiter.admit(market, "private", "user")
+        RateLimiter.admit(market, "private", "user")
+        metrics = RateLimiter.metrics(market)
+        assert metrics["order.user"]["rejected"] == 1
+        assert metrics["private.user"]["throttled"] == 1
+    finally:
+        del RateLimiter.LIMITS[market]
+        for key in list(RateLimiter.buckets):
+            if key[0] == market:
+                del RateLimiter.buckets[key]
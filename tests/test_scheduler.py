@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from common.scheduler import KlineScheduler
+
+
+@pytest.fixture(autouse=True)
+def scheduler():
+    KlineScheduler.heap = list()
+    KlineScheduler.deadlines = dict()
+    KlineScheduler.active = True
+    KlineScheduler.jitter_stats = {"count": 0, "last": 0, "max": 0, "total": 0}
+    yield
+    KlineScheduler.active = True
+
+
+def test_due_keys_in_deadline_order():
+    now = time.time()
+    KlineScheduler.schedule(("Bybit", "BTC", "5min"), now - 1)
+    KlineScheduler.schedule(("Bybit", "BTC", "1min"), now - 2)
+    KlineScheduler.schedule(("Bybit", "ETH", "1min"), now + 60)
+    assert KlineScheduler.wait() == [("Bybit", "BTC", "1min"), ("Bybit", "BTC", "5min")]
+    assert list(KlineScheduler.deadlines) == [("Bybit", "ETH", "1min")]
+    assert KlineScheduler.jitter()["count"] == 1
+
+
+def test_replaced_and_cancelled_deadlines_are_skipped():
+    now = time.time()
+    KlineScheduler.schedule(("Bitmex", "XBT", "1min"), now + 60)
+    KlineScheduler.schedule(("Bitmex", "XBT", "1min"), now - 1)
+    KlineScheduler.schedule(("Bitmex", "ETH", "1min"), now - 1)
+    KlineScheduler.cancel(("Bitmex", "ETH", "1min"))
+    assert KlineScheduler.wait() == [("Bitmex", "XBT", "1min")]
+
+
+def test_wait_sleeps_until_deadline():
+    start = time.time()
+    KlineScheduler.schedule(("Deribit", "BTC", "1min"), start + 0.1)
+    assert KlineScheduler.wait() == [("Deribit", "BTC", "1min")]
+    assert time.time() - start >= 0.09
+    stats = KlineScheduler.jitter()
+    assert 0 <= stats["last"] < 0.5
+    assert stats["average"] == stats["last"]
+
+
+def test_earlier_deadline_wakes_waiting_thread():
+    result = list()
+    thread = threading.Thread(target=lambda: result.append(KlineScheduler.wait()))
+    KlineScheduler.schedule(("Bybit", "BTC", "1h"), time.time() + 3600)
+    thread.start()
+    time.sleep(0.05)
+    KlineScheduler.schedule(("Bybit", "BTC", "1min"), time.time() + 0.05)
+    thread.join(timeout=5)
+    assert result == [[("Bybit", "BTC", "1min")]]
+
+
+def test_stop_releases_waiting_thread():
+    result = list()
+    thread = threading.Thread(target=lambda: result.append(KlineScheduler.wait()))
+    thread.start()
+    time.sleep(0.05)
+    KlineScheduler.stop()
+    thread.join(timeout=5)
+    assert result == [[]]
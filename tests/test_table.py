@@ -0,0 +1,35 @@
+import time
+
+from common.data import Table
+
+
+def test_usage_does_not_change_table():
+    table = Table(ttl=0.05)
+    table["a"] = {"price": 1.0}
+    table["b"] = {"price": 2.0}
+    time.sleep(0.1)
+    usage = Table.usage(table)
+    assert list(table) == ["a", "b"]
+    assert usage["rows"] == 2
+    assert usage["expired"] == 2
+    assert usage["evicted"] == 0
+    table["c"] = {"price": 3.0}
+    assert list(table) == ["c"]
+    assert Table.usage(table)["evicted"] == 2
+
+
+def test_usage_of_plain_dictionary():
+    usage = Table.usage({"a": {"price": 1.0}})
+    assert usage["rows"] == 1
+    assert usage["bytes"] > 0
+    assert "expired" not in usage
+
+
+def test_capacity_and_terminal_rows():
+    table = Table(capacity=2, terminal=lambda row: row.get("leavesQty") == 0)
+    for key in "abc":
+        table[key] = {"leavesQty": 1}
+    assert list(table) == ["b", "c"]
+    table["b"] = {"leavesQty": 0}
+    assert list(table) == ["c"]
+    assert table.evicted == 2
@@ -0,0 +1,78 @@
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from api.transport import LocalExchange, Transport  # noqa: E402
+
+
+@pytest.fixture
+def exchange():
+    server = LocalExchange(
+        routes={"/user": {"id": 1}, "/order": lambda verb, path, body: {"ok": verb}}
+    ).start()
+    yield server
+    server.stop()
+
+
+def test_requests_reuse_pooled_connections(exchange):
+    session = Transport.session("TestPool")
+    for _ in range(10):
+        assert session.get(exchange.url + "/user").json() == {"id": 1}
+    assert session.post(exchange.url + "/order", data="{}").json() == {"ok": "POST"}
+    metrics = Transport.metrics("TestPool")
+    assert metrics["/user"]["count"] == 10
+    assert metrics["/user"]["reused"] >= 0.9
+    assert metrics["/order"]["count"] == 1
+
+
+def test_one_dns_lookup_per_new_connection(exchange, monkeypatch):
+    lookups = list()
+    getaddrinfo = socket.getaddrinfo
+
+    def counting(host, *args, **kwargs):
+        if host == "localhost":
+            lookups.append(host)
+        return getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting)
+    session = Transport.session("TestDns")
+    url = exchange.url.replace("127.0.0.1", "localhost")
+    for _ in range(3):
+        session.get(url + "/user")
+    metrics = Transport.metrics("TestDns")["/user"]
+    new_connections = round((1 - metrics["reused"]) * metrics["count"])
+    assert new_connections == 1
+    assert len(lookups) == new_connections
+
+
+def test_time_includes_the_body():
+    """
+    The server sends the headers at once and the body 0.2 s later.
+    """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve():
+        connection, _ = listener.accept()
+        connection.recv(65536)
+        connection.sendall(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            b"Content-Length: 2\r\n\r\n"
+        )
+        time.sleep(0.2)
+        connection.sendall(b"{}")
+        connection.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    session = Transport.session("TestBody")
+    url = "http://127.0.0.1:%d/slow" % listener.getsockname()[1]
+    assert session.get(url).json() == {}
+    thread.join()
+    listener.close()
+    assert Transport.metrics("TestBody")["/slow"]["total"] >= 200
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from common.variables import Variables as var
+from common.writer import DatabaseWriter
+
+QUERY = "insert into trades (EXECID, QTY) values (?, ?)"
+
+
+class Connection:
+    """
+    Passes the calls to the SQLite connection, the first ``locked`` calls
+    of executemany() fail as if another process held the database.
+    """
+
+    def __init__(self, connection, locked=0):
+        self.connection = connection
+        self.locked = locked
+
+    def executemany(self, query, rows):
+        if self.locked:
+            self.locked -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.connection.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.execute("create table trades (EXECID text primary key, QTY real)")
+    monkeypatch.setattr(var, "connect_sqlite", connection)
+    yield connection
+    DatabaseWriter.flush()
+    connection.close()
+
+
+def rows(connection):
+    return connection.execute("select EXECID, QTY from trades order by 1").fetchall()
+
+
+def lock_is_free():
+    if var.sql_lock.acquire(blocking=False):
+        var.sql_lock.release()
+        return True
+    return False
+
+
+def test_rows_are_committed_on_flush(database):
+    futures = [
+        DatabaseWriter.put(QUERY, ["e" + str(num), num], key=("e" + str(num), 1))
+        for num in range(10)
+    ]
+    assert DatabaseWriter.is_pending(("e0", 1)) or futures[0].done()
+    DatabaseWriter.flush()
+    assert [future.result() for future in futures] == [None] * 10
+    assert len(rows(database)) == 10
+    assert not DatabaseWriter.is_pending(("e0", 1))
+    assert lock_is_free()
+
+
+def test_failed_row_does_not_lose_the_batch(database):
+    database.execute("insert into trades values ('dup', 1)")
+    database.commit()
+    good = DatabaseWriter.put(QUERY, ["new", 2])
+    bad = DatabaseWriter.put(QUERY, ["dup", 3])
+    DatabaseWriter.flush()
+    assert good.result() is None
+    assert "UNIQUE" in bad.result()
+    assert rows(database) == [("dup", 1.0), ("new", 2.0)]
+    assert lock_is_free()
+
+
+def test_locked_database_is_retried(database, monkeypatch):
+    monkeypatch.setattr(var, "connect_sqlite", Connection(database, locked=2))
+    future = DatabaseWriter.put(QUERY, ["retry", 1])
+    DatabaseWriter.flush()
+    assert future.result() is None
+    assert rows(database) == [("retry", 1.0)]
+    assert lock_is_free()
+
+
+def test_locked_database_gives_up_after_attempts(database, monkeypatch):
+    connection = Connection(database, locked=100)
+    monkeypatch.setattr(var, "connect_sqlite", connection)
+    monkeypatch.setattr(DatabaseWriter, "LOCKED_ATTEMPTS", 3)
+    monkeypatch.setattr(DatabaseWriter, "FLUSH_INTERVAL", 0.01)
+    future = DatabaseWriter.put(QUERY, ["locked", 1])
+    DatabaseWriter.flush()
+    assert "database is locked" in future.result()
+    assert connection.locked == 97
+    assert rows(database) == []
+    assert lock_is_free()
+
+
+def test_lock_is_released_once_when_rollback_fails(database, monkeypatch):
+    class Broken(Connection):
+        def executemany(self, query, rows):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        def rollback(self):
+            raise sqlite3.OperationalError("cannot rollback")
+
+    monkeypatch.setattr(var, "connect_sqlite", Broken(database))
+    future = DatabaseWriter.put(QUERY, ["lost", 1])
+    DatabaseWriter.flush()
+    assert "cannot rollback" in future.result()
+    assert lock_is_free()
+    monkeypatch.setattr(var, "connect_sqlite", database)
+    assert DatabaseWriter.put(QUERY, ["next", 1]).result(timeout=5) is None
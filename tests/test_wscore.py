@@ -0,0 +1,491 @@
+import asyncio
+import base64
+import hashlib
+import struct
+import threading
+import time
+
+import pytest
+
+from api.wscore import (
+    GUID,
+    OP_BINARY,
+    OP_CLOSE,
+    OP_CONT,
+    OP_PING,
+    OP_PONG,
+    OP_TEXT,
+    AsyncWebSocket,
+    WebSocketBadStatusException,
+    WebSocketTimeoutException,
+    WsCore,
+    _frame,
+)
+
+
+async def receive(reader: asyncio.StreamReader) -> tuple:
+    """
+    Reads a client frame, which is always masked.
+    """
+    head = await reader.readexactly(2)
+    assert head[1] & 0x80, "client frames must be masked"
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4)
+    payload = await reader.readexactly(length)
+    payload = bytes(byte ^ mask[num % 4] for num, byte in enumerate(payload))
+
+    return head[0] & 0x0F, payload
+
+
+def send(writer: asyncio.StreamWriter, opcode: int, payload: bytes, fin=True):
+    """
+    Writes an unmasked server frame.
+    """
+    first = (0x80 if fin else 0) | opcode
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", first, length)
+    elif length < 65536:
+        head = struct.pack("!BBH", first, 126, length)
+    else:
+        head = struct.pack("!BBQ", first, 127, length)
+    writer.write(head + payload)
+
+
+class Server:
+    """
+    A websocket server on its own loop. After the handshake the connection
+    is passed to ``script(reader, writer)``.
+    """
+
+    def __init__(self, script, status=101, accept=True) -> None:
+        self.script = script
+        self.status = status
+        self.accept = accept
+        self.requests = list()
+        self.tasks = set()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return "ws://127.0.0.1:%d/realtime?subscribe=margin" % self.port
+
+    async def handle(self, reader, writer) -> None:
+        self.tasks.add(asyncio.current_task())
+        try:
+            await self.respond(reader, writer)
+        finally:
+            self.tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def respond(self, reader, writer) -> None:
+        request = (await reader.readuntil(b"\r\n\r\n")).decode()
+        self.requests.append(request)
+        if self.status != 101:
+            writer.write(b"HTTP/1.1 %d Forbidden\r\nContent-Length: 0\r\n\r\n" % 403)
+            writer.close()
+            return
+        key = ""
+        for line in request.split("\r\n"):
+            if line.lower().startswith("sec-websocket-key:"):
+                key = line.split(":", 1)[1].strip()
+        accept = hashlib.sha1((key + GUID).encode()).digest()
+        accept = base64.b64encode(accept).decode() if self.accept else "wrong"
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                "Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n" % accept
+            ).encode()
+        )
+        try:
+            await self.script(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def shutdown(self) -> None:
+        """
+        Closes the server and cancels the connections still being handled.
+        """
+        self.server.close()
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+
+class Client:
+    """
+    Records the calls of the handlers of a connection.
+    """
+
+    def __init__(self) -> None:
+        self.messages = list()
+        self.errors = list()
+        self.events = list()
+
+    def connect(self, url: str, **kwargs) -> AsyncWebSocket:
+        kwargs.setdefault(
+            "on_message", lambda ws, message: self.messages.append(message)
+        )
+
+        return WsCore.connect(
+            url,
+            on_open=lambda ws: self.events.append("open"),
+            on_error=lambda ws, error: self.errors.append(error),
+            on_close=lambda ws, *args: self.events.append("close"),
+            **kwargs,
+        )
+
+
+def wait_for(predicate, timeout=5.0) -> bool:
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+
+    return predicate()
+
+
+async def echo(reader, writer) -> None:
+    while True:
+        opcode, payload = await receive(reader)
+        if opcode == OP_CLOSE:
+            send(writer, OP_CLOSE, payload)
+            return
+        send(writer, opcode, payload)
+
+
+@pytest.fixture
+def servers():
+    started = list()
+
+    def start(script, **kwargs) -> Server:
+        server = Server(script, **kwargs)
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+@pytest.mark.parametrize("length", [0, 5, 125, 126, 65535, 65536])
+def test_frame_is_masked_and_sized(length):
+    payload = bytes(range(256)) * (length // 256 + 1)
+    payload = payload[:length]
+
+    async def parse():
+        reader = asyncio.StreamReader()
+        reader.feed_data(_frame(OP_BINARY, payload))
+        reader.feed_eof()
+        return await receive(reader)
+
+    assert asyncio.run(parse()) == (OP_BINARY, payload)
+
+
+def test_handshake_and_echo(servers):
+    server = servers(echo)
+    client = Client()
+    ws = client.connect(server.url, header={"api-key": "key"})
+    assert ws.wait_connected(5)
+    assert ws.sock.connected
+    ws.send("hello")
+    ws.send("x" * 70000)
+    ws.send(b"\x00\x01", opcode=OP_BINARY)
+    assert wait_for(lambda: len(client.messages) == 3)
+    assert client.messages == ["hello", "x" * 70000, b"\x00\x01"]
+    request = server.requests[0]
+    assert request.startswith("GET /realtime?subscribe=margin HTTP/1.1\r\n")
+    assert "api-key: key\r\n" in request
+    ws.close()
+    assert wait_for(lambda: client.events == ["open", "close"])
+    assert ws.sock is None
+    assert client.errors == []
+
+
+def test_fragments_and_control_frames(servers):
+    pongs = list()
+
+    async def script(reader, writer):
+        send(writer, OP_TEXT, b"frag", fin=False)
+        # A control frame may come between the fragments.
+        send(writer, OP_PING, b"abc")
+        send(writer, OP_CONT, b"men", fin=False)
+        send(writer, OP_CONT, b"ted")
+        opcode, payload = await receive(reader)
+        pongs.append((opcode, payload))
+        send(writer, OP_PONG, b"")
+        send(writer, OP_TEXT, "привет".encode())
+        await receive(reader)
+
+    server = servers(script)
+    client = Client()
+    ws = client.connect(server.url)
+    assert wait_for(lambda: len(client.messages) == 2)
+    assert client.messages == ["fragmented", "привет"]
+    assert pongs == [(OP_PONG, b"abc")]
+    ws.close()
+
+
+def test_close_from_server(servers):
+    replies = list()
+
+    async def script(reader, writer):
+        send(writer, OP_CLOSE, struct.pack("!H", 1001))
+        replies.append(await receive(reader))
+
+    server = servers(script)
+    client = Client()
+    ws = client.connect(server.url)
+    assert wait_for(lambda: "close" in client.events)
+    assert ws.close_code == 1001
+    assert client.errors == []
+    assert wait_for(lambda: replies)
+    assert replies[0][0] == OP_CLOSE
+
+
+def test_bad_status(servers):
+    server = servers(echo, status=403)
+    client = Client()
+    ws = client.connect(server.url)
+    assert not ws.wait_connected(5)
+    assert len(client.errors) == 1
+    assert isinstance(client.errors[0], WebSocketBadStatusException)
+    assert client.errors[0].status_code == 403
+    assert client.events == ["close"]
+
+
+def test_bad_accept(servers):
+    server = servers(echo, accept=False)
+    client = Client()
+    ws = client.connect(server.url)
+    assert not ws.wait_connected(5)
+    assert isinstance(client.errors[0], WebSocketBadStatusException)
+
+
+def test_heartbeat_sends_ping_payload_and_times_out(servers):
+    pings = list()
+
+    async def silent(reader, writer):
+        while True:
+            pings.append(await receive(reader))
+
+    server = servers(silent)
+    client = Client()
+    ws = client.connect(
+        server.url, ping_interval=1, ping_timeout=1, ping_payload="ping"
+    )
+    assert ws.wait_connected(5)
+    assert ws.alive()
+    assert wait_for(lambda: client.errors, timeout=6)
+    assert isinstance(client.errors[0], WebSocketTimeoutException)
+    assert not ws.alive()
+    assert (OP_TEXT, b"ping") in pings
+
+
+def test_heartbeat_control_ping_keeps_connection(servers):
+    async def answer(reader, writer):
+        while True:
+            opcode, payload = await receive(reader)
+            if opcode == OP_PING:
+                send(writer, OP_PONG, payload)
+
+    server = servers(answer)
+    client = Client()
+    ws = client.connect(server.url, ping_interval=1, ping_timeout=1)
+    assert ws.wait_connected(5)
+    time.sleep(3.5)
+    assert ws.alive()
+    assert client.errors == []
+    ws.close()
+
+
+def test_backpressure_keeps_order_and_bounds_queue(servers):
+    async def flood(reader, writer):
+        for num in range(40):
+            send(writer, OP_TEXT, str(num).encode())
+        await writer.drain()
+        await receive(reader)
+
+    def slow(ws, message):
+        time.sleep(0.01)
+        received.append(message)
+
+    received = list()
+    server = servers(flood)
+    ws = Client().connect(server.url, on_message=slow, queue_size=2)
+    assert wait_for(lambda: len(received) == 40)
+    assert received == [str(num) for num in range(40)]
+    assert ws.queue_max <= 2
+    assert ws.stalls > 0
+    assert ws.metrics()["received"] == 40
+    ws.close()
+
+
+def test_blocking_handler_does_not_stall_other_connection(servers):
+    """
+    A plain handler that blocks, e.g. on var.lock, holds back only its own
+    connection.
+    """
+
+    async def ticker(reader, writer):
+        for num in range(20):
+            send(writer, OP_TEXT, str(num).encode())
+            await asyncio.sleep(0.05)
+        await receive(reader)
+
+    release = threading.Event()
+    blocked = list()
+
+    def blocking(ws, message):
+        blocked.append(message)
+        release.wait(10)
+
+    first = Client().connect(servers(ticker).url, on_message=blocking)
+    second = Client()
+    ws = second.connect(servers(ticker).url, ping_interval=1, ping_timeout=1)
+    try:
+        assert wait_for(lambda: len(second.messages) == 20)
+        assert blocked == ["0"]
+        assert ws.alive()
+    finally:
+        release.set()
+    assert wait_for(lambda: len(blocked) == 20)
+    first.close()
+    ws.close()
+
+
+def test_handlers_share_bounded_pool(servers):
+    server = servers(echo)
+    clients = [Client() for _ in range(WsCore.WORKERS * 2)]
+    connections = [client.connect(server.url) for client in clients]
+    for num, ws in enumerate(connections):
+        assert ws.wait_connected(5)
+        ws.send(str(num))
+    assert wait_for(
+        lambda: all(client.messages == [str(num)] for num, client in enumerate(clients))
+    )
+    workers = [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith("wscore_worker")
+    ]
+    assert 0 < len(workers) <= WsCore.WORKERS
+    for ws in connections:
+        ws.close()
+    assert wait_for(
+        lambda: all(client.events == ["open", "close"] for client in clients)
+    )
+
+
+def test_intercept_takes_messages_out_of_the_queue(servers):
+    async def script(reader, writer):
+        for message in (b"a", b"response", b"b"):
+            send(writer, OP_TEXT, message)
+        await receive(reader)
+
+    release = threading.Event()
+    responses = list()
+
+    def blocking(ws, message):
+        release.wait(10)
+
+    def intercept(ws, message):
+        if message == "response":
+            responses.append(message)
+            return True
+        return False
+
+    server = servers(script)
+    ws = Client().connect(server.url, on_message=blocking, intercept=intercept)
+    try:
+        # The response is delivered while the handler is still blocked.
+        assert wait_for(lambda: responses == ["response"])
+    finally:
+        release.set()
+    assert wait_for(lambda: ws.received == 2)
+    assert ws.intercepted == 1
+    ws.close()
+
+
+def test_coroutine_handler_and_handler_errors(servers):
+    async def script(reader, writer):
+        for message in (b"1", b"fail", b"2"):
+            send(writer, OP_TEXT, message)
+        await receive(reader)
+
+    client = Client()
+
+    async def handler(ws, message):
+        if message == "fail":
+            raise ValueError(message)
+        client.messages.append(message)
+
+    server = servers(script)
+    ws = client.connect(server.url, on_message=handler)
+    assert wait_for(lambda: client.messages == ["1", "2"])
+    assert [str(error) for error in client.errors] == ["fail"]
+    # The error of the handler does not close the connection.
+    assert ws.connected
+    ws.close()
+
+
+def test_metrics_of_open_connections(servers):
+    server = servers(echo)
+    ws = Client().connect(server.url, name="Test")
+    assert ws.wait_connected(5)
+    metrics = WsCore.metrics("Test")
+    assert metrics["/realtime"]["connected"]
+    ws.close()
+    assert wait_for(lambda: ws.finished)
+    assert "/realtime" not in WsCore.metrics("Test")
+
+
+def test_pybit_transport_gets_ping_settings():
+    pytest.importorskip("websocket")
+    from api.bybit.pybit._websocket_stream import _WebSocketManager
+
+    calls = list()
+
+    class Connection:
+        sock = connected = True
+
+        def wait_connected(self, timeout):
+            calls[-1]["wait"] = timeout
+            return True
+
+    def transport(url, **kwargs):
+        calls.append(kwargs)
+        return Connection()
+
+    manager = _WebSocketManager(
+        lambda message: None,
+        "test",
+        testnet=True,
+        ping_interval=20,
+        ping_timeout=10,
+        transport=transport,
+    )
+    manager._connect("wss://{SUBDOMAIN}.{DOMAIN}.com/v5/public/linear")
+    assert calls[0]["ping_interval"] == 20
+    assert calls[0]["ping_timeout"] == 10
+    assert calls[0]["ping_payload"] == '{"op": "ping"}'
+    assert calls[0]["wait"] is not None
@@ -1,19 +1,27 @@
 import inspect
 import platform
+import time
 from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Callable, Union
 
+import botinit.init as botinit
 import functions
 import services as service
 from api.api import WS
 from api.setup import Markets
 from backtest import functions as backtest
-from common.data import BotData, Bots, Instrument, MetaInstrument
+from common.data import (
+    BotData,
+    Bots,
+    Instrument,
+    KlineColumn,
+    KlineSeries,
+    MetaInstrument,
+)
+from common.messages import ErrorMessage
 from common.variables import Variables as var
-from display.bot_menu import bot_manager
-from display.messages import ErrorMessage
-from display.variables import Variables as disp
+from indicators import IndicatorStream
 
 
 def name(stack) -> str:
@@ -48,7 +56,7 @@ class Bot(BotData):
             self._backtest_remove(clOrdID=clOrdID)
             return
 
-        if self.state == "Active" and disp.f9 == "ON":
+        if self.state == "Active" and var.f9 == "ON":
             ord = var.orders[self.name]
             lst = []
             if not clOrdID:
@@ -96,7 +104,7 @@ class Bot(BotData):
             self._backtest_replace(clOrdID=clOrdID, price=price)
             return clOrdID
 
-        if self.state == "Active" and disp.f9 == "ON":
+        if self.state == "Active" and var.f9 == "ON":
             ord = var.orders[self.name]
             if clOrdID in ord:
                 order = ord[clOrdID]
@@ -180,6 +188,117 @@ class Bot(BotData):
         var.orders[self.name][clOrdID]["price"] = price
 
 
+class Kline:
+    """
+    The callable object returned by add_kline(). Calling it returns lines
+    of kline data as dictionaries. The attributes named as the keys of
+    the line return whole columns as KlineColumn, e.g. ``kl.lo[-10:]``.
+    """
+
+    def __init__(self, tool: "Tool", timefr: str, bot_name: str) -> None:
+        self.tool = tool
+        self.timefr = timefr
+        self.bot_name = bot_name
+
+    def __call__(self, *args) -> dict:
+        return self.tool._kline(self.timefr, self.bot_name, *args)
+
+    def __getattr__(self, name: str):
+        if name not in KlineSeries.FIELDS:
+            raise AttributeError(name)
+        if not var.backtest:
+            ws = Markets[self.tool.market]
+            data = ws.klines[self.tool.symbol_tuple][self.timefr]["data"]
+
+            return getattr(data, name)
+        else:
+            # The same KlineColumn as in live trading, which shows the lines
+            # before the current one, whatever the backtest data is loaded
+            # by, so its slices are array.array in both modes.
+            bot = Bots[self.bot_name]
+            series, _ = self.closed()
+
+            return KlineColumn(series, name, limit=lambda: bot.iter)
+
+    def indicator(self, name: str, **parameters) -> "KlineIndicator":
+        """
+        Returns an indicator calculated on the closed periods of this kline
+        data. The indicator is shared by all bots using the same kline data
+        with the same parameters and each period is processed only once.
+
+        Parameters
+        ----------
+        name: str
+            "sma", "ema", "rsi", "atr", "bollinger", "session_average",
+            "max" or "min", see the classes in indicators.py.
+        parameters
+            Parameters of the indicator, e.g. period=20, source="hi".
+
+        Examples
+        --------
+        kl = Bybit["BTCUSDT"].add_kline()
+        sma = kl.indicator("sma", period=20)
+
+        sma()    the value for the latest closed period
+        sma(-2)  the value for the period before it
+        """
+        if not var.backtest:
+            key = (self.tool.symbol_tuple, self.timefr)
+        else:
+            key = (self.tool.symbol_tuple, self.timefr, self.bot_name)
+        stream = IndicatorStream.get(
+            key=key,
+            name=name,
+            parameters=parameters,
+            capacity=functions.kline_capacity(),
+        )
+
+        return KlineIndicator(kline=self, stream=stream)
+
+    def closed(self) -> tuple:
+        """
+        Returns the kline data and the number of its closed periods. In
+        backtest mode the periods up to the current iteration are closed.
+        """
+        if not var.backtest:
+            ws = Markets[self.tool.market]
+            series = ws.klines[self.tool.symbol_tuple][self.timefr]["data"]
+            closed = len(series)
+            if closed:
+                timefr_sec = var.timeframe_human_format[self.timefr] * 60
+                if series.timestamp(closed - 1) + timefr_sec > time.time():
+                    closed -= 1
+        else:
+            bot = Bots[self.bot_name]
+            series = bot.backtest_data[self.tool.symbol_tuple]
+            if not isinstance(series, KlineSeries):
+                # Lines loaded by load_backtest_data() are converted once.
+                rows = getattr(self, "rows", None)
+                if rows is None or rows[0] is not series:
+                    self.rows = (series, KlineSeries.from_rows(series))
+                series = self.rows[1]
+            closed = bot.iter
+
+        return series, closed
+
+
+class KlineIndicator:
+    """
+    The callable object returned by Kline.indicator(). Calling it brings
+    the indicator up to date and returns its value.
+    """
+
+    def __init__(self, kline: Kline, stream: IndicatorStream) -> None:
+        self.kline = kline
+        self.stream = stream
+
+    def __call__(self, index: int = -1):
+        series, closed = self.kline.closed()
+        self.stream.update(series, closed=closed)
+
+        return self.stream.value(index)
+
+
 class Tool(Instrument):
     def __init__(self, instrument: Instrument) -> None:
         self.__dict__ = instrument.__dict__
@@ -298,7 +417,7 @@ class Tool(Instrument):
                 bot=bot, qty=qty, side="Sell", price=price, move=move, cancel=cancel
             )
 
-        if bot.state == "Active" and disp.f9 == "ON":
+        if bot.state == "Active" and var.f9 == "ON":
             if not price:
                 try:
                     price = self.asks[0][0]
@@ -370,7 +489,7 @@ class Tool(Instrument):
                 ordType=ordType,
             )
 
-        if bot.state == "Active" and disp.f9 == "ON":
+        if bot.state == "Active" and var.f9 == "ON":
             if not price:
                 try:
                     price = self.bids[0][0]
@@ -446,11 +565,15 @@ class Tool(Instrument):
         kl(-1)
         Return type: dict
             Returns latest kline data.
+
+        kl.hi[-50:]
+        Return type: array
+            Returns the "hi" values of the last 50 lines.
         """
         bot_name = name(inspect.stack())
         bot = Bots[bot_name]
         if self.state not in ["Open", "open"]:
-            bot_path = bot_manager.get_bot_path(bot_name)
+            bot_path = botinit.get_bot_path(bot_name)
             message = ErrorMessage.BOT_KLINE_ERROR.format(
                 BOT_NAME=bot_name,
                 INSTRUMENT=self.symbol_tuple,
@@ -479,7 +602,7 @@ class Tool(Instrument):
             ws, symbol=self.symbol_tuple, bot_name=bot_name, timefr=timefr
         )
 
-        return lambda *args: self._kline(timefr, bot_name, *args)
+        return Kline(tool=self, timefr=timefr, bot_name=bot_name)
 
     def set_limit(self, bot: Bot, limit: float) -> None:
         """
@@ -710,7 +833,7 @@ class Tool(Instrument):
 
         Parameters
         ----------
-        orders: OrderedDict
+        orders: BotOrders
             Bot order dictionary, where the key is clOrdID
         side: str
             Buy or Sell
@@ -727,31 +850,13 @@ class Tool(Instrument):
             Orders are sorted by ``transactTime`` in the order specified in
             the descend parameter. The OrderedDict key is the clOrdID value.
         """
-        ord = orders.values()
-        if not in_list:
-            filtered = OrderedDict()
-            if descend:
-                ord = sorted(ord, key=lambda x: x["transactTime"], reverse=True)
-            for value in ord:
-                if value["symbol"] == self.symbol_tuple:
-                    if side:
-                        if value["side"] == side:
-                            filtered[value["clOrdID"]] = value
-                    else:
-                        filtered[value["clOrdID"]] = value
-        else:
-            filtered = list()
-            if descend:
-                ord = sorted(ord, key=lambda x: x["transactTime"], reverse=True)
-            for value in ord:
-                if value["symbol"] == self.symbol_tuple:
-                    if side:
-                        if value["side"] == side:
-                            filtered.append(value)
-                    else:
-                        filtered.append(value)
+        ord = orders.select(symbol=self.symbol_tuple, side=side)
+        if descend:
+            ord = sorted(ord, key=lambda x: x["transactTime"], reverse=True)
+        if in_list:
+            return ord
 
-        return filtered
+        return OrderedDict((value["clOrdID"], value) for value in ord)
 
     def _remove_orders(self, orders: OrderedDict, side: str) -> None:
         """
@@ -918,7 +1023,7 @@ class MetaTool(type):
                 if datetime.now(tz=timezone.utc) > expire:
                     bot_name = name(inspect.stack())
                     bot = Bots[bot_name]
-                    bot_path = bot_manager.get_bot_path(bot_name)
+                    bot_path = botinit.get_bot_path(bot_name)
                     message = ErrorMessage.BOT_INSTRUMENT_EXPIRED.format(
                         INSTRUMENT=symbol,
                         FILE=bot_path,